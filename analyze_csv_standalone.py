@@ -3,12 +3,12 @@ import os
 import sys # Importado para ler argumentos da linha de comando
 import glob # Novo import para encontrar arquivos por padrão
 
-# Importações para Machine Learning
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
 import numpy as np
 
+# O modelo de ML (e o cache de modelos treinados) fica no backend
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+from ml import ALVO_ML, FEATURES_ML, insights_arvore
+
 # Função para formatar valores monetários no padrão brasileiro (R$ 1.234,56)
 def format_currency_br(value):
     # Garante que o valor é um float e formata com 2 casas decimais.
@@ -131,44 +131,20 @@ def analyze_webprice_data(csv_filepath):
         # INÍCIO DA SEÇÃO DE MACHINE LEARNING
         # ====================================================================
 
-        ml_df = final_df.copy()
-
-        features = ['Preço', 'Preço_Concorrente', 'Valor_Ajuste', 'Percentual_Ajuste', 'Prioridade_Valor']
-        target = 'Tipo_Ajuste'
+        features = FEATURES_ML
+        target = ALVO_ML
 
-        ml_df = ml_df.dropna(subset=features + [target])
+        # As colunas vão direto de final_df para o bloco float32 do modelo; só
+        # quando há linha vazia o DataFrame é filtrado (e copiado)
+        validas = np.logical_and.reduce([final_df[c].notna().to_numpy() for c in features + [target]])
 
-        if ml_df.empty:
+        if not validas.any():
             ml_insights = {"message": "Dados insuficientes para treinar o modelo de ML após limpeza."}
         else:
-            for feature in features:
-                ml_df[feature] = pd.to_numeric(ml_df[feature], errors='coerce').fillna(0)
-            
-            le = LabelEncoder()
-            ml_df['target_encoded'] = le.fit_transform(ml_df[target])
+            ml_df = final_df if validas.all() else final_df[validas]
 
-            X = ml_df[features]
-            y = ml_df['target_encoded']
-
-            if len(y.unique()) < 2 or len(X) < 2:
-                ml_insights = {"message": "Apenas um tipo de ajuste ou dados insuficientes para treinar modelo de ML."}
-            else:
-                try:
-                    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
-                except ValueError as e:
-                    ml_insights = {"message": f"Não foi possível dividir os dados para ML: {e}. Pode ser que uma classe tenha poucas amostras."}
-                    X_train, y_train = X, y
-
-                if 'model' not in ml_insights:
-                    model = DecisionTreeClassifier(random_state=42)
-                    model.fit(X_train, y_train)
-
-                    ml_insights = {
-                        "status": "Modelo de ML treinado com sucesso!",
-                        "features_usadas": features,
-                        "classes_preditas": list(le.classes_),
-                        "importancia_das_features": dict(zip(features, model.feature_importances_.round(4)))
-                    }
+            # Arquivo repetido (mesmas features, rótulos e parâmetros) reaproveita a árvore do cache
+            ml_insights = insights_arvore([(ml_df[feature], 1) for feature in features], ml_df[target])
 
         # ====================================================================
         # FIM DA SEÇÃO DE MACHINE LEARNING
@@ -189,11 +165,51 @@ def analyze_webprice_data(csv_filepath):
     except Exception as e:
         return {"error": f"Erro interno ao processar o CSV: {str(e)}"}
 
+def prever_csv(csv_filepath, nome='arvore', versao='latest', saida=None):
+    """
+    Classifica as ofertas do CSV com um modelo do registro (o mesmo da API)
+    e grava as previsões em ``saida`` (padrão: <arquivo>_previsoes.csv),
+    bloco a bloco, sem carregar o arquivo inteiro.
+
+    Returns:
+        dict: modelo, versão, linhas classificadas e arquivo gerado, ou {'error'}.
+    """
+    # Usa o mesmo preparo da API (e o Flask só é importado neste modo)
+    from app import prever_export
+    from preview import detectar_encoding
+    from registry import carregar_modelo
+
+    carregado = carregar_modelo(nome, versao)
+    if carregado is None:
+        return {"error": f"Modelo {nome} versão {versao} não encontrado no registro."}
+    modelo, metadados = carregado
+    saida = saida or os.path.splitext(csv_filepath)[0] + '_previsoes.csv'
+
+    linhas = 0
+    with open(csv_filepath, 'rb') as arquivo, open(saida, 'w', encoding='utf-8-sig', newline='') as destino:
+        encoding = detectar_encoding(arquivo)
+        for previsoes in prever_export(arquivo, modelo, metadados, encoding=encoding):
+            if isinstance(previsoes, dict):
+                return previsoes
+            previsoes.to_csv(destino, sep=';', index=False, header=linhas == 0, decimal=',')
+            linhas += len(previsoes)
+    return {"modelo": nome, "versao": metadados['versao'], "linhas_classificadas": linhas, "arquivo": saida}
+
 # Código de execução principal quando o script é rodado diretamente
 if __name__ == "__main__":
     current_dir = os.path.dirname(os.path.abspath(__file__))
     csv_files_to_analyze = []
 
+    # Modo de predição: python analyze_csv_standalone.py --prever arquivo.csv [modelo] [versao]
+    if len(sys.argv) > 2 and sys.argv[1] == '--prever':
+        resultado = prever_csv(os.path.join(current_dir, sys.argv[2]), *sys.argv[3:5])
+        if "error" in resultado:
+            print(f"ERRO: {resultado['error']}")
+            sys.exit(1)
+        print(f"{resultado['linhas_classificadas']} ofertas classificadas com o modelo "
+              f"{resultado['modelo']} v{resultado['versao']}: {resultado['arquivo']}")
+        sys.exit(0)
+
     # Verifica se um nome de arquivo foi passado como argumento
     if len(sys.argv) > 1:
         # User specified a particular file
@@ -0,0 +1,104 @@
+"""Agregados pré-calculados por snapshot.
+
+O cubo guarda, para cada combinação Lojista x Marca x Cluster, apenas
+medidas aditivas (contagens e somas). Qualquer fatia ou rollup sobre as três
+dimensões sai do cubo com um groupby pequeno, sem voltar às linhas do CSV;
+médias são derivadas na consulta a partir de soma / contagem.
+"""
+import pandas as pd
+
+DIMENSOES_CUBO = ['Lojista', 'Marca', 'Cluster']
+MEDIDAS_CUBO = [
+    'ofertas', 'ganhando', 'empatando', 'perdendo', 'ofertas_com_gap', 'soma_gap', 'ganho_potencial',
+    'perdendo_com_gap', 'soma_gap_pct_perdendo',
+]
+MEDIDAS_MONETARIAS = ['soma_gap', 'ganho_potencial']
+MEDIDAS_PERCENTUAIS = ['soma_gap_pct_perdendo']
+
+
+def construir_cubo(df, sugestoes):
+    """Agrega o snapshot inteiro em um único groupby sobre as três dimensões."""
+    dimensoes = pd.DataFrame({
+        d: (df[d].astype(str) if d in df.columns else 'N/D') for d in DIMENSOES_CUBO
+    }, index=df.index).astype('category')
+
+    status = df['Status']
+    if 'Preço_Concorrente' in df.columns:
+        com_gap = df['Preço_Concorrente'] > 0
+        gap = (df['Preço'] - df['Preço_Concorrente']).where(com_gap, 0)
+        gap_pct = (gap / df['Preço_Concorrente'].where(com_gap) * 100).fillna(0)
+    else:
+        com_gap = pd.Series(False, index=df.index)
+        gap = df['Preço'] * 0
+        gap_pct = pd.Series(0.0, index=df.index)
+    perdendo_com_gap = (status == 'PERDENDO') & com_gap
+
+    medidas = pd.DataFrame({
+        'ofertas': 1,
+        'ganhando': (status == 'GANHANDO').astype('int64'),
+        'empatando': (status == 'EMPATANDO').astype('int64'),
+        'perdendo': (status == 'PERDENDO').astype('int64'),
+        'ofertas_com_gap': com_gap.astype('int64'),
+        'soma_gap': gap,
+        'ganho_potencial': sugestoes['Margem_Extra_RS'].reindex(df.index, fill_value=0).astype(gap.dtype),
+        'perdendo_com_gap': perdendo_com_gap.astype('int64'),
+        'soma_gap_pct_perdendo': gap_pct.where(perdendo_com_gap, 0.0).astype('float64'),
+    }, index=df.index)
+
+    cubo = pd.concat([dimensoes, medidas], axis=1).groupby(DIMENSOES_CUBO, observed=True, sort=True).sum()
+    return cubo[MEDIDAS_CUBO]
+
+
+def somar_cubos(cubo, outro):
+    """Soma dois cubos (as medidas são aditivas); células ausentes em um valem zero."""
+    return cubo.add(outro, fill_value=0).astype(outro.dtypes.to_dict())
+
+
+def consultar_cubo(cubo, dimensoes=('Lojista',), filtros=None):
+    """Fatia (``filtros`` = {dimensão: [valores]}) e agrega o cubo.
+
+    ``dimensoes`` define o nível do rollup; vazio devolve o total geral.
+    Retorna uma lista de dicts com as medidas em reais e o gap médio.
+    """
+    dimensoes = [d for d in dimensoes if d in DIMENSOES_CUBO]
+    fatia = cubo
+    for dimensao, valores in (filtros or {}).items():
+        if dimensao in DIMENSOES_CUBO and valores:
+            fatia = fatia[fatia.index.get_level_values(dimensao).isin(valores)]
+
+    if dimensoes:
+        agregado = fatia.groupby(level=dimensoes, observed=True, sort=True).sum().reset_index()
+    else:
+        agregado = fatia.sum().to_frame().T
+
+    escala = 100 if pd.api.types.is_integer_dtype(cubo['soma_gap']) else 1
+    com_gap = agregado['ofertas_com_gap']
+    agregado['gap_medio'] = (agregado['soma_gap'] / com_gap.where(com_gap > 0) / escala).round(2).fillna(0)
+    perdendo_com_gap = agregado['perdendo_com_gap']
+    agregado['gap_percentual_medio_perdendo'] = (
+        agregado['soma_gap_pct_perdendo'] / perdendo_com_gap.where(perdendo_com_gap > 0)
+    ).round(2).fillna(0)
+    for medida in MEDIDAS_MONETARIAS:
+        agregado[medida] = (agregado[medida] / escala).round(2)
+    for medida in MEDIDAS_PERCENTUAIS:
+        agregado[medida] = agregado[medida].round(4)
+
+    for medida in MEDIDAS_CUBO:
+        if medida not in MEDIDAS_MONETARIAS + MEDIDAS_PERCENTUAIS:
+            agregado[medida] = agregado[medida].astype('int64')
+    return agregado.to_dict(orient='records')
+
+
+def atualizar_cubo(cubo, antes, sugestoes_antes, depois, sugestoes_depois):
+    """Aplica no cubo (in-place) a diferença entre dois estados das mesmas linhas.
+
+    ``antes``/``depois`` são só as linhas alteradas; as dimensões não mudam,
+    então todas as células afetadas já existem no cubo e o custo é
+    proporcional ao número de linhas alteradas. Retorna o delta aplicado.
+    """
+    delta = construir_cubo(depois, sugestoes_depois).sub(construir_cubo(antes, sugestoes_antes), fill_value=0)
+    delta = delta.astype(cubo.dtypes.to_dict())
+    # Uma atribuição por dtype (contagens/centavos int64, percentuais float64)
+    for _, colunas in delta[MEDIDAS_CUBO].columns.groupby(delta[MEDIDAS_CUBO].dtypes).items():
+        cubo.loc[delta.index, list(colunas)] += delta[list(colunas)].to_numpy()
+    return delta
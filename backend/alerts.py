@@ -0,0 +1,220 @@
+"""Motor de regras de alerta sobre os agregados em cache.
+
+As regras são declarativas: dimensões do rollup (vazio = total geral),
+condições sobre métricas derivadas do cubo e a mensagem. Métricas com
+prefixo ``delta_`` comparam com o cubo de um snapshot base (upload anterior)
+e só são avaliadas quando ele existe. Nenhuma regra olha as linhas do CSV.
+
+O estado guarda o alerta ativo de cada regra por grupo; após um what-if só
+as regras cujas medidas mudaram são reavaliadas, e só nos grupos afetados.
+"""
+import operator
+
+import pandas as pd
+
+from aggregates import DIMENSOES_CUBO
+
+# métrica -> (medidas do cubo que ela lê, cálculo sobre o rollup)
+METRICAS = {
+    'ofertas': (['ofertas'], lambda a, escala: a['ofertas']),
+    'ganhando': (['ganhando'], lambda a, escala: a['ganhando']),
+    'perdendo': (['perdendo'], lambda a, escala: a['perdendo']),
+    'taxa_perda': (['perdendo', 'ofertas'], lambda a, escala: a['perdendo'] / a['ofertas'] * 100),
+    'taxa_vitoria': (['ganhando', 'empatando', 'ofertas'],
+                     lambda a, escala: (a['ganhando'] + a['empatando']) / a['ofertas'] * 100),
+    'gap_medio': (['soma_gap', 'ofertas_com_gap'],
+                  lambda a, escala: a['soma_gap'] / a['ofertas_com_gap'].where(a['ofertas_com_gap'] > 0) / escala),
+    'gap_percentual_perdendo': (['soma_gap_pct_perdendo', 'perdendo_com_gap'],
+                                lambda a, escala: a['soma_gap_pct_perdendo']
+                                / a['perdendo_com_gap'].where(a['perdendo_com_gap'] > 0)),
+    'ganho_potencial': (['ganho_potencial'], lambda a, escala: a['ganho_potencial'] / escala),
+}
+
+OPERADORES = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le}
+
+REGRAS_ALERTA = [
+    {
+        'id': 'mais_perdendo_que_ganhando',
+        'dimensoes': [],
+        'condicoes': [('perdendo', '>', 'ganhando')],
+        'mensagem': '⚠️ Mais produtos perdendo do que ganhando - revisar precificação',
+    },
+    {
+        'id': 'margem_de_perda_alta',
+        'dimensoes': [],
+        'condicoes': [('gap_percentual_perdendo', '>', 20)],
+        'mensagem': '🚨 Margem de perda muito alta: {gap_percentual_perdendo:.2f}%',
+    },
+    {
+        'id': 'lojista_perdendo_share',
+        'dimensoes': ['Lojista'],
+        'condicoes': [('taxa_perda', '>', 60), ('ofertas', '>=', 10)],
+        'mensagem': '⚠️ {Lojista}: perdendo em {taxa_perda:.1f}% das {ofertas:.0f} ofertas',
+    },
+    {
+        'id': 'marca_margem_pressionada',
+        'dimensoes': ['Marca'],
+        'condicoes': [('gap_percentual_perdendo', '>', 15), ('perdendo', '>=', 5)],
+        'mensagem': '🚨 Marca {Marca}: ofertas perdendo estão {gap_percentual_perdendo:.1f}% acima do mais barato',
+    },
+    {
+        'id': 'cluster_oportunidade_concentrada',
+        'dimensoes': ['Cluster'],
+        'condicoes': [('ganho_potencial', '>=', 1000)],
+        'mensagem': '💰 Cluster {Cluster}: R$ {ganho_potencial:.2f} de margem potencial parada',
+    },
+    {
+        'id': 'lojista_perdeu_share',
+        'dimensoes': ['Lojista'],
+        'condicoes': [('delta_taxa_vitoria', '<=', -5)],
+        'mensagem': '📉 {Lojista}: taxa de vitória variou {delta_taxa_vitoria:+.1f} p.p. desde o upload anterior',
+    },
+    {
+        'id': 'marca_margem_caiu',
+        'dimensoes': ['Marca'],
+        'condicoes': [('delta_ganho_potencial', '<=', -500)],
+        'mensagem': '📉 Marca {Marca}: margem potencial variou R$ {delta_ganho_potencial:+.2f} desde o upload anterior',
+    },
+    {
+        'id': 'novos_concorrentes_mais_baratos',
+        'dimensoes': ['Lojista'],
+        'condicoes': [('delta_perdendo', '>=', 10)],
+        'mensagem': '🆕 {Lojista}: {delta_perdendo:.0f} ofertas a mais superadas por concorrentes mais baratos',
+    },
+]
+
+
+def _nome_metrica(nome):
+    return nome[len('delta_'):] if nome.startswith('delta_') else nome
+
+
+def _metricas_da_regra(regra):
+    nomes = []
+    for metrica, _, valor in regra['condicoes']:
+        nomes.append(metrica)
+        if isinstance(valor, str):
+            nomes.append(valor)
+    return nomes
+
+
+def medidas_da_regra(regra):
+    """Medidas do cubo que alimentam a regra (usado na reavaliação incremental)."""
+    return {m for nome in _metricas_da_regra(regra) for m in METRICAS[_nome_metrica(nome)][0]}
+
+
+def _rollup(cubo, dimensoes):
+    if dimensoes:
+        return cubo.groupby(level=dimensoes, observed=True, sort=True).sum()
+    return cubo.sum().to_frame().T
+
+
+def _usa_base(regra):
+    return any(n.startswith('delta_') for n in _metricas_da_regra(regra))
+
+
+def _avaliar(regra, cubo, cubo_base, escala):
+    """Avalia a regra sobre o cubo (ou uma fatia dele): {grupo: mensagem}."""
+    nomes = _metricas_da_regra(regra)
+    usa_base = _usa_base(regra)
+    if usa_base and cubo_base is None:
+        return {}
+
+    dimensoes = regra['dimensoes']
+    agregado = _rollup(cubo, dimensoes)
+    metricas = pd.DataFrame(index=agregado.index)
+    base = _rollup(cubo_base, dimensoes).reindex(agregado.index) if usa_base else None
+    for nome in dict.fromkeys(nomes):
+        calculo = METRICAS[_nome_metrica(nome)][1]
+        valores = calculo(agregado, escala)
+        if nome.startswith('delta_'):
+            valores = valores - calculo(base, escala)
+        metricas[nome] = valores
+
+    disparou = pd.Series(True, index=agregado.index)
+    for metrica, operador, valor in regra['condicoes']:
+        limite = metricas[valor] if isinstance(valor, str) else valor
+        disparou &= OPERADORES[operador](metricas[metrica], limite).fillna(False)
+
+    alertas = {}
+    for chave, linha in metricas[disparou].iterrows():
+        grupo = chave if isinstance(chave, tuple) else (chave,) if dimensoes else ()
+        campos = dict(zip(dimensoes, grupo), **linha.to_dict())
+        alertas[grupo] = regra['mensagem'].format(**campos)
+    return alertas
+
+
+def _escala(cubo):
+    return 100 if 'soma_gap' in cubo.columns and pd.api.types.is_integer_dtype(cubo['soma_gap']) else 1
+
+
+def regras_aplicaveis(agregados, regras=REGRAS_ALERTA):
+    """Regras que cabem nos agregados disponíveis (dimensões e medidas).
+
+    Permite rodar o mesmo motor sobre um resumo de uma linha só, como o
+    dos servidores de depuração, que não montam o cubo.
+    """
+    niveis = set(agregados.index.names)
+    colunas = set(agregados.columns)
+    return [r for r in regras if set(r['dimensoes']) <= niveis and medidas_da_regra(r) <= colunas]
+
+
+def avaliar_alertas(cubo, cubo_base=None, regras=REGRAS_ALERTA):
+    """Avaliação completa; devolve o estado {id_regra: {grupo: mensagem}}."""
+    escala = _escala(cubo)
+    return {regra['id']: _avaliar(regra, cubo, cubo_base, escala) for regra in regras}
+
+
+def alertas_do_snapshot(snapshot):
+    """Estado dos alertas do snapshot; avaliado no primeiro uso quando a análise não pediu 'alertas'.
+
+    Quem chama segura o lock do snapshot.
+    """
+    if snapshot.get('alertas') is None:
+        snapshot['alertas'] = avaliar_alertas(snapshot['cubo'], snapshot.get('cubo_base'))
+    return snapshot['alertas']
+
+
+def reavaliar_alertas(estado, cubo, delta, cubo_base=None, regras=REGRAS_ALERTA):
+    """Atualiza ``estado`` após um delta no cubo; retorna as regras reavaliadas.
+
+    Regras cujas medidas não mudaram ficam como estão; as demais são
+    recalculadas só para os grupos (projeção das dimensões da regra) tocados
+    pelo delta.
+    """
+    escala = _escala(cubo)
+    mudou = delta.ne(0)
+    reavaliadas = []
+    for regra in regras:
+        if cubo_base is None and _usa_base(regra):
+            continue
+        medidas = sorted(medidas_da_regra(regra))
+        tocadas = mudou[medidas].any(axis=1)
+        if not tocadas.any():
+            continue
+        reavaliadas.append(regra['id'])
+        dimensoes = regra['dimensoes']
+        if dimensoes:
+            outras = [d for d in DIMENSOES_CUBO if d not in dimensoes]
+            afetados = delta.index[tocadas.to_numpy()].droplevel(outras).unique()
+            fatia = cubo[cubo.index.droplevel(outras).isin(afetados)]
+            grupos = {g if isinstance(g, tuple) else (g,) for g in afetados}
+        else:
+            grupos = {()}
+            fatia = cubo
+        resultado = _avaliar(regra, fatia, cubo_base, escala)
+        atual = estado.setdefault(regra['id'], {})
+        for grupo in grupos:
+            if grupo in resultado:
+                atual[grupo] = resultado[grupo]
+            else:
+                atual.pop(grupo, None)
+    return reavaliadas
+
+
+def listar_alertas(estado, regras=REGRAS_ALERTA):
+    """Lista plana de alertas na ordem das regras e dos grupos."""
+    alertas = []
+    for regra in regras:
+        for grupo, mensagem in sorted(estado.get(regra['id'], {}).items()):
+            alertas.append({'regra': regra['id'], 'grupo': list(grupo), 'mensagem': mensagem})
+    return alertas
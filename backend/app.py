@@ -1,200 +1,955 @@
 import pandas as pd
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
 import numpy as np
 import io
+import itertools
+import os
+import threading
+import time
+import uuid
+
+from aggregates import DIMENSOES_CUBO, construir_cubo, consultar_cubo, somar_cubos
+from alerts import alertas_do_snapshot, avaliar_alertas, listar_alertas
+from competition import anexar_concorrencia, concorrencia_por_cluster, metricas_concorrencia
+from dedup import MODOS_DUPLICATAS, deduplicar_ofertas
+from engine import (
+    COLUNAS_MONETARIAS, MODOS_PRECO, TAXA_MENSAL_PADRAO, anexar_precos_caixa, detectar_outliers, formatar_sugestoes,
+    para_centavos, precos_efetivos, reconstruir_ranking, refazer_ranking, resumo_de_totais, resumo_sugestoes,
+    secoes_solicitadas, status_por_ranking, sugestoes_por_ranking, sugestoes_por_status, totais_sugestoes,
+)
+from matching import MODOS_PRODUTOS, agrupar_produtos_similares
+from ml import MODOS_ML, agendar_tarefa, agendar_treino, features_de_sugestoes, prever_lote, resultado_treino
+from optimizer import otimizar_portfolio
+from parallel import analisar_em_paralelo
+from preview import amostrar_csv, detectar_encoding, estimar
+from registry import carregar_modelo, listar_modelos, metadados_modelo, versoes_modelo
+from sketches import atualizar_sketches, novo_estado, resumir_sketches
+from snapshots import gerar_snapshot_id, obter_snapshot, salvar_snapshot
+from whatif import simular_precos
+from winprob import (
+    anexar_probabilidade_vitoria, atualizar_modelo_vitoria, carregar_modelo_vitoria, fatores_caixa_dos_lideres,
+    lideres_do_snapshot, ofertas_do_snapshot, simular_grade,
+)
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-def analyze_webprice_data_internal(csv_content_stream):
+# Processos para a análise particionada (0 = serial, dentro do worker do gunicorn)
+ANALYZER_WORKERS = int(os.environ.get('ANALYZER_WORKERS', '0'))
+
+# Seções que a rota /analyze sabe devolver via ?fields=
+SECOES_ANALISE = ['data', 'ml_insights', 'status_counts', 'resumo_por_lojista', 'alertas', 'concorrencia_por_cluster',
+                  'ml_job_id', 'vitoria_job_id', 'snapshot_id']
+SECOES_PADRAO = ['data', 'ml_insights', 'status_counts', 'alertas', 'snapshot_id']
+SECOES_COM_SUGESTOES = {'data', 'ml_insights', 'resumo_por_lojista', 'alertas', 'ml_job_id', 'vitoria_job_id'}
+
+MODOS_OUTLIERS = ['excluir', 'marcar', 'ignorar']
+
+# Prévia: orçamento de leitura e tamanho do reservatório de produtos
+PREVIA_ORCAMENTO_S = float(os.environ.get('ANALYZER_PREVIEW_BUDGET_S', '0.15'))
+PREVIA_MAX_PRODUTOS = 2000
+
+# Modo em fluxo: linhas lidas por bloco (a memória fica em um bloco + os resumos)
+FLUXO_LINHAS_POR_BLOCO = int(os.environ.get('ANALYZER_STREAM_CHUNK', '50000'))
+
+# Saídas do /predict: previsões linha a linha em CSV ou só as contagens
+FORMATOS_PREDICAO = ['csv', 'resumo']
+
+MENSAGEM_SEM_MODELO_VITORIA = ('Modelo de vitória não encontrado. Envie ao menos dois snapshots seguidos com '
+                               '/analyze?vitoria=1.')
+
+# Análises completas disparadas por uma prévia e ainda em execução
+_analises_em_andamento = set()
+_analises_lock = threading.Lock()
+
+def _preparar_ofertas(df, centavos=True, outliers='excluir', produtos='exato', duplicatas='manter', preco='caixa'):
+    """Padroniza as colunas do export e aplica os tratamentos por produto.
+
+    Mapeia os cabeçalhos, converte valores (centavos), normaliza o status e
+    aplica parcelamento, duplicatas, produtos similares, outliers e a
+    reconstrução do ranking. Retorna {'df', 'ranking_reconstruido',
+    'relatorios'} ou {'error': ...}.
+    """
+    df.columns = [c.replace('\ufeff','').strip().upper() for c in df.columns]
+
+    # Mapeamentos básicos
+    mapping_basic = {'PRODUTO':'Produto','STATUS':'Status','LOJISTA':'Lojista','PRECO':'Preço','MAIS BARATO':'Preço_Concorrente',
+                     'MARCA':'Marca','CÓDIGO CLUSTER':'Cluster','CODIGO CLUSTER':'Cluster',
+                     'N° DE LOJAS':'Num_Lojas','Nº DE LOJAS':'Num_Lojas','NO DE LOJAS':'Num_Lojas','SELLERS':'Sellers',
+                     'NO DE PARCELAS':'Parcelas','N° DE PARCELAS':'Parcelas','Nº DE PARCELAS':'Parcelas',
+                     'VALOR DA PARCELA':'Valor_Parcela'}
+    df.rename(columns={c: mapping_basic[c] for c in mapping_basic if c in df.columns}, inplace=True)
+
+    # Detecta diferença / percentual se existir
+    for c in list(df.columns):
+        uc = c.upper()
+        if 'DIFEREN' in uc and 'DIFERENÇA_RAW_CSV' not in uc:
+            df.rename(columns={c:'Diferença_Raw_CSV'}, inplace=True)
+        if 'PERCENT' in uc and 'PERCENTUAL_RAW_CSV' not in uc:
+            df.rename(columns={c:'Percentual_Raw_CSV'}, inplace=True)
+
+    essential = ['Produto','Lojista','Preço']
+    miss = [c for c in essential if c not in df.columns]
+    if miss:
+        return {"error": f"Colunas essenciais ausentes: {miss}. Colunas disponíveis: {df.columns.tolist()}"}
+
+    # Conversões numéricas
+    num_cols = ['Preço','Preço_Concorrente','Diferença_Raw_CSV','Percentual_Raw_CSV','Parcelas','Valor_Parcela']
+    for c in num_cols:
+        if c in df.columns:
+            if c == 'Percentual_Raw_CSV':
+                df[c] = df[c].astype(str).str.replace('%','', regex=False)
+            df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0)
+            if centavos and c in COLUNAS_MONETARIAS:
+                df[c] = para_centavos(df[c])
+
+    status_ausente = 'Status' not in df.columns
+    if not status_ausente:
+        df['Status'] = df['Status'].astype(str).str.strip().str.upper()
+    else:
+        df['Status'] = ''
+
+    # Parcelamento: total parcelado, prêmio sobre o à vista e preço efetivo de cada oferta
+    relatorio_parcelamento = None
+    if 'Parcelas' in df.columns and 'Valor_Parcela' in df.columns:
+        efetivos = precos_efetivos(df)
+        df[list(efetivos.columns)] = efetivos
+        parcelado = df['Total_Parcelado'] != df['Preço']
+        relatorio_parcelamento = {
+            'modo': preco,
+            'taxa_mensal_pct': TAXA_MENSAL_PADRAO * 100,
+            'ofertas_parceladas': int(parcelado.sum()),
+            'premio_medio_pct': round(float(df.loc[parcelado, 'Premio_Parcelamento_Pct'].mean()), 2)
+                                if parcelado.any() else 0.0,
+        }
+        if preco == 'efetivo':
+            # MAIS BARATO e ranking do arquivo são à vista: passam a valer sobre o efetivo
+            # nos produtos em que alguma oferta tem efetivo diferente do à vista
+            mudou = df['Preço_Efetivo'] != df['Preço']
+            df['Fator_Caixa'] = (df['Preço'] / df['Preço_Efetivo'].where(df['Preço_Efetivo'] > 0)).fillna(1.0)
+            df['Preço'] = df['Preço_Efetivo']
+            refazer = df['Produto'].isin(df.loc[mudou, 'Produto'].unique())
+            if 'Preço_Concorrente' in df.columns:
+                grupo = df.loc[refazer, ['Produto', 'Preço']]
+                mais_barato = grupo['Preço'].where(grupo['Preço'] > 0)
+                mais_barato = mais_barato.groupby(grupo['Produto'], sort=False).transform('min')
+                df.loc[refazer, 'Preço_Concorrente'] = mais_barato.fillna(0).astype(df['Preço_Concorrente'].dtype)
+            status_antes = df['Status'].copy()
+            refazer_ranking(df, refazer, refazer_status=not status_ausente)
+            relatorio_parcelamento['ofertas_com_status_alterado'] = int((df['Status'] != status_antes).sum())
+    elif preco == 'efetivo':
+        return {'error': 'preco=efetivo precisa das colunas NO DE PARCELAS e VALOR DA PARCELA.'}
+
+    # Ofertas repetidas do mesmo lojista (MinHash/LSH sobre o nome) ficam só uma vez
+    relatorio_duplicatas = None
+    if duplicatas == 'colapsar':
+        duplicada, relatorio_duplicatas = deduplicar_ofertas(df)
+        if duplicada.any():
+            afetados = df.loc[duplicada, 'Produto'].unique()
+            df = df[~duplicada].copy()
+            refazer_ranking(df, df['Produto'].isin(afetados), refazer_status=not status_ausente)
+
+    # Nomes equivalentes viram um produto só; o ranking, o status e o MAIS BARATO
+    # do arquivo valiam para os nomes separados, então são refeitos nesses produtos
+    relatorio_produtos = None
+    if produtos == 'similar':
+        canonico, relatorio_produtos = agrupar_produtos_similares(df)
+        unificados = canonico != df['Produto'].astype(str)
+        if unificados.any():
+            df['Produto_Original'] = df['Produto']
+            df['Produto'] = canonico
+            refazer = df['Produto'].isin(canonico[unificados].unique())
+            refazer_ranking(df, refazer, refazer_status=not status_ausente)
+            grupo = df[refazer]
+            if 'Preço_Concorrente' in df.columns:
+                mais_barato = grupo['Preço_Concorrente'].where(grupo['Preço_Concorrente'] > 0)
+                mais_barato = mais_barato.groupby(grupo['Produto'], sort=False).transform('min')
+                df.loc[refazer, 'Preço_Concorrente'] = mais_barato.fillna(0).astype(df['Preço_Concorrente'].dtype)
+
+    # Ofertas com preço absurdo para o produto (vírgula perdida, etc.) saem antes
+    # da estratégia; com 'marcar' só ganham a coluna Outlier
+    relatorio_outliers = None
+    if outliers != 'ignorar':
+        outlier_oferta, outlier_concorrente = detectar_outliers(df)
+        relatorio_outliers = {'modo': outliers, 'ofertas_filtradas': int(outlier_oferta.sum()),
+                              'mais_barato_filtrados': int(outlier_concorrente.sum())}
+        if outliers == 'excluir':
+            afetados = df.loc[outlier_oferta, 'Produto'].unique()
+            df = df[~outlier_oferta].copy()
+            if 'Preço_Concorrente' in df.columns:
+                df.loc[outlier_concorrente[~outlier_oferta], 'Preço_Concorrente'] = 0
+            if 'RANKING' in df.columns and len(afetados):
+                # O ranking e o status do arquivo contavam a oferta removida: refaz só esses produtos
+                refazer_ranking(df, df['Produto'].isin(afetados), refazer_status=not status_ausente)
+        else:
+            df['Outlier'] = outlier_oferta | outlier_concorrente
+
+    # Sem coluna RANKING: reconstrói a partir do PREÇO dentro de cada produto,
+    # desde que o export traga mais de uma oferta por produto
+    ranking_reconstruido = False
+    if 'RANKING' not in df.columns:
+        ranking = reconstruir_ranking(df)
+        if (ranking > 1).any():
+            df['RANKING'] = ranking
+            ranking_reconstruido = True
+            if status_ausente:
+                df['Status'] = status_por_ranking(df)
+
+    relatorios = {'outliers': relatorio_outliers, 'parcelamento': relatorio_parcelamento,
+                  'duplicatas': relatorio_duplicatas, 'produtos_similares': relatorio_produtos}
+    return {'df': df, 'ranking_reconstruido': ranking_reconstruido,
+            'relatorios': {nome: relatorio for nome, relatorio in relatorios.items() if relatorio}}
+
+def _escolher_estrategia(df):
+    """(modo, fator) da estratégia: ranking (90% do 2º), status (95% do MAIS BARATO) ou nenhuma."""
+    if 'RANKING' in df.columns:
+        df['RANKING'] = pd.to_numeric(df['RANKING'], errors='coerce')
+        return 'ranking', 0.90
+    if 'Status' in df.columns and 'Preço_Concorrente' in df.columns:
+        return 'status', 0.95
+    return None, None
+
+def _sugestoes(df, modo, fator):
+    if modo == 'ranking':
+        return sugestoes_por_ranking(df, fator=fator)
+    if modo == 'status':
+        return sugestoes_por_status(df, fator=fator)
+    return pd.DataFrame(columns=['Valor_Ajuste', 'Margem_Extra_RS'])
+
+def analyze_webprice_data_internal(csv_content_stream, centavos=True, snapshot_id=None, workers=None,
+                                   secoes=SECOES_PADRAO, outliers='excluir', cubo_base=None, produtos='exato',
+                                   duplicatas='manter', preco='caixa', ml='arvore', ml_selecao=False,
+                                   vitoria=False, id_arquivo=None):
     """Lógica de otimização de preços baseada em análise competitiva:
     1) Filtra produtos com status "GANHANDO" (onde já somos líderes)
     2) Identifica o concorrente imediatamente abaixo no ranking
     3) Sugere preço otimizado para proteger margem mantendo competitividade
     4) Calcula ganho potencial de margem
+
+    Com ``centavos=True`` (padrão) os valores monetários são guardados como
+    int64 em centavos desde a leitura e só voltam a reais na resposta.
+    Com ``snapshot_id`` o resultado e o cubo de agregados ficam em cache.
+    Com ``workers`` > 1 a estratégia roda particionada em um pool de processos.
+
+    ``outliers`` ('excluir', 'marcar' ou 'ignorar') controla o tratamento das
+    ofertas com preço fora da curva do produto (mediana/MAD por produto). O
+    padrão 'excluir' tira essas ofertas da estratégia (a contagem sai em
+    ml_insights['outliers']); com 'marcar' elas ficam e as sugestões ganham a
+    coluna Outlier.
+
+    ``preco='efetivo'`` ranqueia e sugere pelo preço efetivo (menor entre o
+    à vista e o valor presente do parcelamento) em vez do PREÇO à vista.
+
+    ``duplicatas='colapsar'`` remove ofertas repetidas do mesmo lojista
+    (nome igual ou quase igual) antes de qualquer contagem.
+
+    ``produtos='similar'`` unifica nomes equivalentes do mesmo produto
+    escritos de formas diferentes por cada lojista antes da análise.
+
+    ``ml='online'`` atualiza o modelo incremental persistido com as linhas
+    deste upload em vez de treinar a árvore do zero (ambos em segundo plano).
+    ``ml_selecao`` escolhe a profundidade/folha da árvore entre várias
+    configurações avaliadas em paralelo e calcula a importância por permutação.
+
+    ``vitoria`` anexa a cada sugestão a probabilidade de seguir em 1º no
+    preço sugerido (modelo de vitória treinado nos uploads anteriores, se já
+    houver um) e manda os líderes deste upload para o histórico do modelo,
+    que é retreinado em segundo plano (vitoria_job_id). O histórico reconhece
+    o upload por ``id_arquivo`` (hash só do arquivo; padrão: ``snapshot_id``),
+    para o mesmo arquivo com outras opções não ser aprendido duas vezes.
+
+    ``cubo_base`` é o cubo de um upload anterior, usado pelas regras de
+    alerta que comparam com a base (perda de share, queda de margem...).
+
+    Retorna um dict só com as ``secoes`` pedidas (ver SECOES_ANALISE); as
+    demais nem chegam a ser calculadas. Em caso de erro, {'error': ...}.
     """
+    secoes = set(secoes)
     try:
         df = pd.read_csv(csv_content_stream, sep=';', skiprows=[0], decimal=',')
-        df.columns = [c.replace('\ufeff','').strip().upper() for c in df.columns]
-
-        # Mapeamentos básicos
-        mapping_basic = {'PRODUTO':'Produto','STATUS':'Status','LOJISTA':'Lojista','PRECO':'Preço','MAIS BARATO':'Preço_Concorrente'}
-        df.rename(columns={c: mapping_basic[c] for c in mapping_basic if c in df.columns}, inplace=True)
-
-        # Detecta diferença / percentual se existir
-        for c in list(df.columns):
-            uc = c.upper()
-            if 'DIFEREN' in uc and 'DIFERENÇA_RAW_CSV' not in uc:
-                df.rename(columns={c:'Diferença_Raw_CSV'}, inplace=True)
-            if 'PERCENT' in uc and 'PERCENTUAL_RAW_CSV' not in uc:
-                df.rename(columns={c:'Percentual_Raw_CSV'}, inplace=True)
-
-        essential = ['Produto','Lojista','Preço']
-        miss = [c for c in essential if c not in df.columns]
-        if miss:
-            return {"error": f"Colunas essenciais ausentes: {miss}. Colunas disponíveis: {df.columns.tolist()}"}
-
-        # Conversões numéricas
-        num_cols = ['Preço','Preço_Concorrente','Diferença_Raw_CSV','Percentual_Raw_CSV']
-        for c in num_cols:
-            if c in df.columns:
-                if c == 'Percentual_Raw_CSV':
-                    df[c] = df[c].astype(str).str.replace('%','', regex=False)
-                df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0)
-
-        if 'Status' in df.columns:
-            df['Status'] = df['Status'].astype(str).str.strip().str.upper()
-        else:
-            df['Status'] = ''
+        preparo = _preparar_ofertas(df, centavos=centavos, outliers=outliers, produtos=produtos,
+                                    duplicatas=duplicatas, preco=preco)
+        if 'error' in preparo:
+            return preparo
+        df, ranking_reconstruido = preparo['df'], preparo['ranking_reconstruido']
 
-        suggestions = []
-        status_counts = df['Status'].value_counts().to_dict() if 'Status' in df.columns else {}
+        # Cada seção só é calculada se foi pedida (ou se o snapshot precisa dela)
+        com_snapshot = bool(snapshot_id) and 'snapshot_id' in secoes
+        resultado = {}
+        if 'status_counts' in secoes or com_snapshot:
+            status_counts = df['Status'].value_counts().to_dict() if 'Status' in df.columns else {}
+            resultado['status_counts'] = status_counts
+        # Concorrência por produto (HHI, lojas, spread) numa agregação só; vai junto de cada sugestão
+        concorrencia = None
+        if secoes & {'data', 'concorrencia_por_cluster'} or com_snapshot:
+            concorrencia = metricas_concorrencia(df)
+            if 'concorrencia_por_cluster' in secoes:
+                resultado['concorrencia_por_cluster'] = concorrencia_por_cluster(concorrencia)
+        if not (secoes & SECOES_COM_SUGESTOES) and not com_snapshot:
+            return resultado
 
         # **NOVA LÓGICA BASEADA NAS SUAS REGRAS DE NEGÓCIO**
-        if 'RANKING' in df.columns:
-            # Lógica principal: análise por ranking
-            df['RANKING'] = pd.to_numeric(df['RANKING'], errors='coerce')
-            
-            # Filtra apenas produtos onde estamos GANHANDO (ranking = 1)
-            ganhando_df = df[df['RANKING'] == 1].copy()
-            
-            if not ganhando_df.empty:
-                # Para cada produto ganhando, encontra o concorrente logo abaixo (ranking = 2)
-                for _, produto_ganhando in ganhando_df.iterrows():
-                    produto_nome = produto_ganhando['Produto']
-                    nosso_preco = produto_ganhando['Preço']
-                    
-                    # Busca o concorrente de ranking 2 para o mesmo produto
-                    concorrente_abaixo = df[
-                        (df['Produto'] == produto_nome) & 
-                        (df['RANKING'] == 2)
-                    ]
-                    
-                    if not concorrente_abaixo.empty:
-                        preco_concorrente = concorrente_abaixo.iloc[0]['Preço']
-                        
-                        # Calcula preço otimizado (entre nosso preço e o do concorrente)
-                        # Sugestão: ajustar para 90% do preço do concorrente
-                        preco_otimo = round(preco_concorrente * 0.90, 2)
-                        
-                        # Só sugere se pudermos aumentar o preço (proteger margem)
-                        if preco_otimo > nosso_preco:
-                            valor_ajuste = preco_otimo - nosso_preco
-                            percentual_ajuste = (valor_ajuste / nosso_preco) * 100
-                            margem_extra = valor_ajuste  # Ganho direto de margem
-                            
-                            suggestions.append({
-                                'Produto': produto_nome,
-                                'Lojista': produto_ganhando['Lojista'],
-                                'Ranking_Atual': 1,
-                                'Preço_Atual': nosso_preco,
-                                'Preço_Concorrente_Abaixo': preco_concorrente,
-                                'Preço_Sugerido': preco_otimo,
-                                'Valor_Ajuste': round(valor_ajuste, 2),
-                                'Percentual_Ajuste': round(percentual_ajuste, 2),
-                                'Margem_Extra_RS': round(margem_extra, 2),
-                                'Diferença_vs_Concorrente': round(preco_concorrente - preco_otimo, 2),
-                                'Status': 'GANHANDO',
-                                'Tipo_Ajuste': 'Proteção da Margem',
-                                'Competitividade': 'Mantida (10% abaixo do concorrente)'
-                            })
-                        else:
-                            # Produto já está bem precificado
-                            suggestions.append({
-                                'Produto': produto_nome,
-                                'Lojista': produto_ganhando['Lojista'],
-                                'Ranking_Atual': 1,
-                                'Preço_Atual': nosso_preco,
-                                'Preço_Concorrente_Abaixo': preco_concorrente,
-                                'Preço_Sugerido': nosso_preco,
-                                'Valor_Ajuste': 0,
-                                'Percentual_Ajuste': 0,
-                                'Margem_Extra_RS': 0,
-                                'Diferença_vs_Concorrente': round(preco_concorrente - nosso_preco, 2),
-                                'Status': 'GANHANDO',
-                                'Tipo_Ajuste': 'Manter Preço',
-                                'Competitividade': 'Ótima - preço já bem posicionado'
-                            })
-
-        # Fallback: análise por status "GANHANDO" sem ranking
-        elif 'Status' in df.columns and 'Preço_Concorrente' in df.columns:
-            df_ganhando = df[df['Status'] == 'GANHANDO'].copy()
-            
-            if not df_ganhando.empty:
-                for _, row in df_ganhando.iterrows():
-                    nosso_preco = row['Preço']
-                    preco_concorrente = row['Preço_Concorrente']
-                    
-                    # Preço otimizado: 5% abaixo do concorrente
-                    preco_otimo = round(preco_concorrente * 0.95, 2)
-                    
-                    if preco_otimo > nosso_preco:
-                        valor_ajuste = preco_otimo - nosso_preco
-                        percentual_ajuste = (valor_ajuste / nosso_preco) * 100
-                        
-                        suggestions.append({
-                            'Produto': row['Produto'],
-                            'Lojista': row['Lojista'],
-                            'Preço_Atual': nosso_preco,
-                            'Preço_Concorrente': preco_concorrente,
-                            'Preço_Sugerido': preco_otimo,
-                            'Valor_Ajuste': round(valor_ajuste, 2),
-                            'Percentual_Ajuste': round(percentual_ajuste, 2),
-                            'Margem_Extra_RS': round(valor_ajuste, 2),
-                            'Status': 'GANHANDO',
-                            'Tipo_Ajuste': 'Proteção da Margem',
-                            'Competitividade': 'Mantida (5% abaixo do concorrente)'
-                        })
-
-        # Ordena por maior ganho de margem primeiro
-        if suggestions:
-            suggestions = sorted(suggestions, key=lambda x: x.get('Margem_Extra_RS', 0), reverse=True)
-
-        # ML insights simplificado
-        total_ganho = sum(s.get('Margem_Extra_RS', 0) for s in suggestions)
-        produtos_com_oportunidade = len([s for s in suggestions if s.get('Valor_Ajuste', 0) > 0])
+        # Lógica principal: quem está em 1º protege margem olhando o 2º colocado (90% dele).
+        # Fallback sem ranking: GANHANDO comparado ao MAIS BARATO (5% abaixo).
+        modo, fator = _escolher_estrategia(df)
+
+        cubo = None
+        execucao_paralela = None
+        if modo and workers and workers > 1:
+            sugestoes, cubo, execucao_paralela = analisar_em_paralelo(df, modo, fator, workers=workers)
+        else:
+            sugestoes = _sugestoes(df, modo, fator)
+        if 'Fator_Caixa' in df.columns and 'Produto' in sugestoes.columns:
+            sugestoes = anexar_precos_caixa(sugestoes, df['Fator_Caixa'])
+        if concorrencia is not None and 'Produto' in sugestoes.columns:
+            sugestoes = anexar_concorrencia(sugestoes, concorrencia)
+        if 'Outlier' in df.columns and 'Produto' in sugestoes.columns:
+            sugestoes = sugestoes.assign(Outlier=df['Outlier'].reindex(sugestoes.index, fill_value=False))
+        modelo_vitoria = None
+        if vitoria:
+            lideres = lideres_do_snapshot(df, concorrencia)
+            modelo_vitoria = carregar_modelo_vitoria()
+            if modelo_vitoria is not None and 'Produto' in sugestoes.columns:
+                sugestoes = anexar_probabilidade_vitoria(sugestoes, lideres, modelo_vitoria[0])
+
+        if 'data' in secoes:
+            # Ordena por maior ganho de margem primeiro e converte para reais só na saída
+            resultado['data'] = formatar_sugestoes(sugestoes)
+
+        if 'ml_insights' in secoes or com_snapshot:
+            ml_insights = {
+                **resumo_sugestoes(sugestoes),
+                'strategy': 'Proteção de margem mantendo competitividade',
+                'target_discount': '5-10% abaixo do concorrente imediato',
+                'ranking_reconstruido': ranking_reconstruido
+            }
+            ml_insights.update(preparo['relatorios'])
+            if execucao_paralela:
+                ml_insights['execucao_paralela'] = execucao_paralela
+            if vitoria:
+                ml_insights['modelo_vitoria_versao'] = modelo_vitoria[1]['versao'] if modelo_vitoria else None
+            resultado['ml_insights'] = ml_insights
+
+        if 'ml_job_id' in secoes:
+            # A árvore de decisão treina no pool em segundo plano; a resposta não espera por ela
+            resultado['ml_job_id'] = agendar_treino(*features_de_sugestoes(sugestoes), modo=ml, snapshot_id=snapshot_id,
+                                                    selecao=ml_selecao)
+        if vitoria and 'vitoria_job_id' in secoes:
+            # O histórico guarda uma cópia enxuta das ofertas (o df segue para o snapshot e o what-if) e
+            # aplica os uploads um por vez, na ordem de chegada
+            resultado['vitoria_job_id'] = agendar_tarefa(atualizar_modelo_vitoria, lideres, ofertas_do_snapshot(df),
+                                                         snapshot_id=id_arquivo or snapshot_id,
+                                                         recebido_em=time.time(), sequencial=True)
+
+        alertas = None
+        if secoes & {'resumo_por_lojista', 'alertas'} or com_snapshot:
+            if cubo is None:
+                cubo = construir_cubo(df, sugestoes)
+            if 'resumo_por_lojista' in secoes:
+                resultado['resumo_por_lojista'] = consultar_cubo(cubo, ['Lojista'])
+            if 'alertas' in secoes:
+                # Regras de alerta rodam sobre o cubo, não sobre as linhas; sem a seção, o snapshot
+                # as avalia no primeiro what-if ou GET /alertas
+                alertas = avaliar_alertas(cubo, cubo_base)
+                resultado['alertas'] = listar_alertas(alertas)
+
+        if com_snapshot:
+            salvar_snapshot(snapshot_id, df=df, sugestoes=sugestoes, cubo=cubo,
+                            ml_insights=dict(ml_insights), status_counts=dict(status_counts),
+                            totais=totais_sugestoes(sugestoes), sugestoes_alteradas={},
+                            indice_produtos=df.groupby('Produto', sort=False).indices,
+                            alertas=alertas, cubo_base=cubo_base)
+            resultado['snapshot_id'] = snapshot_id
+
+        return {secao: resultado[secao] for secao in SECOES_ANALISE if secao in secoes and secao in resultado}
         
+    except Exception as e:
+        print('Erro ao processar CSV:', e)
+        return {'error': f'Erro ao processar o CSV: {e}'}
+
+MENSAGEM_EXPORT_NAO_AGRUPADO = ('O export precisa vir agrupado por PRODUTO (todas as ofertas de um produto em '
+                                'sequência) para a leitura em blocos; use /analyze.')
+
+class ExportNaoAgrupado(ValueError):
+    """Um produto já fechado em um bloco anterior reapareceu mais adiante no export."""
+
+
+def _blocos_por_produto(leitor):
+    """Blocos do export sem partir produto (o export precisa vir agrupado por produto).
+
+    As ofertas do último produto de cada bloco passam para o bloco seguinte,
+    para o ranking e o 2º colocado serem vistos inteiros. Os produtos já
+    entregues ficam guardados como hashes de 64 bits; se um deles reaparece,
+    o ranking e os totais por bloco estariam errados, então a leitura para
+    com ExportNaoAgrupado.
+    """
+    pendente, fechados = None, set()
+    for bloco in leitor:
+        colunas = [c for c in bloco.columns if c.replace('\ufeff', '').strip().upper() == 'PRODUTO']
+        if not colunas:
+            pendente = None
+            yield bloco
+            continue
+        hashes = pd.util.hash_array(bloco[colunas[0]].astype(str).to_numpy(dtype=object))
+        if not fechados.isdisjoint(np.unique(hashes).tolist()):
+            raise ExportNaoAgrupado(MENSAGEM_EXPORT_NAO_AGRUPADO)
+        if pendente is not None:
+            bloco = pd.concat([pendente, bloco], ignore_index=True)
+        produto = bloco[colunas[0]]
+        outros = np.flatnonzero((produto != produto.iloc[-1]).to_numpy())
+        corte = outros[-1] + 1 if len(outros) else 0
+        if corte and (produto.iloc[:corte] == produto.iloc[-1]).any():
+            raise ExportNaoAgrupado(MENSAGEM_EXPORT_NAO_AGRUPADO)
+        pendente = bloco.iloc[corte:]
+        if corte:
+            entregue = bloco.iloc[:corte].copy()
+            fechados.update(np.unique(pd.util.hash_array(
+                entregue[colunas[0]].astype(str).to_numpy(dtype=object))).tolist())
+            yield entregue
+    if pendente is not None and len(pendente):
+        yield pendente.copy()
+
+def analyze_webprice_stream(binary_stream, encoding='utf-8-sig', centavos=True, outliers='excluir', preco='caixa',
+                            linhas_por_bloco=FLUXO_LINHAS_POR_BLOCO, top_k=10):
+    """Análise em uma passada, com memória limitada, para exports grandes demais.
+
+    Cada bloco passa pelo mesmo preparo e pela mesma estratégia da análise
+    completa e é descartado. As contagens de status, os totais do card e o
+    cubo (logo o resumo_por_lojista e os alertas) são aditivos e saem exatos,
+    desde que o export venha agrupado por produto; um export embaralhado é
+    recusado ({'error'}) em vez de gerar totais por pedaço. Por cluster e por lojista ficam resumos de tamanho fixo (ver sketches):
+    quantis do gap, produtos/lojistas distintos e as maiores oportunidades,
+    com os limites de erro de cada um.
+    """
+    try:
+        estado = novo_estado(top_k=top_k)
+        status_counts = pd.Series(dtype='int64')
+        totais = {'sugestoes': 0, 'oportunidades': 0, 'ganho': 0}
+        outliers_filtrados = {'ofertas_filtradas': 0, 'mais_barato_filtrados': 0}
+        parceladas, soma_premio, com_parcelamento = 0, 0.0, False
+        cubo, blocos, ranking_reconstruido = None, 0, False
+        with pd.read_csv(binary_stream, sep=';', skiprows=[0], decimal=',', chunksize=linhas_por_bloco,
+                         encoding=encoding, encoding_errors='replace') as leitor:
+            for bloco in _blocos_por_produto(leitor):
+                preparo = _preparar_ofertas(bloco, centavos=centavos, outliers=outliers, preco=preco)
+                if 'error' in preparo:
+                    return preparo
+                df = preparo['df']
+                modo, fator = _escolher_estrategia(df)
+                sugestoes = _sugestoes(df, modo, fator)
+
+                blocos += 1
+                ranking_reconstruido |= preparo['ranking_reconstruido']
+                status_counts = status_counts.add(df['Status'].value_counts(), fill_value=0)
+                for chave, valor in totais_sugestoes(sugestoes).items():
+                    totais[chave] += valor
+                for chave in outliers_filtrados:
+                    outliers_filtrados[chave] += preparo['relatorios'].get('outliers', {}).get(chave, 0)
+                if 'parcelamento' in preparo['relatorios']:
+                    relatorio = preparo['relatorios']['parcelamento']
+                    com_parcelamento = True
+                    parceladas += relatorio['ofertas_parceladas']
+                    soma_premio += relatorio['premio_medio_pct'] * relatorio['ofertas_parceladas']
+                cubo_bloco = construir_cubo(df, sugestoes)
+                cubo = cubo_bloco if cubo is None else somar_cubos(cubo, cubo_bloco)
+                atualizar_sketches(estado, df, sugestoes)
+
+        if cubo is None:
+            return {'error': 'O CSV não tem ofertas.'}
         ml_insights = {
-            'total_produtos_analisados': len(suggestions),
-            'produtos_com_oportunidade_margem': produtos_com_oportunidade,
-            'ganho_potencial_total_rs': round(total_ganho, 2),
-            'ganho_medio_por_produto': round(total_ganho / max(len(suggestions), 1), 2),
+            **resumo_de_totais(totais, centavos=centavos),
             'strategy': 'Proteção de margem mantendo competitividade',
-            'target_discount': '5-10% abaixo do concorrente imediato'
+            'target_discount': '5-10% abaixo do concorrente imediato',
+            'ranking_reconstruido': ranking_reconstruido,
+            'blocos_processados': blocos,
+        }
+        if outliers != 'ignorar':
+            ml_insights['outliers'] = {'modo': outliers, **outliers_filtrados}
+        if com_parcelamento:
+            ml_insights['parcelamento'] = {'modo': preco, 'taxa_mensal_pct': TAXA_MENSAL_PADRAO * 100,
+                                           'ofertas_parceladas': parceladas,
+                                           'premio_medio_pct': round(soma_premio / parceladas, 2) if parceladas else 0.0}
+        return {
+            'ml_insights': ml_insights,
+            'status_counts': {s: int(q) for s, q in status_counts.items()},
+            'resumo_por_lojista': consultar_cubo(cubo, ['Lojista']),
+            'alertas': listar_alertas(avaliar_alertas(cubo)),
+            'sketches': resumir_sketches(estado, centavos=centavos),
         }
 
-        return suggestions, ml_insights, status_counts
-        
+    except ExportNaoAgrupado as e:
+        return {'error': str(e)}
     except Exception as e:
         print('Erro ao processar CSV:', e)
         return {'error': f'Erro ao processar o CSV: {e}'}
 
+def prever_export(binary_stream, modelo, metadados, encoding='utf-8-sig', centavos=True, outliers='excluir',
+                  preco='caixa', linhas_por_bloco=FLUXO_LINHAS_POR_BLOCO):
+    """Classifica as ofertas de um export com um modelo do registro, bloco a bloco.
+
+    Cada bloco (produtos inteiros) passa pelo mesmo preparo e pela mesma
+    estratégia da análise; as ofertas com sugestão (as que têm as features do
+    modelo) são classificadas numa chamada só e o bloco é descartado, então a
+    memória não cresce com o arquivo. Gera DataFrames com Produto, Lojista,
+    Preço_Atual (em reais), o Tipo_Ajuste da regra e as colunas de
+    prever_lote; ou um dict {'error'} se o export não puder ser preparado ou
+    não vier agrupado por produto.
+    """
+    with pd.read_csv(binary_stream, sep=';', skiprows=[0], decimal=',', chunksize=linhas_por_bloco,
+                     encoding=encoding, encoding_errors='replace') as leitor:
+        blocos = _blocos_por_produto(leitor)
+        while True:
+            try:
+                bloco = next(blocos, None)
+            except ExportNaoAgrupado as e:
+                yield {'error': str(e)}
+                return
+            if bloco is None:
+                return
+            preparo = _preparar_ofertas(bloco, centavos=centavos, outliers=outliers, preco=preco)
+            if 'error' in preparo:
+                yield preparo
+                return
+            df = preparo['df']
+            sugestoes = _sugestoes(df, *_escolher_estrategia(df))
+            if not len(sugestoes):
+                continue
+            colunas, _ = features_de_sugestoes(sugestoes)
+            previsoes = prever_lote(modelo, metadados, colunas)
+            escala = 100 if pd.api.types.is_integer_dtype(sugestoes['Preço_Atual']) else 1
+            yield pd.concat([pd.DataFrame({
+                'Produto': sugestoes['Produto'].to_numpy(),
+                'Lojista': sugestoes['Lojista'].to_numpy(),
+                'Preço_Atual': sugestoes['Preço_Atual'].to_numpy() / escala,
+                'Tipo_Ajuste': sugestoes['Tipo_Ajuste'].to_numpy(),
+                **({'Outlier': df['Outlier'].reindex(sugestoes.index, fill_value=False).to_numpy()}
+                   if 'Outlier' in df.columns else {}),
+            }), previsoes], axis=1)
+
 @app.route('/analyze', methods=['POST'])
 def analyze_route():
+    """Analisa o CSV enviado.
+
+    ?fields=data,ml_insights,... escolhe as seções da resposta; as que não
+    forem pedidas não são calculadas. Padrão: data, ml_insights,
+    status_counts, alertas e snapshot_id. O modelo de ML só treina quando
+    pedido (?ml=arvore|online, ?ml_selecao=1 ou fields=ml_job_id), em segundo
+    plano; o resultado sai em /ml/<ml_job_id>. ?outliers=excluir|marcar|ignorar (padrão:
+    excluir, tira da estratégia as ofertas com preço fora da curva; marcar as mantém com a coluna Outlier).
+    ?base=<snapshot_id> compara com um upload anterior nas regras de alerta.
+    ?produtos=similar unifica nomes equivalentes entre lojistas (padrão: exato).
+    ?duplicatas=colapsar remove ofertas repetidas do mesmo lojista (padrão: manter).
+    ?preco=efetivo ranqueia pelo preço com parcelamento (padrão: caixa, o PREÇO à vista).
+    ?ml=arvore treina a árvore do zero; ?ml=online atualiza o modelo incremental.
+    ?ml_selecao=1 escolhe a configuração da árvore (profundidade, folha mínima) em paralelo, com
+    importância por permutação e limite de tempo; o relatório sai em selecao_modelo no /ml.
+    ?vitoria=1 anexa Probabilidade_Vitoria às sugestões e alimenta o histórico do modelo de vitória
+    (retreino em segundo plano; o resultado sai em /ml/<vitoria_job_id>).
+    """
     if 'file' not in request.files:
         return jsonify({'error':'Nenhum arquivo enviado.'}), 400
     file = request.files['file']
     if file.filename == '':
         return jsonify({'error':'Nome de arquivo vazio.'}), 400
+    secoes = secoes_solicitadas(request.args.get('fields'), SECOES_ANALISE, SECOES_PADRAO)
+    if 'error' in secoes:
+        return jsonify(secoes), 400
+    outliers = request.args.get('outliers', 'excluir')
+    if outliers not in MODOS_OUTLIERS:
+        return jsonify({'error': f'outliers deve ser um de {MODOS_OUTLIERS}.'}), 400
+    produtos = request.args.get('produtos', 'exato')
+    if produtos not in MODOS_PRODUTOS:
+        return jsonify({'error': f'produtos deve ser um de {MODOS_PRODUTOS}.'}), 400
+    duplicatas = request.args.get('duplicatas', 'manter')
+    if duplicatas not in MODOS_DUPLICATAS:
+        return jsonify({'error': f'duplicatas deve ser um de {MODOS_DUPLICATAS}.'}), 400
+    preco = request.args.get('preco', 'caixa')
+    if preco not in MODOS_PRECO:
+        return jsonify({'error': f'preco deve ser um de {MODOS_PRECO}.'}), 400
+    ml = request.args.get('ml', 'arvore')
+    if ml not in MODOS_ML:
+        return jsonify({'error': f'ml deve ser um de {MODOS_ML}.'}), 400
+    ml_selecao = request.args.get('ml_selecao') in ('1', 'true')
+    if ml_selecao and ml != 'arvore':
+        return jsonify({'error': 'ml_selecao só vale para ml=arvore.'}), 400
+    # O treino (e a versão nova no registro) é opt-in: a análise padrão não treina
+    if ('ml' in request.args or ml_selecao) and 'ml_job_id' not in secoes['secoes']:
+        secoes['secoes'].append('ml_job_id')
+    vitoria = request.args.get('vitoria') in ('1', 'true')
+    if vitoria and 'vitoria_job_id' not in secoes['secoes']:
+        secoes['secoes'].append('vitoria_job_id')
+    cubo_base = None
+    if request.args.get('base'):
+        base = obter_snapshot(request.args['base'])
+        if base is None:
+            return jsonify({'error': 'Snapshot base não encontrado. Envie o arquivo anterior novamente.'}), 404
+        with base['lock']:
+            cubo_base = base['cubo'].copy()
     raw_bytes = file.read()
     try:
         text = raw_bytes.decode('utf-8-sig')
     except UnicodeDecodeError:
         text = raw_bytes.decode('latin-1', errors='ignore')
-    result = analyze_webprice_data_internal(io.StringIO(text))
-    if isinstance(result, tuple):
-        data, ml_insights, status_counts = result
-        return jsonify({'data': data, 'ml_insights': ml_insights, 'status_counts': status_counts})
-    else:
-        if 'error' in result:
-            return jsonify(result), 400
-        if 'message' in result:
-            return jsonify({'data': [], 'ml_insights': result, 'status_counts': {}})
-        return jsonify({'error':'Retorno inesperado.'}), 500
+    # O mesmo arquivo com outras opções é outro snapshot (cubo, what-if e alertas seguem as opções)
+    snapshot_id = gerar_snapshot_id(raw_bytes, outliers=outliers, produtos=produtos, duplicatas=duplicatas,
+                                    preco=preco, base=request.args.get('base'))
+    workers = request.args.get('workers', type=int, default=ANALYZER_WORKERS)
+    result = analyze_webprice_data_internal(io.StringIO(text), snapshot_id=snapshot_id, workers=workers,
+                                            secoes=secoes['secoes'], outliers=outliers, cubo_base=cubo_base,
+                                            produtos=produtos, duplicatas=duplicatas,
+                                            preco=preco, ml=ml, ml_selecao=ml_selecao, vitoria=vitoria,
+                                            id_arquivo=gerar_snapshot_id(raw_bytes))
+    if 'error' in result:
+        return jsonify(result), 400
+    return jsonify(result)
+
+def _analise_completa_em_segundo_plano(stream, encoding, snapshot_id):
+    try:
+        text = stream.read().decode(encoding, errors='ignore')
+        analyze_webprice_data_internal(io.StringIO(text), snapshot_id=snapshot_id, workers=ANALYZER_WORKERS,
+                                       secoes=['snapshot_id'])
+    finally:
+        stream.close()
+        with _analises_lock:
+            _analises_em_andamento.discard(snapshot_id)
+
+@app.route('/analyze/stream', methods=['POST'])
+def stream_route():
+    """Análise em fluxo para exports grandes demais para a memória.
+
+    Lê o arquivo em blocos e devolve status_counts, ml_insights,
+    resumo_por_lojista e alertas exatos, mais os resumos aproximados por
+    cluster/lojista em 'sketches' (com os limites de erro). Aceita
+    ?outliers=, ?preco= e ?top_k=.
+    """
+    if 'file' not in request.files:
+        return jsonify({'error':'Nenhum arquivo enviado.'}), 400
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error':'Nome de arquivo vazio.'}), 400
+    outliers = request.args.get('outliers', 'excluir')
+    if outliers not in MODOS_OUTLIERS:
+        return jsonify({'error': f'outliers deve ser um de {MODOS_OUTLIERS}.'}), 400
+    preco = request.args.get('preco', 'caixa')
+    if preco not in MODOS_PRECO:
+        return jsonify({'error': f'preco deve ser um de {MODOS_PRECO}.'}), 400
+    top_k = request.args.get('top_k', type=int, default=10)
+    if top_k < 1:
+        return jsonify({'error': 'top_k deve ser um inteiro positivo.'}), 400
+
+    encoding = detectar_encoding(file.stream)
+    result = analyze_webprice_stream(file.stream, encoding=encoding, outliers=outliers, preco=preco, top_k=top_k)
+    if 'error' in result:
+        return jsonify(result), 400
+    return jsonify(result)
+
+@app.route('/analyze/preview', methods=['POST'])
+def preview_route():
+    """Prévia em ~300 ms: lê o arquivo até o orçamento acabar e analisa uma amostra.
+
+    Devolve contagens exatas do trecho lido, estimativas para o arquivo todo
+    (status, produtos, oportunidades) e uma amostra das sugestões. Com
+    ?completa=1 a análise inteira segue em segundo plano e vira o snapshot
+    ``snapshot_id`` (acompanhe em /snapshots/<id>/status).
+    """
+    if 'file' not in request.files:
+        return jsonify({'error':'Nenhum arquivo enviado.'}), 400
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error':'Nome de arquivo vazio.'}), 400
+    stream = file.stream
+    stream.seek(0, os.SEEK_END)
+    tamanho = stream.tell()
+    stream.seek(0)
+    encoding = detectar_encoding(stream)
+
+    amostra = amostrar_csv(stream, tamanho, encoding=encoding, orcamento_s=PREVIA_ORCAMENTO_S,
+                           max_produtos=PREVIA_MAX_PRODUTOS)
+    result = analyze_webprice_data_internal(io.StringIO(amostra['csv']), secoes=['data', 'ml_insights'])
+    if 'error' in result:
+        return jsonify(result), 400
+
+    resposta = {
+        'previa': True,
+        'leitura': {k: amostra[k] for k in ('completo', 'linhas_lidas', 'status_counts', 'produtos_amostrados',
+                                             'tempo_leitura_ms')},
+        'estimativas': estimar(amostra, result['ml_insights']),
+        'data': result['data'][:50],
+    }
+    if request.args.get('completa') in ('1', 'true'):
+        # O stream passa para a thread; o Flask fecharia o arquivo ao fim da requisição
+        snapshot_id = uuid.uuid4().hex[:16]
+        file.stream = io.BytesIO()
+        stream.seek(0)
+        with _analises_lock:
+            _analises_em_andamento.add(snapshot_id)
+        threading.Thread(target=_analise_completa_em_segundo_plano, args=(stream, encoding, snapshot_id),
+                         daemon=True).start()
+        resposta['snapshot_id'] = snapshot_id
+    return jsonify(resposta)
+
+@app.route('/snapshots/<snapshot_id>/status', methods=['GET'])
+def snapshot_status_route(snapshot_id):
+    """'processando' enquanto a análise completa de uma prévia roda, depois 'pronto'."""
+    with _analises_lock:
+        if snapshot_id in _analises_em_andamento:
+            return jsonify({'snapshot_id': snapshot_id, 'status': 'processando'})
+    if obter_snapshot(snapshot_id) is None:
+        return jsonify({'error': 'Snapshot não encontrado. Envie o arquivo novamente.'}), 404
+    return jsonify({'snapshot_id': snapshot_id, 'status': 'pronto'})
+
+@app.route('/ml/<job_id>', methods=['GET'])
+def ml_job_route(job_id):
+    """Insights do modelo treinado em segundo plano: 'processando', 'pronto' ou 'erro'."""
+    resultado = resultado_treino(job_id)
+    if resultado is None:
+        return jsonify({'error': 'Job de ML não encontrado. Envie o arquivo novamente.'}), 404
+    return jsonify(resultado)
+
+@app.route('/predict', methods=['POST'])
+def predict_route():
+    """Classifica as ofertas de um export com um modelo registrado.
+
+    ?modelo=arvore|online (padrão: arvore) e ?versao=<n>|latest escolhem o
+    modelo. ?formato=csv (padrão) devolve as previsões linha a linha em CSV,
+    geradas bloco a bloco enquanto o arquivo é lido; ?formato=resumo devolve
+    só as contagens por classe prevista e a concordância com a regra.
+    Aceita ?outliers= e ?preco= como a análise.
+    """
+    if 'file' not in request.files:
+        return jsonify({'error':'Nenhum arquivo enviado.'}), 400
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error':'Nome de arquivo vazio.'}), 400
+    nome = request.args.get('modelo', 'arvore')
+    if nome not in MODOS_ML:
+        return jsonify({'error': f'modelo deve ser um de {MODOS_ML}.'}), 400
+    formato = request.args.get('formato', 'csv')
+    if formato not in FORMATOS_PREDICAO:
+        return jsonify({'error': f'formato deve ser um de {FORMATOS_PREDICAO}.'}), 400
+    outliers = request.args.get('outliers', 'excluir')
+    if outliers not in MODOS_OUTLIERS:
+        return jsonify({'error': f'outliers deve ser um de {MODOS_OUTLIERS}.'}), 400
+    preco = request.args.get('preco', 'caixa')
+    if preco not in MODOS_PRECO:
+        return jsonify({'error': f'preco deve ser um de {MODOS_PRECO}.'}), 400
+    versao = request.args.get('versao', 'latest')
+    carregado = carregar_modelo(nome, versao)
+    if carregado is None:
+        return jsonify({'error': f'Modelo {nome} versão {versao} não encontrado. Treine um com /analyze.',
+                        'versoes': versoes_modelo(nome)}), 404
+    modelo, metadados = carregado
+
+    encoding = detectar_encoding(file.stream)
+    blocos = prever_export(file.stream, modelo, metadados, encoding=encoding, outliers=outliers, preco=preco)
+    try:
+        # O primeiro bloco sai antes da resposta: erro de preparo ainda vira 400
+        primeiro = next(blocos, None)
+    except Exception as e:
+        print('Erro ao processar CSV:', e)
+        return jsonify({'error': f'Erro ao processar o CSV: {e}'}), 400
+    if isinstance(primeiro, dict):
+        return jsonify(primeiro), 400
+    todos = itertools.chain([] if primeiro is None else [primeiro], blocos)
+
+    if formato == 'resumo':
+        linhas, concordantes, por_classe = 0, 0, pd.Series(dtype='int64')
+        try:
+            for previsoes in todos:
+                if isinstance(previsoes, dict):
+                    return jsonify(previsoes), 400
+                linhas += len(previsoes)
+                concordantes += int((previsoes['Tipo_Ajuste_Previsto'] == previsoes['Tipo_Ajuste']).sum())
+                por_classe = por_classe.add(previsoes['Tipo_Ajuste_Previsto'].value_counts(), fill_value=0)
+        except Exception as e:
+            print('Erro ao processar CSV:', e)
+            return jsonify({'error': f'Erro ao processar o CSV: {e}'}), 400
+        return jsonify({'modelo': nome, 'versao': metadados['versao'], 'linhas_classificadas': linhas,
+                        'previsoes_por_classe': {c: int(q) for c, q in por_classe.items()},
+                        'concordancia_com_regra_pct': round(concordantes / linhas * 100, 2) if linhas else None})
+
+    # O CSV sai enquanto o arquivo é lido; o Flask fecharia o arquivo ao fim da requisição
+    stream, file.stream = file.stream, io.BytesIO()
+
+    def gerar_csv():
+        cabecalho_csv = True
+        try:
+            for previsoes in todos:
+                if isinstance(previsoes, dict):
+                    # Erro no meio do arquivo: o status já saiu, então fica registrado no fim do CSV
+                    yield f"# {previsoes['error']}\n"
+                    return
+                yield previsoes.to_csv(sep=';', index=False, header=cabecalho_csv, decimal=',')
+                cabecalho_csv = False
+        except Exception as e:
+            print('Erro ao processar CSV:', e)
+            yield f"# Erro ao processar o CSV: {e}\n"
+        finally:
+            blocos.close()
+            stream.close()
+
+    resposta = Response(gerar_csv(), mimetype='text/csv')
+    resposta.headers['Content-Disposition'] = f'attachment; filename=previsoes_{nome}_v{metadados["versao"]}.csv'
+    resposta.headers['X-Modelo-Versao'] = str(metadados['versao'])
+    return resposta
+
+@app.route('/modelos', methods=['GET'])
+def modelos_route():
+    """Modelos do registro com os metadados de cada versão."""
+    return jsonify({'modelos': listar_modelos()})
+
+@app.route('/modelos/<nome>', methods=['GET'])
+@app.route('/modelos/<nome>/<versao>', methods=['GET'])
+def modelo_route(nome, versao='latest'):
+    """Metadados de uma versão do modelo: número fixo ou 'latest' (padrão)."""
+    metadados = metadados_modelo(nome, versao)
+    if metadados is None:
+        return jsonify({'error': f'Modelo {nome} versão {versao} não encontrado.',
+                        'versoes': versoes_modelo(nome)}), 404
+    return jsonify(metadados)
+
+@app.route('/snapshots/<snapshot_id>/cubo', methods=['GET'])
+def cubo_route(snapshot_id):
+    """Fatias e rollups do cubo Lojista x Marca x Cluster de um snapshot.
+
+    ?dimensoes=Lojista,Marca define o agrupamento (vazio = total geral) e
+    ?Marca=A,B / ?Cluster=... / ?Lojista=... filtram a fatia.
+    """
+    snapshot = obter_snapshot(snapshot_id)
+    if snapshot is None:
+        return jsonify({'error': 'Snapshot não encontrado. Envie o arquivo novamente.'}), 404
+    dimensoes = [d for d in request.args.get('dimensoes', 'Lojista').split(',') if d]
+    invalidas = [d for d in dimensoes if d not in DIMENSOES_CUBO]
+    if invalidas:
+        return jsonify({'error': f'Dimensões inválidas: {invalidas}. Use {DIMENSOES_CUBO}.'}), 400
+    filtros = {d: request.args[d].split(',') for d in DIMENSOES_CUBO if request.args.get(d)}
+    return jsonify({'snapshot_id': snapshot_id, 'dimensoes': dimensoes, 'filtros': filtros,
+                    'linhas': consultar_cubo(snapshot['cubo'], dimensoes, filtros)})
+
+@app.route('/snapshots/<snapshot_id>/alertas', methods=['GET'])
+def alertas_route(snapshot_id):
+    """Alertas vigentes do snapshot (já considerando as simulações)."""
+    snapshot = obter_snapshot(snapshot_id)
+    if snapshot is None:
+        return jsonify({'error': 'Snapshot não encontrado. Envie o arquivo novamente.'}), 404
+    with snapshot['lock']:
+        alertas = listar_alertas(alertas_do_snapshot(snapshot))
+    return jsonify({'snapshot_id': snapshot_id, 'alertas': alertas})
+
+def _preco_valido(valor):
+    """Preço de alteração do what-if: número finito e positivo (não aceita bool nem texto)."""
+    if isinstance(valor, bool):
+        return False
+    try:
+        valor = float(valor)
+    except (TypeError, ValueError):
+        return False
+    return bool(np.isfinite(valor)) and valor > 0
+
+@app.route('/snapshots/<snapshot_id>/what-if', methods=['POST'])
+def what_if_route(snapshot_id):
+    """Simula novos preços para alguns produtos sem reenviar o CSV.
+
+    Corpo: {"alteracoes": [{"Produto": "...", "preco": 99.9, "Lojista": "opcional"}]}
+    O preco é à vista; num snapshot com ?preco=efetivo vira o efetivo pelo parcelamento da oferta.
+    ?vitoria=1 devolve, para cada alteração no preço do líder, a probabilidade de ele seguir em 1º
+    (modelo de vitória do registro; ?versao=<n>|latest).
+    """
+    snapshot = obter_snapshot(snapshot_id)
+    if snapshot is None:
+        return jsonify({'error': 'Snapshot não encontrado. Envie o arquivo novamente.'}), 404
+    payload = request.get_json(silent=True) or {}
+    alteracoes = payload.get('alteracoes') or []
+    if (not isinstance(alteracoes, list) or not alteracoes
+            or any(not isinstance(a, dict) or 'Produto' not in a or 'preco' not in a for a in alteracoes)):
+        return jsonify({'error': 'Informe "alteracoes" como lista de {"Produto", "preco"}.'}), 400
+    invalidos = [a['preco'] for a in alteracoes if not _preco_valido(a['preco'])]
+    if invalidos:
+        return jsonify({'error': f'preco deve ser um número positivo; recebido: {invalidos[:5]}'}), 400
+    modelo_vitoria = None
+    if request.args.get('vitoria') in ('1', 'true'):
+        carregado = carregar_modelo_vitoria(request.args.get('versao'))
+        if carregado is None:
+            return jsonify({'error': MENSAGEM_SEM_MODELO_VITORIA}), 404
+        modelo_vitoria = carregado[0]
+    with snapshot['lock']:
+        result = simular_precos(snapshot, alteracoes, modelo_vitoria=modelo_vitoria)
+    if 'error' in result:
+        return jsonify(result), 400
+    return jsonify({'snapshot_id': snapshot_id, **result})
+
+@app.route('/snapshots/<snapshot_id>/vitoria', methods=['POST'])
+def vitoria_route(snapshot_id):
+    """Probabilidade de cada líder seguir em 1º numa grade de preços candidatos.
+
+    Corpo (opcional): {"aumentos_pct": [0, 1, 2, 5], "precos": {"Produto": [99.9, 104.9]},
+    "produtos": ["..."], "probabilidade_minima": 0.8}. Os "precos" são à vista, como no what-if; num
+    snapshot com ?preco=efetivo a grade sai também à vista. Sem "precos" vale a mesma grade de aumentos
+    para todos os produtos (ou só os de "produtos"); com "probabilidade_minima" sai também o maior
+    preço da grade que segura o 1º lugar com essa probabilidade. ?versao=<n>|latest escolhe o modelo.
+    """
+    snapshot = obter_snapshot(snapshot_id)
+    if snapshot is None:
+        return jsonify({'error': 'Snapshot não encontrado. Envie o arquivo novamente.'}), 404
+    carregado = carregar_modelo_vitoria(request.args.get('versao'))
+    if carregado is None:
+        return jsonify({'error': MENSAGEM_SEM_MODELO_VITORIA}), 404
+    payload = request.get_json(silent=True) or {}
+    aumentos = payload.get('aumentos_pct')
+    precos = payload.get('precos')
+    produtos = payload.get('produtos')
+    minima = payload.get('probabilidade_minima')
+    try:
+        aumentos = [float(a) for a in aumentos] if aumentos is not None else None
+        precos = {p: [float(v) for v in lista] for p, lista in precos.items()} if precos else None
+        minima = float(minima) if minima is not None else None
+    except (AttributeError, TypeError, ValueError):
+        return jsonify({'error': 'aumentos_pct deve ser uma lista de números, precos um objeto '
+                                 '{Produto: [preços]} e probabilidade_minima um número.'}), 400
+    if minima is not None and not 0 <= minima <= 1:
+        return jsonify({'error': 'probabilidade_minima deve estar entre 0 e 1.'}), 400
+    with snapshot['lock']:
+        df, indice = snapshot['df'], snapshot['indice_produtos']
+        escolhidos = list(precos) if precos else produtos
+        if escolhidos:
+            desconhecidos = sorted({str(p) for p in escolhidos if p not in indice})
+            if desconhecidos:
+                return jsonify({'error': f'Produtos não encontrados no snapshot: {desconhecidos}'}), 400
+            df = df.loc[df.index[np.concatenate([indice[p] for p in escolhidos])]]
+        lideres = lideres_do_snapshot(df)
+        fatores_caixa = fatores_caixa_dos_lideres(df, lideres)
+    result = simular_grade(lideres, carregado[0], aumentos_pct=aumentos, precos=precos, probabilidade_minima=minima,
+                           fatores_caixa=fatores_caixa)
+    if 'error' in result:
+        return jsonify(result), 400
+    return jsonify({'snapshot_id': snapshot_id, 'modelo': carregado[1]['nome'], 'versao': carregado[1]['versao'],
+                    **result})
+
+@app.route('/snapshots/<snapshot_id>/otimizar', methods=['POST'])
+def otimizar_route(snapshot_id):
+    """Novos preços para a carteira inteira dentro do ajuste seguro.
+
+    Corpo (opcional): {"limite_percentual": 3, "max_alteracoes": 500}
+    Num snapshot com ?preco=efetivo cada alteração traz também Preço_Otimizado_Caixa, o à vista para o what-if.
+    """
+    snapshot = obter_snapshot(snapshot_id)
+    if snapshot is None:
+        return jsonify({'error': 'Snapshot não encontrado. Envie o arquivo novamente.'}), 404
+    payload = request.get_json(silent=True) or {}
+    try:
+        limite = float(payload.get('limite_percentual', 3))
+        max_alteracoes = payload.get('max_alteracoes')
+        max_alteracoes = int(max_alteracoes) if max_alteracoes is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'limite_percentual e max_alteracoes devem ser numéricos.'}), 400
+    if limite <= 0:
+        return jsonify({'error': 'limite_percentual deve ser maior que zero.'}), 400
+    with snapshot['lock']:
+        result = otimizar_portfolio(snapshot['df'], limite_percentual=limite, max_alteracoes=max_alteracoes)
+    if 'error' in result:
+        return jsonify(result), 400
+    return jsonify({'snapshot_id': snapshot_id, **result})
 
 @app.route('/')
 def root():
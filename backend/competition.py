@@ -0,0 +1,95 @@
+"""Métricas de concorrência por produto e por cluster.
+
+Usa os preços das ofertas e as colunas N° DE LOJAS / SELLERS do export para
+dizer o quão disputado está cada produto. Como o export não traz volume de
+vendas, o HHI usa como participação de cada oferta o inverso do preço
+normalizado dentro do produto (quem é mais barato leva mais demanda): uma
+oferta isolada dá 10000 e n ofertas com o mesmo preço dão 10000 / n.
+
+Tudo sai de uma única agregação agrupada por produto; o rollup por cluster
+parte dessa tabela, que tem uma linha por produto.
+"""
+import numpy as np
+import pandas as pd
+
+COLUNAS_CONCORRENCIA = [
+    'Ofertas_Produto', 'Lojas_Mercado', 'Sellers_Mercado', 'HHI_Preco', 'Nivel_Concorrencia',
+    'Spread_Preco_Pct', 'CV_Preco_Pct',
+]
+
+# Faixas usuais do HHI (10000 = monopólio)
+FAIXAS_HHI = [(2500, 'Concentrado'), (1500, 'Moderado'), (0, 'Pulverizado')]
+
+
+def _nivel(hhi):
+    nivel = np.full(len(hhi), '', dtype=object)
+    for limite, rotulo in reversed(FAIXAS_HHI):
+        nivel[hhi.to_numpy() >= limite] = rotulo
+    return nivel
+
+
+def metricas_concorrencia(df):
+    """Tabela (uma linha por produto) com as métricas de concorrência."""
+    precos = pd.to_numeric(df['Preço'], errors='coerce').astype('float64')
+    precos = precos.where(precos > 0)
+    base = pd.DataFrame({'preco': precos, 'inverso': 1 / precos, 'inverso_2': 1 / precos ** 2}, index=df.index)
+    agregacoes = {
+        'ofertas': ('preco', 'count'),
+        'minimo': ('preco', 'min'),
+        'maximo': ('preco', 'max'),
+        'media': ('preco', 'mean'),
+        'desvio': ('preco', 'std'),
+        'soma_inverso': ('inverso', 'sum'),
+        'soma_inverso_2': ('inverso_2', 'sum'),
+    }
+    for coluna, nome in (('Num_Lojas', 'lojas'), ('Sellers', 'sellers')):
+        if coluna in df.columns:
+            base[nome] = pd.to_numeric(df[coluna], errors='coerce')
+            agregacoes[nome] = (nome, 'max')
+    base['Produto'] = df['Produto']
+    if 'Cluster' in df.columns:
+        base['Cluster'] = df['Cluster'].astype(str)
+        agregacoes['Cluster'] = ('Cluster', 'first')
+
+    por_produto = base.groupby('Produto', sort=False).agg(**agregacoes)
+
+    hhi = (por_produto['soma_inverso_2'] / por_produto['soma_inverso'] ** 2 * 10000).round(0)
+    ofertas = por_produto['ofertas']
+    metricas = pd.DataFrame({
+        'Ofertas_Produto': ofertas.astype('int64'),
+        'Lojas_Mercado': por_produto.get('lojas', ofertas).fillna(ofertas).astype('int64'),
+        'Sellers_Mercado': por_produto.get('sellers', ofertas).fillna(ofertas).astype('int64'),
+        'HHI_Preco': hhi,
+        'Nivel_Concorrencia': _nivel(hhi),
+        'Spread_Preco_Pct': ((por_produto['maximo'] - por_produto['minimo']) / por_produto['minimo'] * 100).round(2),
+        'CV_Preco_Pct': (por_produto['desvio'].fillna(0) / por_produto['media'] * 100).round(2),
+    }, index=por_produto.index)
+    if 'Cluster' in por_produto:
+        metricas['Cluster'] = por_produto['Cluster']
+    centavos = pd.api.types.is_integer_dtype(df['Preço'])
+    metricas['Preco_Medio'] = por_produto['media'] / 100 if centavos else por_produto['media']
+    return metricas
+
+
+def anexar_concorrencia(sugestoes, metricas):
+    """Acrescenta as métricas do produto em cada sugestão."""
+    colunas = metricas[COLUNAS_CONCORRENCIA].reindex(sugestoes['Produto'].to_numpy())
+    colunas.index = sugestoes.index
+    return pd.concat([sugestoes, colunas], axis=1)
+
+
+def concorrencia_por_cluster(metricas):
+    """Rollup por CÓDIGO CLUSTER (cluster da primeira oferta do produto)."""
+    cluster = metricas['Cluster'] if 'Cluster' in metricas else pd.Series('Sem cluster', index=metricas.index)
+    tabela = metricas.assign(Cluster=cluster, Concentrado=metricas['Nivel_Concorrencia'] == 'Concentrado')
+    resumo = tabela.groupby('Cluster', sort=True).agg(
+        produtos=('Ofertas_Produto', 'size'),
+        ofertas=('Ofertas_Produto', 'sum'),
+        hhi_medio=('HHI_Preco', 'mean'),
+        sellers_medio=('Sellers_Mercado', 'mean'),
+        spread_medio_pct=('Spread_Preco_Pct', 'mean'),
+        cv_medio_pct=('CV_Preco_Pct', 'mean'),
+        preco_medio=('Preco_Medio', 'mean'),
+        produtos_concentrados=('Concentrado', 'sum'),
+    )
+    return resumo.round(2).reset_index().to_dict(orient='records')
@@ -0,0 +1,135 @@
+"""Remoção de ofertas quase duplicadas do mesmo lojista.
+
+Exports do WebPrice às vezes repetem a mesma oferta com pequenas variações
+de nome ou de espaços, o que infla o status_counts e os totais. Os nomes
+normalizados de cada (Lojista, Produto) distinto recebem uma assinatura
+MinHash sobre trigramas de caracteres; com LSH (bandas da assinatura como
+chave de bucket, junto com o lojista e os tokens numéricos) só nomes que
+caem no mesmo bucket são comparados (todos os pares de cada bucket), e o
+par só é unido se a similaridade de Jaccard estimada passar do limiar. O
+custo é linear no número de nomes mais o número de pares candidatos, que
+fica pequeno porque nomes idênticos já saem juntos antes do LSH.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from matching import normalizar_nomes
+
+MODOS_DUPLICATAS = ['manter', 'colapsar']
+
+
+def _trigramas(normalizados):
+    """(documento, código do trigrama) de todos os nomes, sem loop em Python.
+
+    Os nomes normalizados são ASCII, então cada trigrama vira um inteiro de
+    24 bits lido direto do buffer com todos os nomes concatenados.
+    """
+    textos = ' ' + normalizados.astype(str) + ' '
+    comprimentos = textos.str.len().to_numpy()
+    buffer = np.frombuffer(''.join(textos.tolist()).encode('ascii'), dtype=np.uint8).astype(np.uint32)
+    deslocamentos = np.concatenate([[0], np.cumsum(comprimentos)[:-1]])
+    quantidades = np.maximum(comprimentos - 2, 0)
+    primeiros = np.concatenate([[0], np.cumsum(quantidades)[:-1]])
+    posicoes = np.arange(quantidades.sum()) + np.repeat(deslocamentos - primeiros, quantidades)
+    codigos = (buffer[posicoes] << 16) | (buffer[posicoes + 1] << 8) | buffer[posicoes + 2]
+    return quantidades, codigos.astype(np.uint64)
+
+
+def assinaturas_minhash(normalizados, num_perm=32, semente=42):
+    """Matriz (len(normalizados), num_perm) de MinHash dos trigramas de cada nome.
+
+    Cada permutação é um hash multiply-shift ((a*x + b) mod 2^64) >> 32, que
+    em uint64 não precisa de módulo explícito.
+    """
+    quantidades, codigos = _trigramas(normalizados)
+    gerador = np.random.default_rng(semente)
+    a = gerador.integers(1, np.iinfo(np.int64).max, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = gerador.integers(0, np.iinfo(np.int64).max, size=num_perm, dtype=np.uint64)
+
+    assinaturas = np.full((len(quantidades), num_perm), np.iinfo(np.uint32).max, dtype=np.uint64)
+    com_trigrama = quantidades > 0
+    inicios = (np.cumsum(quantidades) - quantidades)[com_trigrama]
+    for k in range(num_perm):
+        valores = (a[k] * codigos + b[k]) >> np.uint64(32)
+        assinaturas[com_trigrama, k] = np.minimum.reduceat(valores, inicios)
+    return assinaturas
+
+
+def _pares_no_bucket(ordem, bucket):
+    """Todos os pares (i, j) de cada sequência de ``bucket`` iguais, agrupando as sequências por tamanho."""
+    inicios = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    tamanhos = np.diff(np.r_[inicios, len(bucket)])
+    pares_i, pares_j = [], []
+    for tamanho in np.unique(tamanhos[tamanhos > 1]):
+        a, b = np.triu_indices(tamanho, 1)
+        base = inicios[tamanhos == tamanho][:, None]
+        pares_i.append(ordem[(base + a).ravel()])
+        pares_j.append(ordem[(base + b).ravel()])
+    return pares_i, pares_j
+
+
+def _pares_lsh(assinaturas, chave_grupo, bandas):
+    """Pares (i, j), i < j, que dividem algum bucket (grupo, banda, hash da banda), sem repetição."""
+    linhas_por_banda = assinaturas.shape[1] // bandas
+    pares_i, pares_j = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+    for banda in range(bandas):
+        fatia = assinaturas[:, banda * linhas_por_banda:(banda + 1) * linhas_por_banda]
+        chave = pd.DataFrame(fatia.astype(np.int64))
+        chave['grupo'] = chave_grupo
+        bucket = pd.util.hash_pandas_object(chave, index=False).to_numpy()
+        ordem = np.argsort(bucket, kind='stable')
+        banda_i, banda_j = _pares_no_bucket(ordem, bucket[ordem])
+        pares_i += banda_i
+        pares_j += banda_j
+    i, j = np.concatenate(pares_i).astype(np.int64), np.concatenate(pares_j).astype(np.int64)
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    pares = np.unique(i * len(assinaturas) + j)
+    return pares // len(assinaturas), pares % len(assinaturas)
+
+
+def deduplicar_ofertas(df, limiar=0.8, num_perm=32, bandas=8):
+    """Marca as ofertas repetidas do mesmo lojista (fica a primeira do arquivo).
+
+    Retorna (duplicada, relatorio): ``duplicada`` é uma série booleana
+    alinhada a ``df`` com as linhas a descartar.
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    inicio = time.perf_counter()
+    chaves = pd.DataFrame({'Lojista': df['Lojista'].astype(str).to_numpy(),
+                           'Produto': df['Produto'].astype(str).to_numpy()})
+    codigo, distintos = pd.MultiIndex.from_frame(chaves).factorize()
+    distintos = distintos.to_frame(index=False, name=['Lojista', 'Produto'])
+
+    normalizados = normalizar_nomes(distintos['Produto'])
+    numericos = normalizados.str.findall(r'\b\w*\d\w*\b').map(lambda t: ' '.join(sorted(t)))
+    chave_grupo = pd.util.hash_pandas_object(
+        pd.DataFrame({'Lojista': distintos['Lojista'], 'numericos': numericos}), index=False).to_numpy()
+
+    # Nomes iguais depois da normalização já são duplicatas; o resto passa pelo LSH
+    normalizado_idx = pd.util.hash_pandas_object(
+        pd.DataFrame({'grupo': chave_grupo, 'nome': normalizados}), index=False).to_numpy()
+    _, primeiro_nome = np.unique(normalizado_idx, return_index=True)
+    representante = pd.Series(primeiro_nome, index=normalizado_idx[primeiro_nome])
+    raiz = representante.loc[normalizado_idx].to_numpy()
+
+    unicos = np.sort(primeiro_nome)
+    assinaturas = assinaturas_minhash(normalizados.iloc[unicos], num_perm=num_perm)
+    i, j = _pares_lsh(assinaturas, chave_grupo[unicos], bandas)
+    similares = (assinaturas[i] == assinaturas[j]).mean(axis=1) >= limiar
+    arestas_i = np.concatenate([np.arange(len(distintos)), unicos[i[similares]]])
+    arestas_j = np.concatenate([raiz, unicos[j[similares]]])
+    grafo = coo_matrix((np.ones(len(arestas_i)), (arestas_i, arestas_j)), shape=(len(distintos),) * 2)
+    _, componente = connected_components(grafo, directed=False)
+
+    duplicada = pd.Series(pd.Series(componente[codigo]).duplicated().to_numpy(), index=df.index)
+    relatorio = {
+        'ofertas_duplicadas_removidas': int(duplicada.sum()),
+        'ofertas_com_duplicata': int(pd.Series(componente[codigo[duplicada.to_numpy()]]).nunique()),
+        'pares_lsh_verificados': int(len(i)),
+        'limiar_jaccard': limiar,
+        'tempo_ms': round((time.perf_counter() - inicio) * 1000, 2),
+    }
+    return duplicada, relatorio
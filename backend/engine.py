@@ -0,0 +1,328 @@
+"""Motor de análise de preços compartilhado pelos servidores Flask.
+
+Reúne as etapas vetorizadas da análise do CSV exportado pelo WebPrice para
+que as rotas só precisem cuidar da parte HTTP.
+"""
+import numpy as np
+import pandas as pd
+
+
+def reconstruir_ranking(df, coluna_produto='Produto', coluna_preco='Preço'):
+    """Reconstrói o RANKING de cada oferta a partir do preço dentro do produto.
+
+    Segue a semântica do WebPrice: o menor preço fica em 1º, preços empatados
+    dividem a mesma posição e o próximo preço distinto ocupa a posição
+    seguinte (ranking denso). Ofertas sem preço válido ficam sem ranking.
+    Tudo é feito em uma única operação agrupada.
+    """
+    precos = pd.to_numeric(df[coluna_preco], errors='coerce')
+    precos = precos.where(precos > 0)
+    return precos.groupby(df[coluna_produto], sort=False).rank(method='dense')
+
+
+def status_por_ranking(df, coluna_produto='Produto', coluna_ranking='RANKING'):
+    """Deriva o Status do WebPrice a partir do ranking reconstruído.
+
+    1º lugar isolado vira GANHANDO, 1º lugar dividido vira EMPATANDO e as
+    demais posições viram PERDENDO.
+    """
+    ranking = df[coluna_ranking]
+    primeiro = ranking == 1
+    empatados = primeiro.groupby(df[coluna_produto], sort=False).transform('sum') > 1
+    status = np.where(primeiro & empatados, 'EMPATANDO', np.where(primeiro, 'GANHANDO', 'PERDENDO'))
+    return pd.Series(status, index=df.index).where(ranking.notna(), '')
+
+
+def refazer_ranking(df, linhas=None, refazer_status=True):
+    """Reconstrói RANKING (e Status) nas ``linhas`` indicadas (todas se None), no próprio df.
+
+    Usado quando uma etapa muda a composição ou os preços de alguns produtos
+    (nomes unificados, duplicatas removidas, preço efetivo) e o ranking do
+    arquivo deixa de valer para eles.
+    """
+    grupo = df if linhas is None else df[linhas]
+    # Agrupa pelo código inteiro do produto: fatoriza os nomes uma vez só
+    base = pd.DataFrame({'Produto': pd.factorize(grupo['Produto'])[0], 'Preço': grupo['Preço']}, index=grupo.index)
+    ranking = reconstruir_ranking(base)
+    if refazer_status:
+        status = status_por_ranking(base.assign(RANKING=ranking))
+    if linhas is None:
+        if 'RANKING' in df.columns:
+            df['RANKING'] = ranking
+        if refazer_status:
+            df['Status'] = status
+        return
+    if 'RANKING' in df.columns:
+        df['RANKING'] = pd.to_numeric(df['RANKING'], errors='coerce')
+        df.loc[linhas, 'RANKING'] = ranking
+    if refazer_status:
+        df.loc[linhas, 'Status'] = status
+
+
+# ---------------------------------------------------------------------------
+# Valores monetários
+# ---------------------------------------------------------------------------
+# No modo centavos todas as colunas monetárias viram int64 logo após a leitura
+# do CSV. Os multiplicadores das estratégias são aplicados em pontos-base
+# (0.90 -> 9000) com arredondamento comercial (meio centavo para cima), e a
+# conversão para reais só acontece na montagem da resposta.
+
+COLUNAS_MONETARIAS = ['Preço', 'Preço_Concorrente', 'Diferença_Raw_CSV', 'Valor_Parcela']
+
+
+def para_centavos(valores):
+    """Converte uma série em reais (já numérica) para int64 em centavos."""
+    reais = pd.to_numeric(valores, errors='coerce').fillna(0).to_numpy(dtype='float64')
+    return pd.Series(np.rint(reais * 100).astype('int64'), index=getattr(valores, 'index', None))
+
+
+def centavos_para_reais(valores):
+    """Converte centavos para reais apenas na saída; floats passam direto."""
+    if pd.api.types.is_integer_dtype(valores):
+        return valores / 100
+    return valores
+
+
+def aplicar_fator(valores, fator):
+    """Multiplica preços por um fator com arredondamento explícito.
+
+    Em centavos o fator vira pontos-base e o arredondamento é meio para cima
+    em aritmética inteira; em reais (float) mantém o ``round(x, 2)`` antigo.
+    """
+    if pd.api.types.is_integer_dtype(valores):
+        pontos_base = int(round(fator * 10000))
+        return (valores * pontos_base + 5000) // 10000
+    return (valores * fator).round(2)
+
+
+def _arredondar_reais(valores):
+    if pd.api.types.is_integer_dtype(valores):
+        return valores
+    return valores.round(2)
+
+
+# ---------------------------------------------------------------------------
+# Preço efetivo (parcelamento)
+# ---------------------------------------------------------------------------
+# NO DE PARCELAS x VALOR DA PARCELA dá o total parcelado. Para comparar uma
+# oferta parcelada com uma à vista, as parcelas são trazidas a valor presente
+# com uma taxa mensal (custo do dinheiro do comprador): 12x sem juros vale
+# menos que o preço à vista, 12x com juros pode valer mais. O preço efetivo é
+# o menor entre o à vista e o valor presente do parcelamento, já que o
+# comprador escolhe a forma de pagamento.
+
+TAXA_MENSAL_PADRAO = 0.01
+
+MODOS_PRECO = ['caixa', 'efetivo']
+
+
+def precos_efetivos(df, taxa_mensal=TAXA_MENSAL_PADRAO):
+    """Total parcelado, prêmio sobre o à vista e preço efetivo de cada oferta.
+
+    Ofertas sem parcelamento informado (ou à vista) ficam com o preço à vista.
+    Em centavos o resultado continua int64.
+    """
+    preco = df['Preço']
+    parcelas = pd.to_numeric(df['Parcelas'], errors='coerce').fillna(0).to_numpy(dtype='float64')
+    valor_parcela = df['Valor_Parcela'].to_numpy(dtype='float64')
+    parcelado = (parcelas > 1) & (valor_parcela > 0)
+    total = np.where(parcelado, parcelas * valor_parcela, preco.to_numpy(dtype='float64'))
+
+    fator_vp = np.ones_like(parcelas)
+    if taxa_mensal > 0:
+        fator_vp[parcelado] = (1 - (1 + taxa_mensal) ** -parcelas[parcelado]) / (taxa_mensal * parcelas[parcelado])
+    efetivo = np.minimum(preco.to_numpy(dtype='float64'), total * fator_vp)
+
+    em_centavos = pd.api.types.is_integer_dtype(preco)
+    arredondar = (lambda v: np.rint(v).astype('int64')) if em_centavos else (lambda v: np.round(v, 2))
+    com_preco = preco.to_numpy() > 0
+    premio = np.divide(total - preco.to_numpy(), preco.to_numpy(), out=np.zeros(len(preco)), where=com_preco) * 100
+    return pd.DataFrame({
+        'Total_Parcelado': arredondar(total),
+        'Premio_Parcelamento_Pct': np.round(premio, 2),
+        'Preço_Efetivo': np.where(com_preco, arredondar(efetivo), preco.to_numpy()),
+    }, index=df.index)
+
+
+def anexar_precos_caixa(sugestoes, fator_caixa):
+    """Traduz preço atual e sugerido (efetivos) de volta para o à vista.
+
+    ``fator_caixa`` é à vista / efetivo de cada oferta, ou seja, mantém o
+    mesmo plano de parcelamento aplicado ao novo preço.
+    """
+    fator = fator_caixa.reindex(sugestoes.index).fillna(1.0)
+
+    def para_caixa(valores):
+        if pd.api.types.is_integer_dtype(valores):
+            return pd.Series(np.rint(valores * fator).astype('int64'), index=valores.index)
+        return (valores * fator).round(2)
+
+    return sugestoes.assign(Preço_Caixa_Atual=para_caixa(sugestoes['Preço_Atual']),
+                            Preço_Sugerido_Caixa=para_caixa(sugestoes['Preço_Sugerido']))
+
+
+# ---------------------------------------------------------------------------
+# Outliers
+# ---------------------------------------------------------------------------
+
+def detectar_outliers(df, limite=3.5, min_ofertas=3, piso_mad=0.10):
+    """Marca ofertas com preço absurdo para o produto (ex.: 29,90 lido como 2990).
+
+    Usa o z-score modificado 0.6745 * |x - mediana| / MAD, com mediana e MAD
+    calculados por produto sobre todas as ofertas em operações agrupadas
+    (custo linear no número de linhas). O MAD tem piso de ``piso_mad`` x
+    mediana para que preços quase iguais não virem outlier, e produtos com
+    menos de ``min_ofertas`` ofertas não são avaliados.
+
+    Retorna (outlier_oferta, outlier_concorrente): a segunda série avalia o
+    MAIS BARATO da linha contra as mesmas estatísticas do produto.
+    """
+    precos = pd.to_numeric(df['Preço'], errors='coerce').astype('float64')
+    precos = precos.where(precos > 0)
+    produto = df['Produto']
+    grupos = precos.groupby(produto, sort=False)
+    mediana = grupos.transform('median')
+    ofertas = grupos.transform('count')
+    desvio = (precos - mediana).abs()
+    mad = desvio.groupby(produto, sort=False).transform('median')
+    escala = np.maximum(mad, piso_mad * mediana) / 0.6745
+    avaliavel = ofertas >= min_ofertas
+
+    outlier_oferta = avaliavel & (desvio / escala > limite)
+    if 'Preço_Concorrente' in df.columns:
+        concorrente = pd.to_numeric(df['Preço_Concorrente'], errors='coerce').astype('float64')
+        outlier_concorrente = avaliavel & (concorrente > 0) & ((concorrente - mediana).abs() / escala > limite)
+    else:
+        outlier_concorrente = pd.Series(False, index=df.index)
+    return outlier_oferta.fillna(False), outlier_concorrente.fillna(False)
+
+
+# ---------------------------------------------------------------------------
+# Estratégias
+# ---------------------------------------------------------------------------
+
+def sugestoes_por_ranking(df, fator=0.90):
+    """Proteção de margem para quem está em 1º, olhando o 2º colocado.
+
+    Para cada oferta com RANKING 1 busca o preço da primeira oferta com
+    RANKING 2 do mesmo produto e sugere ``fator`` x esse preço quando isso
+    aumenta o nosso; caso contrário recomenda manter o preço. Ofertas com
+    preço zero (ou vazio) ficam de fora: não há percentual de ajuste sobre elas.
+    """
+    segundo = df[df['RANKING'] == 2].drop_duplicates('Produto').set_index('Produto')['Preço']
+    ganhando = df[df['RANKING'] == 1]
+    ganhando = ganhando[ganhando['Produto'].isin(segundo.index) & (ganhando['Preço'] > 0)]
+
+    nosso = ganhando['Preço']
+    concorrente = ganhando['Produto'].map(segundo).astype(nosso.dtype)
+    otimo = aplicar_fator(concorrente, fator)
+    aumenta = otimo > nosso
+    sugerido = otimo.where(aumenta, nosso)
+    ajuste = _arredondar_reais(sugerido - nosso)
+
+    resultado = pd.DataFrame({
+        'Produto': ganhando['Produto'],
+        'Lojista': ganhando['Lojista'],
+        'Ranking_Atual': 1,
+        'Preço_Atual': nosso,
+        'Preço_Concorrente_Abaixo': concorrente,
+        'Preço_Sugerido': sugerido,
+        'Valor_Ajuste': ajuste,
+        'Percentual_Ajuste': (ajuste / nosso * 100).round(2),
+        'Margem_Extra_RS': ajuste,
+        'Diferença_vs_Concorrente': _arredondar_reais(concorrente - sugerido),
+        'Status': 'GANHANDO',
+        'Tipo_Ajuste': np.where(aumenta, 'Proteção da Margem', 'Manter Preço'),
+        'Competitividade': np.where(aumenta, f'Mantida ({round((1 - fator) * 100)}% abaixo do concorrente)',
+                                    'Ótima - preço já bem posicionado'),
+    })
+    return resultado
+
+
+def sugestoes_por_status(df, fator=0.95):
+    """Fallback sem ranking: ofertas GANHANDO (com preço) comparadas ao MAIS BARATO."""
+    ganhando = df[(df['Status'] == 'GANHANDO') & (df['Preço'] > 0)]
+    nosso = ganhando['Preço']
+    concorrente = ganhando['Preço_Concorrente']
+    otimo = aplicar_fator(concorrente, fator)
+    ganhando = ganhando[otimo > nosso]
+    nosso, concorrente, otimo = nosso[ganhando.index], concorrente[ganhando.index], otimo[ganhando.index]
+    ajuste = _arredondar_reais(otimo - nosso)
+
+    return pd.DataFrame({
+        'Produto': ganhando['Produto'],
+        'Lojista': ganhando['Lojista'],
+        'Preço_Atual': nosso,
+        'Preço_Concorrente': concorrente,
+        'Preço_Sugerido': otimo,
+        'Valor_Ajuste': ajuste,
+        'Percentual_Ajuste': (ajuste / nosso * 100).round(2),
+        'Margem_Extra_RS': ajuste,
+        'Status': 'GANHANDO',
+        'Tipo_Ajuste': 'Proteção da Margem',
+        'Competitividade': f'Mantida ({round((1 - fator) * 100)}% abaixo do concorrente)',
+    })
+
+
+COLUNAS_SAIDA_MONETARIAS = [
+    'Preço_Atual', 'Preço_Concorrente_Abaixo', 'Preço_Concorrente', 'Preço_Sugerido',
+    'Valor_Ajuste', 'Margem_Extra_RS', 'Diferença_vs_Concorrente', 'Preço_Caixa_Atual', 'Preço_Sugerido_Caixa',
+]
+
+
+def formatar_sugestoes(sugestoes):
+    """Ordena por Margem_Extra_RS e converte para a lista de dicts da API."""
+    sugestoes = sugestoes.sort_values('Margem_Extra_RS', ascending=False, kind='stable')
+    saida = sugestoes.copy()
+    for coluna in COLUNAS_SAIDA_MONETARIAS:
+        if coluna in saida.columns:
+            saida[coluna] = centavos_para_reais(saida[coluna]).astype(float)
+    return saida.to_dict(orient='records')
+
+
+def totais_sugestoes(sugestoes):
+    """Totais aditivos das sugestões (ganho na unidade interna do engine)."""
+    return {
+        'sugestoes': len(sugestoes),
+        'oportunidades': int((sugestoes['Valor_Ajuste'] > 0).sum()),
+        'ganho': sugestoes['Margem_Extra_RS'].sum(),
+    }
+
+
+def resumo_de_totais(totais, centavos=True):
+    """Monta o card de insights a partir dos totais; somas exatas em centavos."""
+    quantidade = totais['sugestoes']
+    if centavos:
+        total = int(totais['ganho'])
+        total_reais = total / 100
+        medio = (2 * total + quantidade) // (2 * quantidade) / 100 if quantidade else 0.0
+    else:
+        total = float(totais['ganho'])
+        total_reais = round(total, 2)
+        medio = round(total / max(quantidade, 1), 2)
+    return {
+        'total_produtos_analisados': quantidade,
+        'produtos_com_oportunidade_margem': totais['oportunidades'],
+        'ganho_potencial_total_rs': total_reais,
+        'ganho_medio_por_produto': medio,
+    }
+
+
+def resumo_sugestoes(sugestoes):
+    """Totais do card de insights calculados sobre todas as sugestões."""
+    centavos = pd.api.types.is_integer_dtype(sugestoes['Margem_Extra_RS'])
+    return resumo_de_totais(totais_sugestoes(sugestoes), centavos=centavos)
+
+
+def secoes_solicitadas(fields, disponiveis, padrao):
+    """Interpreta o parâmetro ``fields=a,b`` das rotas de análise.
+
+    Retorna {'secoes': [...]} ou {'error': ...} quando há seção desconhecida.
+    """
+    if not fields:
+        return {'secoes': list(padrao)}
+    pedidas = [f.strip() for f in fields.split(',') if f.strip()]
+    invalidas = [f for f in pedidas if f not in disponiveis]
+    if invalidas:
+        return {'error': f'Seções inválidas em fields: {invalidas}. Disponíveis: {list(disponiveis)}'}
+    return {'secoes': pedidas}
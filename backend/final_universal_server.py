@@ -6,6 +6,9 @@ import numpy as np
 from io import StringIO
 import re
 
+from alerts import avaliar_alertas, listar_alertas, regras_aplicaveis
+from engine import secoes_solicitadas
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -13,6 +16,10 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
+# Seções pesadas de 'analise' que podem ser omitidas via ?fields=; os totais
+# dos cards de resumo sempre vêm
+SECOES_ANALISE = ['detalhes_produtos', 'resumo_por_lojista', 'alertas']
+
 def clean_price_value(value):
     """Converte valor monetário brasileiro para float"""
     if pd.isna(value):
@@ -155,8 +162,8 @@ def map_columns_to_standard(df):
     
     return column_mapping
 
-def analyze_competitive_pricing(df, column_mapping):
-    """Análise de precificação competitiva"""
+def analyze_competitive_pricing(df, column_mapping, secoes=SECOES_ANALISE):
+    """Análise de precificação competitiva (só monta as ``secoes`` pedidas)"""
     logger.info("🚀 Iniciando análise de precificação competitiva...")
     
     results = {
@@ -169,6 +176,8 @@ def analyze_competitive_pricing(df, column_mapping):
         'resumo_por_lojista': {},
         'alertas': []
     }
+    com_detalhes = 'detalhes_produtos' in secoes
+    com_resumo_lojista = 'resumo_por_lojista' in secoes
     
     # Colunas essenciais
     produto_col = column_mapping.get('produto')
@@ -205,31 +214,33 @@ def analyze_competitive_pricing(df, column_mapping):
             results['margem_media_perda'] += margem
         
         # Resumo por lojista
-        if lojista not in results['resumo_por_lojista']:
-            results['resumo_por_lojista'][lojista] = {
-                'produtos': 0,
-                'ganhando': 0,
-                'perdendo': 0,
-                'receita_total': 0
-            }
-        
-        results['resumo_por_lojista'][lojista]['produtos'] += 1
-        results['resumo_por_lojista'][lojista]['receita_total'] += preco
-        
-        if 'GANHAND' in status:
-            results['resumo_por_lojista'][lojista]['ganhando'] += 1
-        elif 'PERDEND' in status:
-            results['resumo_por_lojista'][lojista]['perdendo'] += 1
+        if com_resumo_lojista:
+            if lojista not in results['resumo_por_lojista']:
+                results['resumo_por_lojista'][lojista] = {
+                    'produtos': 0,
+                    'ganhando': 0,
+                    'perdendo': 0,
+                    'receita_total': 0
+                }
+
+            results['resumo_por_lojista'][lojista]['produtos'] += 1
+            results['resumo_por_lojista'][lojista]['receita_total'] += preco
+
+            if 'GANHAND' in status:
+                results['resumo_por_lojista'][lojista]['ganhando'] += 1
+            elif 'PERDEND' in status:
+                results['resumo_por_lojista'][lojista]['perdendo'] += 1
         
         # Detalhes do produto
-        results['detalhes_produtos'].append({
-            'produto': produto,
-            'lojista': lojista,
-            'preco': preco,
-            'mais_barato': mais_barato,
-            'status': status,
-            'margem': round(margem, 2)
-        })
+        if com_detalhes:
+            results['detalhes_produtos'].append({
+                'produto': produto,
+                'lojista': lojista,
+                'preco': preco,
+                'mais_barato': mais_barato,
+                'status': status,
+                'margem': round(margem, 2)
+            })
     
     # Calcular médias
     if results['produtos_ganhando'] > 0:
@@ -239,11 +250,20 @@ def analyze_competitive_pricing(df, column_mapping):
         results['margem_media_perda'] = round(results['margem_media_perda'] / results['produtos_perdendo'], 2)
     
     # Alertas estratégicos
-    if results['produtos_perdendo'] > results['produtos_ganhando']:
-        results['alertas'].append("⚠️ Mais produtos perdendo do que ganhando - revisar precificação")
-    
-    if results['margem_media_perda'] < -20:
-        results['alertas'].append(f"🚨 Margem de perda muito alta: {results['margem_media_perda']}%")
+    if 'alertas' in secoes:
+        resumo = pd.DataFrame([{
+            'ganhando': results['produtos_ganhando'],
+            'perdendo': results['produtos_perdendo'],
+            'perdendo_com_gap': results['produtos_perdendo'],
+            'soma_gap_pct_perdendo': results['margem_media_perda'] * results['produtos_perdendo'],
+        }])
+        estado = avaliar_alertas(resumo, regras=regras_aplicaveis(resumo))
+        results['alertas'] = [alerta['mensagem'] for alerta in listar_alertas(estado)]
+
+    # Seções não pedidas não vão para a resposta
+    for secao in SECOES_ANALISE:
+        if secao not in secoes:
+            del results[secao]
     
     logger.info(f"✅ Análise concluída: {results['produtos_ganhando']} ganhando, {results['produtos_perdendo']} perdendo")
     
@@ -260,6 +280,10 @@ def analyze_file():
     if file.filename == '':
         return jsonify({'error': 'Nome de arquivo vazio'}), 400
     
+    secoes = secoes_solicitadas(request.args.get('fields'), SECOES_ANALISE, SECOES_ANALISE)
+    if 'error' in secoes:
+        return jsonify(secoes), 400
+    
     try:
         # Ler conteúdo do arquivo
         file_content = file.read().decode('utf-8')
@@ -288,7 +312,7 @@ def analyze_file():
             }), 400
         
         # Analisar dados
-        results = analyze_competitive_pricing(df, column_mapping)
+        results = analyze_competitive_pricing(df, column_mapping, secoes['secoes'])
         
         return jsonify({
             'success': True,
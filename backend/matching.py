@@ -0,0 +1,129 @@
+"""Agrupamento de nomes de produto equivalentes entre lojistas.
+
+Cada lojista escreve o mesmo item de um jeito ("Smartphone X 128GB" vs
+"Smartphone X - 128 GB"), e como o engine agrupa pelo texto exato de
+``Produto`` as ofertas nunca se encontram no lookup do 2º colocado.
+
+O casamento roda sobre os nomes distintos, nunca sobre todos os pares:
+1) blocagem: cada nome entra nos blocos (marca, token) dos seus tokens
+   normalizados; blocos gigantes (tokens genéricos) são descartados;
+2) candidatos: pares que dividem algum bloco, obtidos pelo produto esparso
+   da matriz nome x bloco;
+3) similaridade: cosseno de TF-IDF de n-gramas de caracteres, calculado só
+   nos pares candidatos, exigindo os mesmos tokens numéricos (128GB não
+   casa com 256GB);
+4) componentes conexos dos pares aprovados viram um produto canônico, cujo
+   nome é o mais frequente do grupo.
+"""
+import time
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+MODOS_PRODUTOS = ['exato', 'similar']
+
+# Tabela de acentos para str.translate (uma passada, bem mais rápida que NFKD)
+_SEM_ACENTO = str.maketrans({
+    c: unicodedata.normalize('NFKD', c).encode('ascii', 'ignore').decode('ascii')
+    for c in map(chr, range(0xC0, 0x250))
+})
+
+
+def normalizar_nomes(nomes):
+    """Minúsculas, sem acento, só letras/dígitos e unidades coladas ao número."""
+    normalizados = (
+        nomes.astype(str).str.lower().str.translate(_SEM_ACENTO)
+        .str.replace(r'[^a-z0-9]+', ' ', regex=True)
+        .str.replace(r'(\d)\s+([a-z]{1,3})\b', r'\1\2', regex=True)
+        .str.strip()
+    )
+    return normalizados
+
+
+def _pares_candidatos(normalizados, marcas, max_bloco):
+    """Pares (i, j), i < j, de nomes que dividem ao menos um bloco (marca, token)."""
+    from scipy.sparse import csr_matrix, triu
+    tokens = normalizados.str.split().explode().dropna()
+    tokens = tokens[tokens.str.len() > 1]
+    nome_idx = tokens.index.to_numpy()
+    codigo_token, vocabulario = pd.factorize(tokens)
+    blocos, _ = pd.factorize(marcas[nome_idx].astype('int64') * len(vocabulario) + codigo_token)
+    tamanhos = np.bincount(blocos)
+    uteis = (tamanhos[blocos] > 1) & (tamanhos[blocos] <= max_bloco)
+
+    incidencia = csr_matrix(
+        (np.ones(uteis.sum(), dtype='float32'), (nome_idx[uteis], blocos[uteis])),
+        shape=(len(normalizados), len(tamanhos)),
+    )
+    candidatos = triu(incidencia @ incidencia.T, k=1).tocoo()
+    return candidatos.row, candidatos.col
+
+
+def _similaridade(vetores, linhas, colunas, lote=500_000):
+    """Cosseno linha a linha dos pares (vetores já normalizados em L2)."""
+    similaridade = np.empty(len(linhas), dtype='float32')
+    for inicio in range(0, len(linhas), lote):
+        fim = inicio + lote
+        produto = vetores[linhas[inicio:fim]].multiply(vetores[colunas[inicio:fim]])
+        similaridade[inicio:fim] = np.asarray(produto.sum(axis=1)).ravel()
+    return similaridade
+
+
+def agrupar_produtos_similares(df, limiar=0.85, max_bloco=200):
+    """Nome canônico de cada oferta e o relatório do agrupamento.
+
+    Retorna (canonico, relatorio): ``canonico`` é uma série alinhada a
+    ``df`` com o nome de produto a usar na análise.
+    """
+    # scipy e sklearn só quando o modo 'similar' é pedido (o import custa ~1 s)
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    inicio = time.perf_counter()
+    marca = df['Marca'].astype(str) if 'Marca' in df.columns else pd.Series('', index=df.index)
+    chaves = pd.DataFrame({'Marca': marca.to_numpy(), 'Produto': df['Produto'].astype(str).to_numpy()})
+    codigo_nome, nomes = pd.MultiIndex.from_frame(chaves).factorize()
+    nomes = nomes.to_frame(index=False, name=['Marca', 'Produto'])
+    ofertas_por_nome = np.bincount(codigo_nome, minlength=len(nomes))
+
+    normalizados = normalizar_nomes(nomes['Produto'])
+    marcas = pd.factorize(normalizar_nomes(nomes['Marca']))[0]
+    numericos = normalizados.str.findall(r'\b\w*\d\w*\b').map(lambda t: ' '.join(sorted(t)))
+    assinatura_numerica = pd.factorize(numericos)[0]
+
+    linhas, colunas = _pares_candidatos(normalizados, marcas, max_bloco)
+    compativeis = assinatura_numerica[linhas] == assinatura_numerica[colunas]
+    linhas, colunas = linhas[compativeis], colunas[compativeis]
+
+    # Só os nomes que aparecem em algum par candidato precisam de vetor
+    envolvidos = np.unique(np.concatenate([linhas, colunas]))
+    aprovados = np.zeros(len(linhas), dtype=bool)
+    if len(envolvidos):
+        vetorizador = TfidfVectorizer(analyzer='char_wb', ngram_range=(3, 3), dtype=np.float32)
+        vetores = vetorizador.fit_transform(normalizados.iloc[envolvidos])
+        posicao_i, posicao_j = np.searchsorted(envolvidos, linhas), np.searchsorted(envolvidos, colunas)
+        aprovados = _similaridade(vetores, posicao_i, posicao_j) >= limiar
+    grafo = coo_matrix((np.ones(aprovados.sum()), (linhas[aprovados], colunas[aprovados])),
+                       shape=(len(nomes), len(nomes)))
+    _, componente = connected_components(grafo, directed=False)
+
+    # Nome canônico: o mais frequente do grupo (empate: o que aparece primeiro)
+    ordem = np.lexsort((np.arange(len(nomes)), -ofertas_por_nome, componente))
+    primeiro = np.ones(len(ordem), dtype=bool)
+    primeiro[1:] = componente[ordem][1:] != componente[ordem][:-1]
+    representante = np.empty(componente.max() + 1, dtype='int64')
+    representante[componente[ordem][primeiro]] = ordem[primeiro]
+    canonico_por_nome = nomes['Produto'].to_numpy()[representante[componente]]
+
+    canonico = pd.Series(canonico_por_nome[codigo_nome], index=df.index)
+    unificados = int((canonico_por_nome != nomes['Produto'].to_numpy()).sum())
+    relatorio = {
+        'nomes_distintos': len(nomes),
+        'pares_candidatos': int(len(linhas)),
+        'nomes_unificados': unificados,
+        'produtos_afetados': int(canonico[canonico != df['Produto'].astype(str)].nunique()),
+        'limiar_similaridade': limiar,
+        'tempo_ms': round((time.perf_counter() - inicio) * 1000, 2),
+    }
+    return canonico, relatorio
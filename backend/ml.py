@@ -0,0 +1,704 @@
+"""Modelo de classificação do Tipo_Ajuste e cache em disco dos modelos treinados.
+
+A árvore é determinística (random_state fixo): a mesma matriz de features, os
+mesmos rótulos e os mesmos hiperparâmetros produzem sempre a mesma árvore.
+Por isso o modelo treinado fica em disco com uma impressão digital (sha1) de
+X, y, hiperparâmetros e versão do scikit-learn como chave. Uma análise
+repetida carrega a árvore, as classes e as importâncias sem treinar de novo.
+
+O cache tem tamanho limitado (ANALYZER_MODEL_CACHE_MB). Cada acerto renova a
+data de modificação do arquivo, e ao passar do limite saem os menos usados.
+
+Na API o treino não fica no caminho da requisição: ``agendar_treino`` manda
+o trabalho para um pool de threads (o fit da árvore roda sem o GIL) e
+devolve um ml_job_id, consultado depois com ``resultado_treino``.
+
+No modo 'online' não há treino do zero: um SGDClassifier persistido em disco
+recebe as linhas de cada snapshot novo em mini-lotes (partial_fit), e o custo
+de cada upload é proporcional às linhas dele. Um snapshot já aprendido (mesmo
+sha1 de arquivo) não é aprendido de novo.
+
+Os modelos dos jobs da API (a árvore e cada estado novo do online) também
+vão para o registro versionado (registry.py), com esquema das features,
+classes, snapshot de treino e métricas, para servir predições depois.
+
+O scikit-learn (e o joblib) só é importado dentro das funções que treinam ou
+leem modelos: importar este módulo não custa o ~1 s de import do sklearn, que
+fica para o primeiro treino de cada worker.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as TempoEsgotado
+
+import numpy as np
+import pandas as pd
+
+from registry import DIRETORIO_DADOS, gravar_atomico, registrar_modelo, trava_arquivo
+
+FEATURES_ML = ['Preço', 'Preço_Concorrente', 'Valor_Ajuste', 'Percentual_Ajuste', 'Prioridade_Valor']
+ALVO_ML = 'Tipo_Ajuste'
+PARAMETROS_ARVORE = {'random_state': 42}
+PARAMETROS_DIVISAO = {'test_size': 0.2, 'random_state': 42}
+MODOS_ML = ['arvore', 'online']
+
+# Colunas das sugestões que viram cada feature (na ordem de FEATURES_ML) e se são monetárias
+COLUNAS_SUGESTOES_ML = [
+    ('Preço_Atual', True), ('Preço_Concorrente_Abaixo', True), ('Valor_Ajuste', True),
+    ('Percentual_Ajuste', False), ('Margem_Extra_RS', True),
+]
+
+# Classes fixas do modelo online (partial_fit precisa conhecer todas desde o 1º lote):
+# as da API e as do script standalone
+CLASSES_TIPO_AJUSTE = [
+    'Abaixar Preço para Competitividade', 'Manter Preço', 'Oportunidade de Aumento de Preço',
+    'Otimizar Margem para Lucratividade', 'Proteção da Margem',
+]
+
+DIRETORIO_CACHE_MODELOS = os.environ.get('ANALYZER_MODEL_CACHE', os.path.join(DIRETORIO_DADOS, 'modelos'))
+LIMITE_CACHE_MB = float(os.environ.get('ANALYZER_MODEL_CACHE_MB', '200'))
+ARQUIVO_MODELO_ONLINE = os.environ.get('ANALYZER_ONLINE_MODEL', os.path.join(DIRETORIO_DADOS, 'online.joblib'))
+LOTE_ONLINE = 10000
+MAX_SNAPSHOTS_LEMBRADOS = 1000
+
+# Treinos em segundo plano: threads do pool e quantos resultados ficam guardados
+ML_WORKERS = int(os.environ.get('ANALYZER_ML_WORKERS', '2'))
+MAX_JOBS_GUARDADOS = 256
+
+# Orçamento de treino da árvore: acima dele o fit usa uma amostra estratificada por
+# Tipo_Ajuste (0 = sem limite). O de segundos vira linhas pelo custo por linha do
+# último fit deste processo (começa com uma estimativa conservadora)
+MAX_LINHAS_TREINO = int(os.environ.get('ANALYZER_ML_MAX_ROWS', '250000'))
+MAX_SEGUNDOS_TREINO = float(os.environ.get('ANALYZER_ML_MAX_SECONDS', '0'))
+_custo_por_linha_s = 1e-5
+
+# Seleção opcional da árvore: configurações avaliadas em paralelo (threads; o fit e o
+# predict da árvore rodam sem o GIL), da mais simples para a mais complexa, com
+# limite de tempo para a seleção inteira (incluindo a importância por permutação)
+GRADE_ARVORE = [
+    {'max_depth': profundidade, 'min_samples_leaf': folha}
+    for profundidade in (4, 8, 12, None) for folha in (50, 10, 1)
+]
+
+
+def _cpus_disponiveis():
+    """CPUs que este processo pode usar (afinidade/cpuset do container), não as da máquina."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # sem sched_getaffinity (macOS)
+        return os.cpu_count() or 1
+
+
+# Cada um dos ML_WORKERS treinos simultâneos pode rodar uma seleção: as CPUs são divididas entre eles
+SELECAO_WORKERS = int(os.environ.get('ANALYZER_ML_SELECTION_WORKERS', str(max(_cpus_disponiveis() // ML_WORKERS, 1))))
+SELECAO_LIMITE_S = float(os.environ.get('ANALYZER_ML_SELECTION_SECONDS', '30'))
+REPETICOES_PERMUTACAO = 5
+
+# A árvore converte X para float32 por dentro: montado já em float32 contíguo,
+# o bloco de features vai para o fit sem cópia
+DTYPE_FEATURES = np.float32
+LINHAS_POR_FATIA = 65536
+
+
+def matriz_features(colunas, linhas=None):
+    """Bloco (n, len(colunas)) float32 contíguo com as features, sem DataFrame intermediário.
+
+    ``colunas`` é uma lista de (valores, divisor) e ``linhas`` (opcional)
+    escolhe e ordena as linhas. Cada coluna vai direto para o bloco em fatias,
+    então a única matriz do tamanho do bloco é o próprio bloco. Texto não
+    numérico vira 0, como no ``to_numeric(...).fillna(0)``.
+    """
+    n = len(colunas[0][0]) if linhas is None else len(linhas)
+    X = np.empty((n, len(colunas)), dtype=DTYPE_FEATURES)
+    for j, (valores, divisor) in enumerate(colunas):
+        if not pd.api.types.is_numeric_dtype(valores):
+            valores = pd.to_numeric(valores, errors='coerce')
+        valores = np.asarray(valores)
+        for inicio in range(0, n, LINHAS_POR_FATIA):
+            fatia = slice(inicio, inicio + LINHAS_POR_FATIA)
+            origem = valores[fatia] if linhas is None else valores[linhas[fatia]]
+            destino = X[fatia, j]
+            np.divide(origem, divisor, out=destino, casting='unsafe')
+            np.copyto(destino, 0, where=np.isnan(destino))
+    return X
+
+
+def _codificar_rotulos(rotulos, classes=None):
+    """Códigos int8 na ordem de ``classes`` (padrão: as presentes, ordenadas como no LabelEncoder).
+
+    Rótulo fora de ``classes`` recebe -1. Classes e códigos saem de uma
+    comparação por classe em fatias, sem tabela de hash: o hash de texto
+    não-ASCII ('Proteção') deixa um cache UTF-8 preso em cada string das
+    sugestões, do tamanho do próprio bloco de features.
+    """
+    valores = np.asarray(rotulos, dtype=object)
+    codigos = np.full(len(valores), -1, dtype=np.int8)
+    if classes is not None:
+        for codigo, classe in enumerate(classes):
+            codigos[valores == classe] = codigo
+        return codigos, list(classes)
+
+    vistas = {}
+    for inicio in range(0, len(valores), LINHAS_POR_FATIA):
+        fatia, destino = valores[inicio:inicio + LINHAS_POR_FATIA], codigos[inicio:inicio + LINHAS_POR_FATIA]
+        livres = destino < 0
+        while livres.any():
+            classe = fatia[livres.argmax()]
+            iguais = pd.isna(fatia) if pd.isna(classe) else fatia == classe
+            destino[iguais] = vistas.setdefault(str(classe), len(vistas))
+            livres &= ~iguais
+    classes = sorted(vistas)
+    if list(vistas) != classes:
+        mapa = np.empty(len(vistas), dtype=np.int8)
+        mapa[[vistas[c] for c in classes]] = np.arange(len(classes), dtype=np.int8)
+        np.take(mapa, codigos, out=codigos)
+    return codigos, classes
+
+
+def _alocar(contagens, fracao, total):
+    """Parte de cada classe em ``total`` linhas: ``contagens * fracao`` com as sobras de
+    arredondamento indo para as maiores frações, como no train_test_split."""
+    ideal = contagens * fracao
+    por_classe = np.floor(ideal).astype(np.int64)
+    sobras = np.argsort(-(ideal - por_classe), kind='stable')[:max(total - por_classe.sum(), 0)]
+    por_classe[sobras] += 1
+    return por_classe
+
+
+def _orcamento(contagens, total):
+    """Parte estratificada de ``total`` linhas em que toda classe presente fica com ao menos uma;
+    o que essas garantias acrescentam sai das maiores classes, então a soma não passa de ``total``."""
+    por_classe = np.maximum(_alocar(contagens, total / contagens.sum(), total), np.minimum(contagens, 1))
+    excesso = por_classe.sum() - total
+    for classe in np.argsort(-por_classe, kind='stable'):
+        if excesso <= 0:
+            break
+        retirar = min(excesso, por_classe[classe] - 1)
+        por_classe[classe] -= retirar
+        excesso -= retirar
+    return por_classe
+
+
+def _ordem_treino(y, test_size=PARAMETROS_DIVISAO['test_size'], random_state=PARAMETROS_DIVISAO['random_state'],
+                  max_treino=None):
+    """Linhas na ordem (treino..., teste...) da divisão estratificada, n_treino e aviso.
+
+    Com o bloco montado nessa ordem o conjunto de treino é uma fatia (view)
+    do bloco e não uma cópia. Os índices ficam em int32 e a divisão é feita
+    classe a classe, com cada classe na sua proporção.
+
+    Com ``max_treino`` menor que o treino completo, o treino vira uma amostra
+    estratificada de ``max_treino`` linhas (toda classe presente fica com ao
+    menos uma) e o teste uma amostra das linhas que sobraram, na proporção
+    ``test_size`` da amostra: as linhas fora das duas nem entram no bloco.
+    Sem divisão possível (classe com uma amostra só) o modelo treina sem
+    teste, e ``max_treino`` limita esse treino do mesmo jeito.
+    """
+    n = len(y)
+    contagens = np.bincount(y, minlength=1)
+    n_teste = int(np.ceil(test_size * n))
+    presentes = contagens[contagens > 0]
+    gerador = np.random.default_rng(random_state)
+    if not len(presentes) or presentes.min() < 2 or n_teste < len(presentes) or n - n_teste < len(presentes):
+        aviso = ("Não foi possível dividir os dados para ML: alguma classe tem menos de 2 amostras "
+                 "ou há mais classes que linhas de teste. Pode ser que uma classe tenha poucas amostras.")
+        if not max_treino or n <= max_treino:
+            return np.arange(n, dtype=np.int32), n, aviso
+        amostra = _orcamento(contagens, max_treino)
+        treino = []
+        for classe in np.flatnonzero(contagens):
+            indices = np.flatnonzero(y == classe).astype(np.int32)
+            gerador.shuffle(indices)
+            treino.append(indices[:amostra[classe]])
+        treino = np.sort(np.concatenate(treino))
+        return treino, len(treino), aviso
+
+    teste_por_classe = _alocar(contagens, test_size, n_teste)
+    treino_por_classe = contagens - teste_por_classe
+    if max_treino and treino_por_classe.sum() > max_treino:
+        treino_por_classe = _orcamento(treino_por_classe, max_treino)
+        n_teste = int(np.ceil(treino_por_classe.sum() * test_size / (1 - test_size)))
+        restantes = contagens - treino_por_classe
+        teste_por_classe = np.minimum(_alocar(restantes, n_teste / restantes.sum(), n_teste), restantes)
+
+    treino, teste = [], []
+    for classe in np.flatnonzero(contagens):
+        indices = np.flatnonzero(y == classe).astype(np.int32)
+        gerador.shuffle(indices)
+        fim_teste = teste_por_classe[classe]
+        teste.append(indices[:fim_teste])
+        treino.append(indices[fim_teste:fim_teste + treino_por_classe[classe]])
+    treino, teste = np.sort(np.concatenate(treino)), np.sort(np.concatenate(teste))
+    return np.concatenate([treino, teste]), len(treino), None
+
+
+def impressao_digital(X, y, classes, parametros):
+    """sha1 do bloco de features e dos códigos (lidos no próprio buffer), classes, hiperparâmetros e sklearn."""
+    h = hashlib.sha1()
+    h.update(f'{X.dtype.str}{X.shape}'.encode())
+    h.update(np.ascontiguousarray(X))
+    h.update(np.ascontiguousarray(y))
+    h.update('\x1f'.join(classes).encode('utf-8'))
+    h.update(json.dumps(parametros, sort_keys=True, default=str).encode())
+    h.update(_versao_sklearn().encode())
+    return h.hexdigest()
+
+
+def _versao_sklearn():
+    import sklearn
+    return sklearn.__version__
+
+
+def _carregar(caminho):
+    try:
+        import joblib
+        entrada = joblib.load(caminho)
+    except (OSError, EOFError, ValueError, KeyError):
+        return None
+    try:
+        os.utime(caminho)  # marca o uso para o despejo do cache
+    except OSError:
+        pass  # outro worker despejou o arquivo depois da carga
+    return entrada
+
+
+def _gravar(diretorio, chave, entrada, limite_mb):
+    """Grava a entrada do cache e despeja as menos usadas além do limite."""
+    gravar_atomico(os.path.join(diretorio, f'{chave}.joblib'), entrada)
+
+    arquivos = []
+    for nome in os.listdir(diretorio):
+        if nome.endswith('.joblib'):
+            info = os.stat(os.path.join(diretorio, nome))
+            arquivos.append((info.st_mtime, info.st_size, nome))
+    total, limite = sum(a[1] for a in arquivos), limite_mb * 1024 * 1024
+    for _, tamanho, nome in sorted(arquivos):
+        if total <= limite or nome == f'{chave}.joblib':
+            continue
+        try:
+            os.remove(os.path.join(diretorio, nome))
+            total -= tamanho
+        except FileNotFoundError:
+            pass
+
+
+def _orcamento_linhas(max_linhas, max_segundos):
+    """Máximo de linhas de treino pelo orçamento (None = sem limite)."""
+    limites = [max_linhas] if max_linhas else []
+    if max_segundos:
+        # Em degraus de 10 mil linhas: a mesma amostra (e o cache) entre uploads parecidos
+        limites.append(max(int(max_segundos / _custo_por_linha_s) // 10000 * 10000, 10000))
+    return min(limites) if limites else None
+
+
+def _treinar(X, y, n_treino, classes, parametros, aviso):
+    """Treina nas primeiras ``n_treino`` linhas do bloco e mede a acurácia nas demais.
+
+    O pico de memória do treino é o bloco (20 bytes por linha) mais o que o
+    fit da árvore aloca por linha de treino, cerca de 36 bytes (cópia do y,
+    códigos int64 e np.unique, y em float64, índices das amostras): com 80%
+    de treino, ~2,5x o bloco. Essas cópias são internas do scikit-learn e
+    não dependem do dtype dos códigos que recebem.
+    """
+    global _custo_por_linha_s
+    from sklearn.tree import DecisionTreeClassifier
+    modelo = DecisionTreeClassifier(**parametros)
+    inicio = time.perf_counter()
+    modelo.fit(X[:n_treino], y[:n_treino])
+    if n_treino:
+        _custo_por_linha_s = (time.perf_counter() - inicio) / n_treino
+    metricas = {'linhas_treino': int(n_treino), 'linhas_teste': int(len(X) - n_treino)}
+    if n_treino < len(X):
+        metricas['acuracia_teste'] = round(float(modelo.score(X[n_treino:], y[n_treino:])), 4)
+    return {
+        'modelo': modelo,
+        'classes': classes,
+        'importancias': dict(zip(FEATURES_ML, (float(v) for v in modelo.feature_importances_.round(4)))),
+        'parametros': parametros,
+        'metricas': metricas,
+        'aviso': aviso,
+    }
+
+
+def _avaliar_configuracao(X, y, n_treino, validacao, parametros):
+    from sklearn.tree import DecisionTreeClassifier
+    inicio = time.perf_counter()
+    modelo = DecisionTreeClassifier(**parametros)
+    modelo.fit(X[:n_treino], y[:n_treino])
+    acuracia = float(modelo.score(X[validacao], y[validacao]))
+    return modelo, {
+        'parametros': {k: v for k, v in parametros.items() if k != 'random_state'},
+        'acuracia_validacao': round(acuracia, 4),
+        'profundidade': int(modelo.get_depth()),
+        'folhas': int(modelo.get_n_leaves()),
+        'tempo_ms': round((time.perf_counter() - inicio) * 1000, 2),
+    }
+
+
+def _selecionar(X, y, n_treino, classes, parametros, aviso, grade=GRADE_ARVORE, limite_s=SELECAO_LIMITE_S,
+                workers=SELECAO_WORKERS):
+    """Escolhe a árvore da ``grade`` pela acurácia de validação e mede a importância por permutação.
+
+    As linhas de teste do bloco se dividem em duas metades intercaladas: uma
+    escolhe a configuração e calcula a importância por permutação, a outra dá
+    a acurácia de teste do modelo escolhido, sem o viés da escolha. As
+    configurações rodam em paralelo nas threads e as que não terminam até
+    ``limite_s`` ficam de fora (a grade vai da mais simples para a mais
+    complexa, então as baratas terminam primeiro). Empate fica com a mais
+    simples.
+
+    O limite vale para a espera, não para a CPU: as que ainda não começaram
+    são canceladas, mas um fit já em andamento não pode ser interrompido e
+    segue ocupando uma thread até acabar. Essas saem em
+    'configuracoes_ainda_rodando' e contam como ``limite_excedido``.
+    """
+    inicio = time.perf_counter()
+    if len(X) - n_treino < 2:
+        entrada = _treinar(X, y, n_treino, classes, parametros, aviso)
+        entrada['selecao'] = {'message': 'Sem linhas de teste para comparar configurações; árvore padrão usada.'}
+        return entrada
+    validacao, teste = slice(n_treino, None, 2), slice(n_treino + 1, None, 2)
+
+    pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='ml-selecao')
+    futuros = [pool.submit(_avaliar_configuracao, X, y, n_treino, validacao, {**parametros, **config})
+               for config in grade]
+    # A comparação usa até 80% do limite; o resto fica para a importância por permutação
+    avaliados, interrompidas = [], []
+    for posicao, futuro in enumerate(futuros):
+        restante = 0.8 * limite_s - (time.perf_counter() - inicio)
+        try:
+            avaliados.append((posicao, *futuro.result(timeout=max(restante, 0))))
+        except TempoEsgotado:
+            interrompidas.append(grade[posicao])
+    if not avaliados:
+        # Nada terminou no limite: fica a configuração mais simples (a mais barata), esperando por ela
+        avaliados.append((0, *futuros[0].result()))
+        interrompidas.pop(0)
+    # As que não começaram são canceladas; as que já rodam terminam em segundo plano e são ignoradas
+    pool.shutdown(wait=False, cancel_futures=True)
+    ainda_rodando = [grade[posicao] for posicao, futuro in enumerate(futuros) if not futuro.done()]
+    tempo_selecao = time.perf_counter() - inicio
+    _, modelo, escolhida = max(avaliados, key=lambda a: (a[2]['acuracia_validacao'], -a[0]))
+
+    permutacao, tempo_permutacao = None, 0.0
+    if time.perf_counter() - inicio < limite_s:
+        from sklearn.inspection import permutation_importance
+        inicio_permutacao = time.perf_counter()
+        resultado = permutation_importance(modelo, X[validacao], y[validacao], n_repeats=REPETICOES_PERMUTACAO,
+                                           random_state=42)
+        permutacao = {
+            feature: {'media': round(float(m), 4), 'desvio': round(float(d), 4)}
+            for feature, m, d in zip(FEATURES_ML, resultado.importances_mean, resultado.importances_std)
+        }
+        tempo_permutacao = time.perf_counter() - inicio_permutacao
+
+    return {
+        'modelo': modelo,
+        'classes': classes,
+        'parametros': {**parametros, **escolhida['parametros']},
+        'importancias': dict(zip(FEATURES_ML, (float(v) for v in modelo.feature_importances_.round(4)))),
+        'metricas': {
+            'linhas_treino': int(n_treino),
+            'linhas_teste': int(len(X) - n_treino),
+            'acuracia_teste': round(float(modelo.score(X[teste], y[teste])), 4),
+            'acuracia_validacao': escolhida['acuracia_validacao'],
+        },
+        'selecao': {
+            'configuracao_escolhida': escolhida,
+            'avaliacoes': [a[2] for a in avaliados],
+            'configuracoes_interrompidas': interrompidas,
+            'configuracoes_ainda_rodando': ainda_rodando,
+            'importancia_por_permutacao': permutacao,
+            'workers': workers,
+            'limite_s': limite_s,
+            'limite_excedido': tempo_selecao > limite_s or bool(ainda_rodando),
+            'tempo_selecao_ms': round(tempo_selecao * 1000, 2),
+            'tempo_permutacao_ms': round(tempo_permutacao * 1000, 2),
+        },
+        'aviso': aviso,
+    }
+
+
+def treinar_arvore(colunas, rotulos, parametros=None, diretorio=DIRETORIO_CACHE_MODELOS, limite_mb=LIMITE_CACHE_MB,
+                   max_linhas=MAX_LINHAS_TREINO, max_segundos=MAX_SEGUNDOS_TREINO, selecao=False):
+    """Árvore treinada para as features ``colunas`` (ver matriz_features), do cache quando possível.
+
+    Acima do orçamento (``max_linhas`` e/ou ``max_segundos``) treina numa
+    amostra estratificada e mede a acurácia num teste separado, então o custo
+    do fit não cresce com o arquivo. Retorna {'modelo', 'classes',
+    'importancias', 'metricas', 'aviso', 'impressao_digital', 'em_cache'}.
+    Com ``selecao`` a árvore sai da GRADE_ARVORE (ver _selecionar) e o
+    retorno ganha 'selecao'. Com ``diretorio=None`` não usa cache.
+    """
+    parametros = {**PARAMETROS_ARVORE, **(parametros or {})}
+    y, classes = _codificar_rotulos(rotulos)
+    ordem, n_treino, aviso = _ordem_treino(y, max_treino=_orcamento_linhas(max_linhas, max_segundos))
+    X = matriz_features(colunas, ordem)
+    y = y[ordem]
+    del ordem
+    chave = impressao_digital(X, y, classes, {'arvore': parametros, 'divisao': PARAMETROS_DIVISAO,
+                                              'selecao': GRADE_ARVORE if selecao else None})
+
+    if diretorio:
+        entrada = _carregar(os.path.join(diretorio, f'{chave}.joblib'))
+        if entrada is not None:
+            return {'metricas': {}, **entrada, 'impressao_digital': chave, 'em_cache': True}
+
+    if selecao:
+        entrada = _selecionar(X, y, n_treino, classes, parametros, aviso)
+    else:
+        entrada = _treinar(X, y, n_treino, classes, parametros, aviso)
+    entrada['metricas']['linhas_disponiveis'] = int(len(rotulos))
+    entrada['metricas']['amostrado'] = len(X) < len(rotulos)
+    if diretorio:
+        try:
+            _gravar(diretorio, chave, entrada, limite_mb)
+        except OSError as e:
+            print('Não foi possível gravar o modelo no cache:', e)
+    return {**entrada, 'impressao_digital': chave, 'em_cache': False}
+
+
+def insights_arvore(colunas, rotulos, snapshot_id=None, registrar=False, **kwargs):
+    """Card de insights do modelo (ou a mensagem de dados insuficientes).
+
+    Com ``registrar`` a árvore também vai para o registro de modelos, com o
+    ``snapshot_id`` de treino, e o card traz a versão registrada.
+    """
+    if len(rotulos) < 2 or pd.Series(rotulos).nunique() < 2:
+        return {"message": "Apenas um tipo de ajuste ou dados insuficientes para treinar modelo de ML."}
+    treino = treinar_arvore(colunas, rotulos, **kwargs)
+    insights = {
+        "status": "Modelo de ML treinado com sucesso!",
+        "features_usadas": FEATURES_ML,
+        "classes_preditas": treino['classes'],
+        "importancia_das_features": treino['importancias'],
+        "modelo_em_cache": treino['em_cache'],
+        "metricas": treino['metricas'],
+    }
+    if 'selecao' in treino:
+        insights["selecao_modelo"] = treino['selecao']
+    if registrar:
+        registro = registrar_modelo('arvore', treino['modelo'], {
+            'esquema_features': esquema_features(),
+            'classes': treino['classes'],
+            'snapshot_id': snapshot_id,
+            'impressao_digital': treino['impressao_digital'],
+            'parametros': treino.get('parametros', PARAMETROS_ARVORE),
+            'metricas': treino['metricas'],
+            'sklearn': _versao_sklearn(),
+        })
+        insights["modelo_versao"] = registro['versao']
+    return insights
+
+
+def esquema_features(transformacao=None):
+    """Esquema das colunas do modelo: nomes, ordem, dtype e a transformação aplicada antes do predict."""
+    return {
+        'features': FEATURES_ML,
+        'colunas_sugestoes': COLUNAS_SUGESTOES_ML,
+        'dtype': np.dtype(DTYPE_FEATURES).name,
+        'unidade_monetaria': 'reais',
+        'transformacao': transformacao,
+    }
+
+
+def features_de_sugestoes(sugestoes):
+    """(colunas, rotulos) das sugestões do engine para o matriz_features (valores em reais).
+
+    As colunas são as próprias séries das sugestões: nada é copiado até o
+    bloco float32 ser montado no treino.
+    """
+    if not len(sugestoes):
+        return [(np.empty(0), 1)] * len(FEATURES_ML), np.empty(0, dtype=object)
+    escala = 100 if pd.api.types.is_integer_dtype(sugestoes['Valor_Ajuste']) else 1
+    colunas = []
+    for coluna, monetaria in COLUNAS_SUGESTOES_ML:
+        if coluna == 'Preço_Concorrente_Abaixo' and coluna not in sugestoes.columns:
+            coluna = 'Preço_Concorrente'
+        colunas.append((sugestoes[coluna], escala if monetaria else 1))
+    return colunas, sugestoes[ALVO_ML]
+
+
+def _transformar_online(X):
+    """Log com sinal, no próprio bloco: escala fixa (sem estatística que mude entre uploads) para o SGD."""
+    negativo = np.signbit(X)
+    np.abs(X, out=X)
+    np.log1p(X, out=X)
+    np.negative(X, out=X, where=negativo)
+    return X
+
+
+def _insights_online(estado, **extras):
+    modelo = estado['modelo']
+    insights = {
+        "status": "Modelo online atualizado com sucesso!",
+        "features_usadas": FEATURES_ML,
+        "classes_preditas": estado['classes_vistas'],
+        "amostras_acumuladas": estado['amostras'],
+        "snapshots_aprendidos": len(estado['snapshots']),
+        **extras,
+    }
+    if hasattr(modelo, 'coef_'):
+        vistas = np.isin(modelo.classes_, estado['classes_vistas'])
+        peso = np.abs(modelo.coef_[vistas]).mean(axis=0, dtype=np.float64)
+        peso = peso / peso.sum() if peso.sum() else peso
+        insights["importancia_das_features"] = dict(zip(FEATURES_ML, (float(v) for v in peso.round(4))))
+    return insights
+
+
+def atualizar_modelo_online(colunas, rotulos, snapshot_id=None, arquivo=ARQUIVO_MODELO_ONLINE, lote=LOTE_ONLINE,
+                            registrar=False):
+    """Aprende as linhas de um snapshot no modelo online persistido.
+
+    O bloco de features já é montado na ordem embaralhada e cada mini-lote é
+    uma fatia dele. Cada lote é avaliado antes de ser aprendido (validação
+    progressiva: são dados que o modelo ainda não viu). Com ``registrar`` o
+    estado atualizado vira uma nova versão 'online' no registro de modelos.
+    """
+    inicio = time.perf_counter()
+    y, _ = _codificar_rotulos(rotulos, CLASSES_TIPO_AJUSTE)
+    conhecidas = np.flatnonzero(y >= 0)
+    nomes = np.asarray(CLASSES_TIPO_AJUSTE, dtype=object)
+
+    with trava_arquivo(arquivo):
+        from sklearn.linear_model import SGDClassifier
+        estado = _carregar(arquivo) or {
+            'modelo': SGDClassifier(loss='log_loss', random_state=42),
+            'amostras': 0, 'snapshots': [], 'classes_vistas': [],
+        }
+        if snapshot_id and snapshot_id in estado['snapshots']:
+            return _insights_online(estado, linhas_novas=0, snapshot_ja_aprendido=True)
+
+        ordem = np.random.default_rng(estado['amostras']).permutation(conhecidas)
+        Z = _transformar_online(matriz_features(colunas, ordem))
+        y = y[ordem]
+        modelo = estado['modelo']
+        acertos = avaliadas = 0
+        for posicao in range(0, len(Z), lote):
+            lote_X, lote_y = Z[posicao:posicao + lote], nomes[y[posicao:posicao + lote]]
+            if hasattr(modelo, 'coef_'):
+                acertos += int((modelo.predict(lote_X) == lote_y).sum())
+                avaliadas += len(lote_y)
+            modelo.partial_fit(lote_X, lote_y, classes=CLASSES_TIPO_AJUSTE)
+
+        estado['amostras'] += int(len(Z))
+        estado['classes_vistas'] = sorted(set(estado['classes_vistas']) | set(nomes[np.unique(y)]))
+        if snapshot_id:
+            estado['snapshots'] = (estado['snapshots'] + [snapshot_id])[-MAX_SNAPSHOTS_LEMBRADOS:]
+        acuracia = round(acertos / avaliadas, 4) if avaliadas else None
+        extras = {}
+        if len(Z):
+            gravar_atomico(arquivo, estado)
+            if registrar:
+                registro = registrar_modelo('online', modelo, {
+                    'esquema_features': esquema_features(transformacao='log_com_sinal'),
+                    'classes': CLASSES_TIPO_AJUSTE,
+                    'snapshot_id': snapshot_id,
+                    'metricas': {'acuracia_progressiva': acuracia, 'linhas_novas': int(len(Z)),
+                                 'amostras_acumuladas': estado['amostras']},
+                    'sklearn': _versao_sklearn(),
+                })
+                extras['modelo_versao'] = registro['versao']
+
+    return _insights_online(
+        estado, linhas_novas=int(len(Z)), linhas_ignoradas=int(len(rotulos) - len(conhecidas)),
+        acuracia_antes_da_atualizacao=acuracia,
+        tempo_atualizacao_ms=round((time.perf_counter() - inicio) * 1000, 2), **extras,
+    )
+
+
+def prever_lote(modelo, metadados, colunas):
+    """Classifica um lote de linhas com um modelo do registro (uma chamada de predict_proba).
+
+    ``colunas`` vem de features_de_sugestoes. Devolve um DataFrame com a
+    classe prevista, a confiança (maior probabilidade) e uma coluna
+    ``Prob_<classe>`` por classe do modelo. A predição é o argmax das
+    probabilidades, o mesmo que o predict devolveria.
+    """
+    esquema = metadados.get('esquema_features', {})
+    if esquema.get('features') != FEATURES_ML:
+        raise ValueError(f"Modelo {metadados.get('nome')} v{metadados.get('versao')} usa outras features: "
+                         f"{esquema.get('features')}.")
+    X = matriz_features(colunas)
+    if esquema.get('transformacao') == 'log_com_sinal':
+        _transformar_online(X)
+    classes = np.asarray(modelo.classes_)
+    if np.issubdtype(classes.dtype, np.integer):
+        # A árvore é treinada com os códigos dos rótulos; os nomes estão nos metadados
+        classes = np.asarray(metadados['classes'], dtype=object)[classes]
+    probabilidades = modelo.predict_proba(X) if len(X) else np.empty((0, len(classes)))
+    previsoes = pd.DataFrame({
+        'Tipo_Ajuste_Previsto': classes[probabilidades.argmax(axis=1)],
+        'Confianca': probabilidades.max(axis=1).round(4),
+    })
+    for j, classe in enumerate(classes):
+        previsoes[f'Prob_{classe}'] = probabilidades[:, j].round(4)
+    return previsoes
+
+
+_pool_treino = None
+_pool_sequencial = None
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def _executar_treino(colunas, rotulos, modo, snapshot_id, selecao):
+    if modo == 'online':
+        return atualizar_modelo_online(colunas, rotulos, snapshot_id=snapshot_id, registrar=True)
+    inicio = time.perf_counter()
+    insights = insights_arvore(colunas, rotulos, snapshot_id=snapshot_id, registrar=True, selecao=selecao)
+    insights['tempo_treino_ms'] = round((time.perf_counter() - inicio) * 1000, 2)
+    return insights
+
+
+def agendar_tarefa(funcao, *args, sequencial=False, **kwargs):
+    """Roda ``funcao`` no pool de treino e devolve o job_id, consultado em ``resultado_treino``.
+
+    Com ``sequencial`` a tarefa vai para uma fila de um worker só, executada
+    na ordem de chegada: é o caso das atualizações de estado persistido
+    (modelo online, histórico do modelo de vitória), em que um upload
+    aplicado depois do seguinte estragaria o estado.
+    """
+    global _pool_treino, _pool_sequencial
+    job_id = uuid.uuid4().hex[:16]
+    with _jobs_lock:
+        if sequencial:
+            if _pool_sequencial is None:
+                _pool_sequencial = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ml-sequencial')
+            pool = _pool_sequencial
+        else:
+            if _pool_treino is None:
+                _pool_treino = ThreadPoolExecutor(max_workers=ML_WORKERS, thread_name_prefix='ml-treino')
+            pool = _pool_treino
+        _jobs[job_id] = pool.submit(funcao, *args, **kwargs)
+        while len(_jobs) > MAX_JOBS_GUARDADOS:
+            _jobs.popitem(last=False)
+    return job_id
+
+
+def agendar_treino(colunas, rotulos, modo='arvore', snapshot_id=None, selecao=False):
+    """Dispara o treino (árvore do zero ou atualização do modelo online) no pool e devolve o ml_job_id.
+
+    Com ``selecao`` a árvore sai da seleção entre as configurações da GRADE_ARVORE. As
+    atualizações do modelo online entram na fila sequencial, na ordem dos uploads.
+    """
+    return agendar_tarefa(_executar_treino, colunas, rotulos, modo, snapshot_id, selecao,
+                          sequencial=modo == 'online')
+
+
+def resultado_treino(job_id):
+    """{'status': 'processando'|'pronto'|'erro', ...} ou None se o job não existe (ou já saiu da fila)."""
+    with _jobs_lock:
+        futuro = _jobs.get(job_id)
+    if futuro is None:
+        return None
+    if not futuro.done():
+        return {'ml_job_id': job_id, 'status': 'processando'}
+    erro = futuro.exception()
+    if erro is not None:
+        return {'ml_job_id': job_id, 'status': 'erro', 'error': f'Erro ao treinar o modelo: {erro}'}
+    return {'ml_job_id': job_id, 'status': 'pronto', 'ml_insights': futuro.result()}
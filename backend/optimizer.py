@@ -0,0 +1,86 @@
+"""Otimização de preços da carteira inteira respeitando o ajuste seguro.
+
+Para cada oferta em 1º lugar o novo preço fica dentro de ±``limite_percentual``
+do preço atual e estritamente abaixo do próximo concorrente (RANKING 2), para
+não perder a posição. Sem custo/volume no export, a margem esperada de cada
+produto é o próprio aumento de preço; o problema então é separável por
+produto, e o único acoplamento é o limite opcional de alterações, que num
+problema linear com pesos unitários se resolve pegando os K maiores ganhos.
+Tudo em aritmética inteira de centavos, vetorizado sobre todos os produtos.
+
+Num snapshot com preco=efetivo a otimização roda sobre o preço efetivo e cada
+alteração sai também à vista (Fator_Caixa da oferta, mesmo plano de
+parcelamento), o preço que se informa ao what-if.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from engine import para_centavos
+
+
+def otimizar_portfolio(df, limite_percentual=3.0, max_alteracoes=None):
+    """Escolhe os novos preços que maximizam o ganho total da carteira.
+
+    Retorna {'alteracoes': [...], 'resumo': {...}} ou {'error': ...} quando o
+    snapshot não tem ranking para saber quem é o próximo concorrente.
+    """
+    inicio = time.perf_counter()
+    if 'RANKING' not in df.columns:
+        return {'error': 'A otimização precisa do RANKING (ou de várias ofertas por produto para reconstruí-lo).'}
+
+    precos = df['Preço'] if pd.api.types.is_integer_dtype(df['Preço']) else para_centavos(df['Preço'])
+    ranking = df['RANKING']
+    produto = df['Produto']
+
+    # Próximo concorrente = menor preço do 2º lugar; empate em 1º não deixa subir
+    proximo = precos[ranking == 2].groupby(produto[ranking == 2], sort=False).min()
+    lideres_por_produto = (ranking == 1).groupby(produto, sort=False).sum()
+    lider = (ranking == 1) & produto.map(lideres_por_produto).eq(1) & produto.isin(proximo.index) & (precos > 0)
+
+    atual = precos[lider].to_numpy(dtype='int64')
+    concorrente = produto[lider].map(proximo).to_numpy(dtype='int64')
+    pontos_base = int(round(limite_percentual * 100))
+    teto_limite = atual * (10000 + pontos_base) // 10000
+    teto_posicao = concorrente - 1
+    novo = np.maximum(np.minimum(teto_limite, teto_posicao), atual)
+    ganho = novo - atual
+
+    # Limite de alterações: K maiores ganhos (empates pela ordem do arquivo)
+    candidatos = np.flatnonzero(ganho > 0)
+    ordem = candidatos[np.lexsort((candidatos, -ganho[candidatos]))]
+    if max_alteracoes is not None:
+        ordem = ordem[:max(int(max_alteracoes), 0)]
+
+    linhas = df.index[lider][ordem]
+    alteracoes = pd.DataFrame({
+        'Produto': df.loc[linhas, 'Produto'].to_numpy(),
+        'Lojista': df.loc[linhas, 'Lojista'].to_numpy(),
+        'Preço_Atual': atual[ordem] / 100,
+        'Preço_Otimizado': novo[ordem] / 100,
+        'Preço_Proximo_Concorrente': concorrente[ordem] / 100,
+        'Ganho_RS': ganho[ordem] / 100,
+        'Percentual_Ajuste': np.round(ganho[ordem] / atual[ordem] * 100, 2),
+        'Limitado_Por': np.where(teto_limite[ordem] <= teto_posicao[ordem],
+                                 f'limite de {limite_percentual:g}%', 'próximo concorrente'),
+    })
+
+    if 'Fator_Caixa' in df.columns:
+        # Como o fator é >= 1, o à vista arredondado volta ao mesmo efetivo no what-if
+        fator = df.loc[linhas, 'Fator_Caixa'].to_numpy(dtype='float64')
+        alteracoes['Preço_Caixa_Atual'] = np.rint(atual[ordem] * fator) / 100
+        alteracoes['Preço_Otimizado_Caixa'] = np.rint(novo[ordem] * fator) / 100
+
+    return {
+        'alteracoes': alteracoes.to_dict(orient='records'),
+        'resumo': {
+            'produtos_avaliados': int(lider.sum()),
+            'produtos_com_ganho': int(len(candidatos)),
+            'alteracoes_sugeridas': int(len(ordem)),
+            'ganho_total_rs': int(ganho[ordem].sum()) / 100,
+            'limite_percentual': limite_percentual,
+            'max_alteracoes': max_alteracoes,
+            'tempo_ms': round((time.perf_counter() - inicio) * 1000, 2),
+        },
+    }
@@ -0,0 +1,200 @@
+"""Execução particionada da análise em um pool de processos.
+
+O DataFrame normalizado é reordenado por partição (CÓDIGO CLUSTER do
+produto, ou hash do produto quando não há cluster) e suas colunas vão para
+blocos de memória compartilhada. Cada processo lê só o seu intervalo
+contíguo, roda a estratégia e devolve sugestões e cubo parciais, que são
+juntados na ordem das partições e das linhas, então o resultado é sempre
+igual ao da execução serial.
+
+O pool é um só por processo, criado uma vez com um processo por núcleo
+disponível (afinidade de CPU) e dividido pelas threads do gunicorn; o
+``workers`` de cada requisição só limita quantas partições ela envia. Se um
+processo filho morre, o pool quebrado é descartado (a próxima requisição cria
+outro) e a requisição termina as partições em série.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+
+from aggregates import DIMENSOES_CUBO, construir_cubo
+from engine import sugestoes_por_ranking, sugestoes_por_status
+
+# Colunas de texto viajam como códigos de categoria; as categorias pequenas
+# (tudo menos Produto) vão junto com a tarefa.
+COLUNAS_CATEGORICAS = ['Produto', 'Lojista', 'Status', 'Marca', 'Cluster']
+COLUNAS_NUMERICAS = ['Preço', 'Preço_Concorrente', 'RANKING']
+
+
+def _nucleos_disponiveis():
+    """Núcleos que este processo pode usar (afinidade de CPU, p.ex. em contêiner), não os da máquina."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _obter_pool():
+    """Pool compartilhado entre requisições (e threads) para não pagar o spawn a cada upload."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=_nucleos_disponiveis(), mp_context=get_context('spawn'))
+        return _pool
+
+
+def _descartar_pool(pool):
+    """Tira do uso um pool quebrado; outra thread pode já tê-lo trocado."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def atribuir_particoes(df, n_particoes):
+    """Número da partição de cada linha, sempre com o produto inteiro junto.
+
+    Com CÓDIGO CLUSTER os clusters (pelo cluster da primeira oferta de cada
+    produto) são distribuídos do maior para o menor na partição mais vazia;
+    sem cluster usa o hash do nome do produto.
+    """
+    if 'Cluster' not in df.columns:
+        hashes = pd.util.hash_pandas_object(df['Produto'], index=False).to_numpy()
+        return (hashes % np.uint64(n_particoes)).astype('int64')
+
+    cluster_produto = df.groupby('Produto', sort=False)['Cluster'].transform('first').astype(str)
+    tamanhos = cluster_produto.value_counts()
+    tamanhos = tamanhos.iloc[np.lexsort((tamanhos.index.to_numpy(), -tamanhos.to_numpy()))]
+    carga = np.zeros(n_particoes, dtype='int64')
+    destino = {}
+    for cluster, linhas in tamanhos.items():
+        alvo = int(carga.argmin())
+        destino[cluster] = alvo
+        carga[alvo] += linhas
+    return cluster_produto.map(destino).to_numpy(dtype='int64')
+
+
+def _compartilhar(arrays):
+    """Copia cada array para um bloco de memória compartilhada."""
+    blocos, descritores = [], {}
+    for nome, valores in arrays.items():
+        bloco = SharedMemory(create=True, size=max(valores.nbytes, 1))
+        np.ndarray(valores.shape, dtype=valores.dtype, buffer=bloco.buf)[:] = valores
+        blocos.append(bloco)
+        descritores[nome] = (bloco.name, valores.dtype.str, len(valores))
+    return blocos, descritores
+
+
+def _ler_intervalo(descritor, inicio, fim):
+    nome, dtype, tamanho = descritor
+    bloco = SharedMemory(name=nome)
+    try:
+        return np.ndarray((tamanho,), dtype=dtype, buffer=bloco.buf)[inicio:fim].copy()
+    finally:
+        bloco.close()
+
+
+def _analisar_particao(tarefa):
+    """Executado no processo filho: monta a partição e roda a estratégia."""
+    inicio_cpu = time.perf_counter()
+    descritores, inicio, fim, categorias, modo, fator = tarefa
+
+    colunas = {}
+    for nome, descritor in descritores.items():
+        valores = _ler_intervalo(descritor, inicio, fim)
+        if nome in categorias:
+            valores = pd.Categorical.from_codes(valores, categories=categorias[nome])
+        colunas[nome] = valores
+    posicoes = colunas.pop('_posicao')
+    particao = pd.DataFrame(colunas, index=pd.Index(posicoes))
+    if 'Status' in particao.columns:
+        particao['Status'] = particao['Status'].astype(str)
+
+    if modo == 'ranking':
+        sugestoes = sugestoes_por_ranking(particao, fator=fator)
+    else:
+        sugestoes = sugestoes_por_status(particao, fator=fator)
+    cubo = construir_cubo(particao, sugestoes)
+    return sugestoes, cubo, time.perf_counter() - inicio_cpu
+
+
+def analisar_em_paralelo(df, modo, fator, workers=None):
+    """Roda a estratégia particionada; devolve (sugestoes, cubo, relatorio).
+
+    ``modo`` é 'ranking' ou 'status'. O relatório traz o tempo de parede, a
+    soma dos tempos das partições (equivalente serial) e o speedup obtido
+    frente ao número de processos e de núcleos da máquina.
+    """
+    inicio = time.perf_counter()
+    nucleos = _nucleos_disponiveis()
+    workers = max(1, min(workers or nucleos, nucleos))
+    n_particoes = workers * 2
+
+    particoes = atribuir_particoes(df, n_particoes)
+    ordem = np.argsort(particoes, kind='stable')
+    limites = np.searchsorted(particoes[ordem], np.arange(n_particoes + 1))
+
+    arrays, categorias_tarefa, categorias_produto = {'_posicao': df.index.to_numpy()[ordem]}, {}, None
+    for coluna in COLUNAS_CATEGORICAS:
+        if coluna not in df.columns:
+            continue
+        categorico = pd.Categorical(df[coluna].astype(str))
+        arrays[coluna] = categorico.codes[ordem]
+        if coluna == 'Produto':
+            categorias_produto = categorico.categories
+        else:
+            categorias_tarefa[coluna] = categorico.categories
+    for coluna in COLUNAS_NUMERICAS:
+        if coluna in df.columns:
+            arrays[coluna] = df[coluna].to_numpy()[ordem]
+
+    blocos, descritores = _compartilhar(arrays)
+    try:
+        tarefas = [
+            (descritores, int(limites[i]), int(limites[i + 1]), categorias_tarefa, modo, fator)
+            for i in range(n_particoes) if limites[i + 1] > limites[i]
+        ]
+        pool = _obter_pool()
+        try:
+            parciais = list(pool.map(_analisar_particao, tarefas))
+            execucao_serial = False
+        except BrokenProcessPool:
+            _descartar_pool(pool)
+            parciais = [_analisar_particao(tarefa) for tarefa in tarefas]
+            execucao_serial = True
+    finally:
+        for bloco in blocos:
+            bloco.close()
+            bloco.unlink()
+
+    sugestoes = pd.concat([p[0] for p in parciais]).sort_index(kind='stable')
+    sugestoes['Produto'] = categorias_produto.take(sugestoes['Produto'].to_numpy())
+    sugestoes['Lojista'] = sugestoes['Lojista'].astype(str)
+    cubo = pd.concat([p[1] for p in parciais]).groupby(level=DIMENSOES_CUBO, sort=True).sum()
+
+    parede = time.perf_counter() - inicio
+    serial = sum(p[2] for p in parciais)
+    processos = 1 if execucao_serial else workers
+    relatorio = {
+        'particoes': len(tarefas),
+        'particionado_por': 'CÓDIGO CLUSTER' if 'Cluster' in df.columns else 'hash do produto',
+        'processos': processos,
+        'pool_quebrado_execucao_serial': execucao_serial,
+        'nucleos_disponiveis': nucleos,
+        'tempo_parede_s': round(parede, 3),
+        'tempo_serial_estimado_s': round(serial, 3),
+        'speedup': round(serial / parede, 2) if parede else None,
+        'eficiencia_por_nucleo': round(serial / parede / processos, 2) if parede else None,
+    }
+    return sugestoes, cubo, relatorio
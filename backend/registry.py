@@ -0,0 +1,197 @@
+"""Registro versionado dos modelos treinados, em disco.
+
+Cada modelo registrado ganha uma pasta ``<nome>/v0001``, ``v0002``... com o
+modelo (joblib sem compressão) e um ``metadados.json`` com o esquema das
+features, as classes, o snapshot de treino e as métricas. A pasta é montada
+num diretório temporário e renomeada no fim, então quem lê nunca vê uma
+versão pela metade; a numeração é feita sob trava de arquivo, o que vale
+entre os workers do gunicorn.
+
+A carga usa ``joblib.load(mmap_mode='r')``: os arrays numpy do modelo
+(coeficientes, tabelas) são mapeados do arquivo em vez de copiados, e todos
+os workers leem a mesma cópia do page cache do sistema. A árvore de decisão
+fica de fora: o ``Tree`` do scikit-learn copia nós e valores para buffers
+próprios ao ser carregado (mesmo de arrays mapeados), então cada processo
+tem a sua cópia dela. Cada worker guarda os últimos modelos carregados, então
+só a primeira consulta de uma versão toca o disco.
+"""
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Dados persistidos do app (registro, cache de modelos, históricos): num diretório do usuário
+# criado com permissão 0700, não no /tmp compartilhado, onde outro usuário poderia plantar
+# um .joblib (que executa código ao ser carregado)
+DIRETORIO_DADOS = os.environ.get('ANALYZER_DATA_DIR', os.path.join(
+    os.environ.get('XDG_DATA_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'share'), 'webprice-analyzer'))
+DIRETORIO_REGISTRO = os.environ.get('ANALYZER_MODEL_REGISTRY', os.path.join(DIRETORIO_DADOS, 'registro'))
+MAX_VERSOES = int(os.environ.get('ANALYZER_REGISTRY_MAX_VERSIONS', '20'))
+MAX_MODELOS_CARREGADOS = 8
+
+_carregados = OrderedDict()
+_carregados_lock = threading.Lock()
+
+
+def criar_diretorio_privado(caminho):
+    """Cria ``caminho`` e os diretórios que faltam até ele com permissão 0700 (os existentes ficam como estão)."""
+    faltando = []
+    caminho = os.path.abspath(caminho)
+    while not os.path.isdir(caminho):
+        faltando.append(caminho)
+        caminho = os.path.dirname(caminho)
+    for diretorio in reversed(faltando):
+        try:
+            os.mkdir(diretorio, 0o700)
+        except FileExistsError:
+            pass
+
+
+@contextmanager
+def trava_arquivo(caminho):
+    """Trava exclusiva entre processos (workers do gunicorn) para ler-atualizar-gravar ``caminho``."""
+    criar_diretorio_privado(os.path.dirname(caminho))
+    with open(caminho + '.lock', 'w') as trava:
+        fcntl.flock(trava, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(trava, fcntl.LOCK_UN)
+
+
+def gravar_atomico(caminho, objeto):
+    """Arquivo temporário no mesmo diretório + replace: quem lê nunca vê metade."""
+    diretorio = os.path.dirname(caminho)
+    criar_diretorio_privado(diretorio)
+    descritor, temporario = tempfile.mkstemp(dir=diretorio, suffix='.tmp')
+    os.close(descritor)
+    import joblib
+    joblib.dump(objeto, temporario)
+    os.replace(temporario, caminho)
+
+
+def versoes_modelo(nome, diretorio=DIRETORIO_REGISTRO):
+    """Versões registradas de ``nome``, em ordem crescente."""
+    try:
+        pastas = os.listdir(os.path.join(diretorio, nome))
+    except FileNotFoundError:
+        return []
+    return sorted(int(p[1:]) for p in pastas if p.startswith('v') and p[1:].isdigit())
+
+
+def _pasta_versao(nome, versao, diretorio):
+    return os.path.join(diretorio, nome, f'v{versao:04d}')
+
+
+def resolver_versao(nome, versao=None, diretorio=DIRETORIO_REGISTRO):
+    """Número da versão pedida (None ou 'latest' = a mais recente) ou None se ela não existe."""
+    versoes = versoes_modelo(nome, diretorio)
+    if versao in (None, '', 'latest'):
+        return versoes[-1] if versoes else None
+    try:
+        versao = int(versao)
+    except (TypeError, ValueError):
+        return None
+    return versao if versao in versoes else None
+
+
+def metadados_modelo(nome, versao=None, diretorio=DIRETORIO_REGISTRO):
+    """Metadados de uma versão (padrão: a mais recente) ou None."""
+    versao = resolver_versao(nome, versao, diretorio)
+    if versao is None:
+        return None
+    try:
+        with open(os.path.join(_pasta_versao(nome, versao, diretorio), 'metadados.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def listar_modelos(diretorio=DIRETORIO_REGISTRO):
+    """{nome: [metadados de cada versão]} de todo o registro."""
+    try:
+        nomes = sorted(n for n in os.listdir(diretorio) if os.path.isdir(os.path.join(diretorio, n)))
+    except FileNotFoundError:
+        return {}
+    modelos = {}
+    for nome in nomes:
+        versoes = [metadados_modelo(nome, v, diretorio) for v in versoes_modelo(nome, diretorio)]
+        modelos[nome] = [m for m in versoes if m is not None]
+    return modelos
+
+
+def registrar_modelo(nome, modelo, metadados, diretorio=DIRETORIO_REGISTRO, max_versoes=MAX_VERSOES):
+    """Grava uma nova versão de ``nome`` e devolve os metadados completos (com 'versao').
+
+    Um modelo com a mesma ``impressao_digital`` de uma versão existente não é
+    gravado de novo: volta a versão que já está no registro. Além de
+    ``max_versoes`` as mais antigas saem (um worker que já as carregou segue
+    usando o mapeamento, que continua válido depois de o arquivo sair).
+    """
+    pasta_nome = os.path.join(diretorio, nome)
+    with trava_arquivo(os.path.join(pasta_nome, 'registro')):
+        versoes = versoes_modelo(nome, diretorio)
+        impressao = metadados.get('impressao_digital')
+        if impressao:
+            for versao in reversed(versoes):
+                existente = metadados_modelo(nome, versao, diretorio)
+                if existente and existente.get('impressao_digital') == impressao:
+                    return existente
+
+        versao = (versoes[-1] if versoes else 0) + 1
+        metadados = {
+            'nome': nome,
+            'versao': versao,
+            'registrado_em': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            **metadados,
+        }
+        temporaria = tempfile.mkdtemp(dir=pasta_nome, prefix='.v')
+        try:
+            import joblib
+            joblib.dump(modelo, os.path.join(temporaria, 'modelo.joblib'))
+            with open(os.path.join(temporaria, 'metadados.json'), 'w', encoding='utf-8') as f:
+                json.dump(metadados, f, ensure_ascii=False, indent=2, default=str)
+            os.rename(temporaria, _pasta_versao(nome, versao, diretorio))
+        except BaseException:
+            shutil.rmtree(temporaria, ignore_errors=True)
+            raise
+
+        for antiga in (versoes + [versao])[:-max_versoes] if max_versoes else []:
+            shutil.rmtree(_pasta_versao(nome, antiga, diretorio), ignore_errors=True)
+    return metadados
+
+
+def carregar_modelo(nome, versao=None, diretorio=DIRETORIO_REGISTRO):
+    """(modelo, metadados) da versão pedida (padrão: a mais recente) ou None.
+
+    O modelo vem com os arrays mapeados do arquivo (somente leitura): serve
+    para predição, não para continuar o treino.
+    """
+    versao = resolver_versao(nome, versao, diretorio)
+    if versao is None:
+        return None
+    chave = (diretorio, nome, versao)
+    with _carregados_lock:
+        if chave in _carregados:
+            _carregados.move_to_end(chave)
+            return _carregados[chave]
+
+    metadados = metadados_modelo(nome, versao, diretorio)
+    try:
+        import joblib
+        modelo = joblib.load(os.path.join(_pasta_versao(nome, versao, diretorio), 'modelo.joblib'), mmap_mode='r')
+    except (OSError, EOFError, ValueError, KeyError):
+        return None
+    if metadados is None:
+        return None
+
+    with _carregados_lock:
+        _carregados[chave] = (modelo, metadados)
+        while len(_carregados) > MAX_MODELOS_CARREGADOS:
+            _carregados.popitem(last=False)
+    return modelo, metadados
@@ -0,0 +1,65 @@
+"""Tempo de parede da seleção da árvore (``?ml_selecao=1``) por número de threads.
+
+Monta um bloco de features sintético (preço, concorrente e ajuste com rótulo
+pela regra e uma fração de ruído), roda a comparação da GRADE_ARVORE com 1,
+2, ... threads até as CPUs da afinidade do processo e mostra o tempo de cada
+uma e o speedup frente a uma thread. A importância por permutação (que roda
+numa thread só, depois da comparação) fica fora da medida. Serve para
+conferir que os fits da grade de fato andam em paralelo nesta máquina: com
+uma CPU só na afinidade não há speedup a medir.
+
+Uso: ``python selection_timing.py [linhas] [repeticoes]`` (padrão: 200000, 3).
+"""
+import sys
+
+import numpy as np
+
+from ml import _codificar_rotulos, _cpus_disponiveis, _ordem_treino, _selecionar, matriz_features
+
+LIMITE_S = 3600
+
+
+def _bloco_sintetico(linhas, ruido=0.05, semente=0):
+    gerador = np.random.default_rng(semente)
+    preco = gerador.uniform(50, 500, linhas)
+    concorrente = preco * gerador.uniform(0.8, 1.3, linhas)
+    ajuste = concorrente * 0.9 - preco
+    rotulos = np.where(ajuste > 0, 'Proteção da Margem', np.where(ajuste > -0.05 * preco, 'Manter Preço',
+                                                                  'Abaixar Preço para Competitividade'))
+    trocados = gerador.random(linhas) < ruido
+    rotulos[trocados] = gerador.permutation(rotulos[trocados])
+    colunas = [(preco, 1), (concorrente, 1), (ajuste, 1), (ajuste / preco * 100, 1), (np.abs(ajuste), 1)]
+    y, classes = _codificar_rotulos(rotulos)
+    ordem, n_treino, aviso = _ordem_treino(y)
+    return matriz_features(colunas, ordem), y[ordem], n_treino, classes, aviso
+
+
+def medir_selecao(linhas=200_000, repeticoes=3):
+    """Melhor tempo de parede da comparação da grade para cada número de threads, em s."""
+    X, y, n_treino, classes, aviso = _bloco_sintetico(linhas)
+    cpus = _cpus_disponiveis()
+    tempos = {}
+    for workers in sorted({1, *range(2, cpus + 1)}):
+        melhor = float('inf')
+        for _ in range(repeticoes):
+            # Limite folgado: todas as configurações terminam e só a comparação é medida
+            selecao = _selecionar(X, y, n_treino, classes, {'random_state': 42}, aviso, limite_s=LIMITE_S,
+                                  workers=workers)
+            melhor = min(melhor, selecao['selecao']['tempo_selecao_ms'] / 1000)
+        tempos[workers] = melhor
+    return {
+        'linhas': linhas,
+        'cpus_afinidade': cpus,
+        'configuracoes': len(selecao['selecao']['avaliacoes']),
+        'tempos': [{'threads': w, 'parede_s': round(t, 3), 'speedup': round(tempos[1] / t, 2)}
+                   for w, t in tempos.items()],
+    }
+
+
+if __name__ == '__main__':
+    relatorio = medir_selecao(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000,
+                              int(sys.argv[2]) if len(sys.argv) > 2 else 3)
+    print(f"Seleção da árvore: {relatorio['linhas']} linhas, {relatorio['configuracoes']} configurações, "
+          f"{relatorio['cpus_afinidade']} CPU(s) na afinidade do processo")
+    for medida in relatorio['tempos']:
+        print(f"  {medida['threads']:>3} thread(s): {medida['parede_s']:>8.3f} s   speedup {medida['speedup']:.2f}x")
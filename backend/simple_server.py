@@ -5,6 +5,8 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import io
 
+from engine import reconstruir_ranking, status_por_ranking
+
 app = Flask(__name__)
 CORS(app, origins=['http://localhost:5173', 'http://127.0.0.1:5173'])
 
@@ -123,10 +125,11 @@ def analyze():
                     df['Status'] = df['Ranking_Clean'].apply(lambda x: 'GANHANDO' if x == '1' else 'PERDENDO')
                     print("Status criado baseado no Ranking (1º = GANHANDO)")
                 
-                # Ou se temos diferença negativa, assumir que estamos ganhando
-                elif 'Diferença' in df.columns:
-                    df['Status'] = df['Diferença'].apply(lambda x: 'GANHANDO' if x < 0 else 'PERDENDO')
-                    print("Status criado baseado na Diferença")
+                # Sem ranking no arquivo: reconstrói pelo preço dentro de cada produto
+                elif 'Preço' in df.columns and 'Produto' in df.columns:
+                    df['Ranking'] = reconstruir_ranking(df)
+                    df['Status'] = status_por_ranking(df, coluna_ranking='Ranking')
+                    print("Ranking reconstruído pelo Preço dentro de cada produto")
                 
                 # Caso contrário, assumir todos como possíveis candidatos
                 else:
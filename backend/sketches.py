@@ -0,0 +1,269 @@
+"""Resumos de tamanho fixo para analisar exports grandes em uma passada.
+
+O modo em fluxo lê o arquivo em blocos e descarta cada bloco depois de
+atualizar, por grupo (cluster e lojista):
+
+- t-digest dos gaps percentuais das ofertas PERDENDO contra o MAIS BARATO.
+  Os centroides são recomprimidos a cada bloco com a escala k1 (arco-seno),
+  que deixa centroides pequenos nas caudas. São no máximo ``compressao / 2``
+  centroides por grupo.
+- HyperLogLog de produtos e lojistas distintos: 2^precisao registradores de
+  um byte por grupo, com erro padrão de 1,04 / sqrt(2^precisao).
+- Space-saving dos produtos com maior Margem_Extra_RS: ``top_k`` contadores
+  por grupo. O valor de cada contador superestima o real em no máximo o seu
+  ``erro``, e esse erro nunca passa do menor contador do grupo. Quando os
+  blocos não partem produto, uma chave nunca volta depois de sair dos
+  contadores, e então o top-k sai exato (erro zero).
+
+Tudo é vetorizado sobre os grupos do bloco: cada estrutura é um DataFrame ou
+uma matriz numpy, e não há objeto por grupo.
+"""
+import numpy as np
+import pandas as pd
+
+DIMENSOES_SKETCH = ['Cluster', 'Lojista']
+QUANTIS_GAP = [0.5, 0.9, 0.99]
+
+
+def novo_estado(compressao=200, precisao_hll=12, top_k=10, blocos_por_produto=True):
+    """Estado vazio dos resumos (um por dimensão, todos de tamanho fixo por grupo).
+
+    ``blocos_por_produto`` diz que cada produto chega inteiro em um bloco só,
+    como na leitura do modo em fluxo.
+    """
+    return {
+        'blocos_por_produto': blocos_por_produto,
+        'compressao': compressao,
+        'precisao_hll': precisao_hll,
+        'top_k': top_k,
+        'linhas': 0,
+        'digest': {d: pd.DataFrame({'grupo': pd.Series(dtype=object), 'media': pd.Series(dtype='float64'),
+                                    'peso': pd.Series(dtype='float64')}) for d in DIMENSOES_SKETCH},
+        'extremos': {d: pd.DataFrame({'minimo': pd.Series(dtype='float64'), 'maximo': pd.Series(dtype='float64')})
+                     for d in DIMENSOES_SKETCH},
+        'hll': {},
+        'top': {d: pd.DataFrame({'grupo': pd.Series(dtype=object), 'Produto': pd.Series(dtype=object),
+                                 'Lojista': pd.Series(dtype=object), 'valor': pd.Series(dtype='float64'),
+                                 'erro': pd.Series(dtype='float64')}) for d in DIMENSOES_SKETCH},
+    }
+
+
+# ---------------------------------------------------------------------------
+# t-digest
+# ---------------------------------------------------------------------------
+
+def _comprimir_digest(pontos, compressao):
+    """Junta pontos/centroides vizinhos de cada grupo na escala k1.
+
+    Centroides cujo quantil central cai na mesma unidade de
+    k = compressao / (2 pi) * asin(2q - 1) viram um só.
+    """
+    pontos = pontos.sort_values(['grupo', 'media'], kind='stable')
+    grupo = pontos['grupo'].to_numpy()
+    peso = pontos['peso'].to_numpy()
+    acumulado = pontos.groupby('grupo', sort=False)['peso'].cumsum().to_numpy()
+    total = pontos.groupby('grupo', sort=False)['peso'].transform('sum').to_numpy()
+    q = (acumulado - peso / 2) / total
+    faixa = np.floor(compressao / (2 * np.pi) * np.arcsin(np.clip(2 * q - 1, -1, 1)))
+    tabela = pd.DataFrame({'grupo': grupo, 'faixa': faixa, 'peso': peso,
+                           'momento': pontos['media'].to_numpy() * peso})
+    juntos = tabela.groupby(['grupo', 'faixa'], sort=True)[['peso', 'momento']].sum()
+    return pd.DataFrame({
+        'grupo': juntos.index.get_level_values('grupo'),
+        'media': (juntos['momento'] / juntos['peso']).to_numpy(),
+        'peso': juntos['peso'].to_numpy(),
+    })
+
+
+def _atualizar_digest(estado, dimensao, grupos, valores):
+    novos = pd.DataFrame({'grupo': grupos, 'media': valores, 'peso': 1.0})
+    juntos = pd.concat([estado['digest'][dimensao], novos], ignore_index=True)
+    estado['digest'][dimensao] = _comprimir_digest(juntos, estado['compressao'])
+
+    extremos = novos.groupby('grupo', sort=False)['media'].agg(minimo='min', maximo='max')
+    atual = estado['extremos'][dimensao]
+    combinados = pd.concat([atual, extremos])
+    estado['extremos'][dimensao] = combinados.groupby(level=0).agg({'minimo': 'min', 'maximo': 'max'})
+
+
+def _quantis_digest(centroides, minimo, maximo, quantis):
+    """Quantis interpolados entre os centroides e o erro de rank de cada um (em %)."""
+    peso = centroides['peso'].to_numpy()
+    media = centroides['media'].to_numpy()
+    total = peso.sum()
+    meio = np.cumsum(peso) - peso / 2
+    alvo = np.asarray(quantis) * total
+    valores = np.interp(alvo, np.concatenate([[0], meio, [total]]), np.concatenate([[minimo], media, [maximo]]))
+    # O valor interpolado fica entre dois centroides: o rank real pode variar
+    # até metade do peso de cada um deles
+    direita = np.clip(np.searchsorted(meio, alvo), 0, len(peso) - 1)
+    esquerda = np.clip(direita - 1, 0, len(peso) - 1)
+    erro = (peso[esquerda] + peso[direita]) / 2 / total * 100
+    return valores, erro
+
+
+# ---------------------------------------------------------------------------
+# HyperLogLog
+# ---------------------------------------------------------------------------
+
+def _atualizar_hll(estado, chave, grupos, valores):
+    """Registradores por grupo: índice nos bits altos do hash, posição do 1º bit nos 32 seguintes."""
+    precisao = estado['precisao_hll']
+    m = 1 << precisao
+    hll = estado['hll'].setdefault(chave, {'grupos': pd.Index([], dtype=object),
+                                           'registros': np.zeros((0, m), dtype=np.uint8)})
+    novos_grupos = pd.Index(pd.unique(grupos)).difference(hll['grupos'])
+    if len(novos_grupos):
+        hll['grupos'] = hll['grupos'].append(novos_grupos)
+        hll['registros'] = np.vstack([hll['registros'], np.zeros((len(novos_grupos), m), dtype=np.uint8)])
+
+    hashes = pd.util.hash_array(np.asarray(valores, dtype=object))
+    indice = (hashes >> np.uint64(64 - precisao)).astype(np.int64)
+    resto = ((hashes >> np.uint64(32 - precisao)) & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    posicao = np.where(resto > 0, 32 - np.floor(np.log2(np.maximum(resto, 1))), 33).astype(np.uint8)
+    linhas = hll['grupos'].get_indexer(grupos)
+    np.maximum.at(hll['registros'], (linhas, indice), posicao)
+
+
+def _estimar_hll(registros):
+    """Estimativa de cardinalidade por linha, com a correção de contagem linear para poucos itens."""
+    m = registros.shape[1]
+    alfa = 0.7213 / (1 + 1.079 / m)
+    bruta = alfa * m * m / np.power(2.0, -registros.astype(np.float64)).sum(axis=1)
+    zeros = (registros == 0).sum(axis=1)
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((bruta <= 2.5 * m) & (zeros > 0), linear, bruta)
+
+
+def _contagens_hll(estado, chave):
+    hll = estado['hll'].get(chave)
+    if hll is None:
+        return pd.Series(dtype='float64')
+    return pd.Series(_estimar_hll(hll['registros']), index=hll['grupos'])
+
+
+# ---------------------------------------------------------------------------
+# Space-saving
+# ---------------------------------------------------------------------------
+
+def _atualizar_top(estado, dimensao, novos):
+    """Funde os contadores do grupo com as somas exatas do bloco e guarda os top_k.
+
+    Chave nova entra com o menor contador do grupo (se o grupo já está cheio)
+    somado ao valor do bloco; esse mínimo vira o erro da chave. Com blocos
+    por produto a chave nova não pode ter sido vista antes e entra sem erro.
+    """
+    k = estado['top_k']
+    chaves = ['grupo', 'Produto', 'Lojista']
+    atual = estado['top'][dimensao]
+    cheio = atual.groupby('grupo', sort=False)['valor'].agg(['size', 'min'])
+    minimo = cheio['min'].where((cheio['size'] >= k) & (not estado['blocos_por_produto']), 0.0)
+
+    junto = atual.merge(novos, on=chaves, how='outer', suffixes=('', '_bloco'))
+    piso = junto['grupo'].map(minimo).fillna(0.0)
+    ausente = junto['valor'].isna()
+    junto['erro'] = junto['erro'].where(~ausente, piso)
+    junto['valor'] = junto['valor'].where(~ausente, piso) + junto['valor_bloco'].fillna(0.0)
+    junto = junto.sort_values(['grupo', 'valor'], ascending=[True, False], kind='stable')
+    estado['top'][dimensao] = junto.groupby('grupo', sort=False).head(k)[chaves + ['valor', 'erro']]
+
+
+# ---------------------------------------------------------------------------
+# Atualização e resumo
+# ---------------------------------------------------------------------------
+
+def _grupos(df, dimensao):
+    if dimensao in df.columns:
+        return df[dimensao].astype(str).to_numpy()
+    return np.full(len(df), 'Sem cluster' if dimensao == 'Cluster' else '', dtype=object)
+
+
+def atualizar_sketches(estado, df, sugestoes):
+    """Incorpora um bloco já preparado pelo engine (ofertas e sugestões)."""
+    estado['linhas'] += len(df)
+    produtos = df['Produto'].astype(str).to_numpy()
+    lojistas = df['Lojista'].astype(str).to_numpy()
+
+    # Gap das ofertas perdendo sobre o MAIS BARATO, em %
+    gap = None
+    if 'Preço_Concorrente' in df.columns:
+        concorrente = df['Preço_Concorrente'].astype('float64')
+        gap = ((df['Preço'].astype('float64') - concorrente) / concorrente.where(concorrente > 0) * 100).to_numpy()
+        perdendo = (df['Status'] == 'PERDENDO').to_numpy() if (df['Status'] != '').any() else gap > 0
+        gap_valido = perdendo & np.isfinite(gap)
+
+    oportunidades = sugestoes[sugestoes['Margem_Extra_RS'] > 0] if len(sugestoes) else sugestoes
+    _atualizar_hll(estado, ('global', 'produtos'), np.zeros(len(df), dtype=object), produtos)
+    _atualizar_hll(estado, ('global', 'lojistas'), np.zeros(len(df), dtype=object), lojistas)
+    for dimensao in DIMENSOES_SKETCH:
+        grupos = _grupos(df, dimensao)
+        _atualizar_hll(estado, (dimensao, 'produtos'), grupos, produtos)
+        if dimensao != 'Lojista':
+            _atualizar_hll(estado, (dimensao, 'lojistas'), grupos, lojistas)
+        if gap is not None and gap_valido.any():
+            _atualizar_digest(estado, dimensao, grupos[gap_valido], gap[gap_valido])
+        if len(oportunidades):
+            posicoes = df.index.get_indexer(oportunidades.index)
+            novos = pd.DataFrame({'grupo': grupos[posicoes], 'Produto': oportunidades['Produto'].astype(str).to_numpy(),
+                                  'Lojista': oportunidades['Lojista'].astype(str).to_numpy(),
+                                  'valor_bloco': oportunidades['Margem_Extra_RS'].astype('float64').to_numpy()})
+            novos = novos.groupby(['grupo', 'Produto', 'Lojista'], sort=False, as_index=False)['valor_bloco'].sum()
+            _atualizar_top(estado, dimensao, novos)
+
+
+def memoria_sketches(estado):
+    """Bytes ocupados pelos resumos (não depende do número de linhas lidas)."""
+    total = sum(h['registros'].nbytes for h in estado['hll'].values())
+    for tabelas in (estado['digest'], estado['extremos'], estado['top']):
+        total += sum(int(t.memory_usage(index=True, deep=True).sum()) for t in tabelas.values())
+    return total
+
+
+def resumir_sketches(estado, centavos=True, quantis=QUANTIS_GAP):
+    """Respostas aproximadas por cluster e por lojista, com os limites de erro."""
+    escala = 100 if centavos else 1
+    rotulos = [f'p{round(q * 100):g}' for q in quantis]
+    resposta = {}
+    for dimensao in DIMENSOES_SKETCH:
+        produtos = _contagens_hll(estado, (dimensao, 'produtos'))
+        lojistas = _contagens_hll(estado, (dimensao, 'lojistas'))
+        digest = estado['digest'][dimensao]
+        extremos = estado['extremos'][dimensao]
+        centroides = dict(tuple(digest.groupby('grupo', sort=False)))
+        top = dict(tuple(estado['top'][dimensao].groupby('grupo', sort=False)))
+
+        linhas = []
+        for grupo in sorted(produtos.index, key=str):
+            item = {dimensao.lower(): grupo, 'produtos_distintos': int(round(produtos[grupo]))}
+            if dimensao != 'Lojista':
+                item['lojistas_distintos'] = int(round(lojistas.get(grupo, 0)))
+            if grupo in centroides:
+                valores, erros = _quantis_digest(centroides[grupo], extremos.at[grupo, 'minimo'],
+                                                 extremos.at[grupo, 'maximo'], quantis)
+                item['ofertas_perdendo'] = int(centroides[grupo]['peso'].sum())
+                item['gap_pct_perdendo'] = {r: round(float(v), 2) for r, v in zip(rotulos, valores)}
+                item['gap_erro_rank_pct'] = {r: round(float(e), 3) for r, e in zip(rotulos, erros)}
+            contadores = top.get(grupo)
+            item['top_oportunidades'] = [] if contadores is None else [
+                {'Produto': c.Produto, 'Lojista': c.Lojista, 'Margem_Extra_RS': round(c.valor / escala, 2),
+                 'erro_max_rs': round(c.erro / escala, 2)}
+                for c in contadores.itertuples(index=False)
+            ]
+            linhas.append(item)
+        resposta['por_' + dimensao.lower()] = linhas
+
+    m = 1 << estado['precisao_hll']
+    resposta['global'] = {
+        'linhas': estado['linhas'],
+        'produtos_distintos': int(round(_contagens_hll(estado, ('global', 'produtos')).sum())),
+        'lojistas_distintos': int(round(_contagens_hll(estado, ('global', 'lojistas')).sum())),
+    }
+    resposta['limites_erro'] = {
+        'distintos_erro_padrao_pct': round(1.04 / np.sqrt(m) * 100, 2),
+        'tdigest_compressao': estado['compressao'],
+        'tdigest_max_centroides_por_grupo': estado['compressao'] // 2,
+        'top_k': estado['top_k'],
+        'top_k_exato': estado['blocos_por_produto'],
+        'memoria_bytes': memoria_sketches(estado),
+    }
+    return resposta
@@ -0,0 +1,51 @@
+"""Cache em memória dos snapshots analisados.
+
+Cada upload vira um snapshot identificado pelo hash do arquivo e das opções
+de análise que mudam o resultado (o mesmo arquivo com ?preco=efetivo é outro
+snapshot). Guardamos o
+DataFrame normalizado, as sugestões e os agregados para que consultas
+posteriores não precisem reprocessar o CSV. O cache é por processo e limitado
+em quantidade (os mais antigos saem primeiro): o app roda num worker só do
+gunicorn, com threads (ver Dockerfile), para que todas as requisições vejam
+os mesmos snapshots.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+MAX_SNAPSHOTS = int(os.environ.get('ANALYZER_MAX_SNAPSHOTS', '8'))
+
+_snapshots = OrderedDict()
+_lock = threading.Lock()
+
+
+def gerar_snapshot_id(raw_bytes, **opcoes):
+    """Identificador estável do arquivo enviado e das ``opcoes`` da análise.
+
+    Opções com valor None ficam de fora; sem opções o id é o hash só do arquivo.
+    """
+    h = hashlib.sha1(raw_bytes)
+    for nome, valor in sorted(opcoes.items()):
+        if valor is not None:
+            h.update(f'\x1f{nome}={valor}'.encode('utf-8'))
+    return h.hexdigest()[:16]
+
+
+def salvar_snapshot(snapshot_id, **dados):
+    """Guarda o snapshot; cada um ganha um lock próprio para atualizações."""
+    dados.setdefault('lock', threading.Lock())
+    with _lock:
+        _snapshots[snapshot_id] = dados
+        _snapshots.move_to_end(snapshot_id)
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+
+
+def obter_snapshot(snapshot_id):
+    """Retorna o dict do snapshot ou None se ele não estiver (mais) no cache."""
+    with _lock:
+        dados = _snapshots.get(snapshot_id)
+        if dados is not None:
+            _snapshots.move_to_end(snapshot_id)
+        return dados
@@ -5,12 +5,18 @@ import logging
 from io import StringIO
 import re
 
+from alerts import avaliar_alertas, listar_alertas, regras_aplicaveis
+from engine import secoes_solicitadas
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app)
 
+# Seções pesadas de 'analise' que podem ser omitidas via ?fields=
+SECOES_ANALISE = ['detalhes_produtos', 'resumo_por_lojista', 'alertas']
+
 def clean_price_value(value):
     """Converte valor monetário brasileiro para float"""
     if pd.isna(value):
@@ -47,6 +53,13 @@ def analyze_file():
     if file.filename == '':
         return jsonify({'error': 'Nome de arquivo vazio'}), 400
     
+    secoes = secoes_solicitadas(request.args.get('fields'), SECOES_ANALISE, SECOES_ANALISE)
+    if 'error' in secoes:
+        return jsonify(secoes), 400
+    secoes = secoes['secoes']
+    # O resumo por lojista é montado a partir dos detalhes
+    precisa_detalhes = 'detalhes_produtos' in secoes or 'resumo_por_lojista' in secoes
+    
     try:
         # Ler arquivo
         file_content = file.read().decode('utf-8')
@@ -149,16 +162,17 @@ def analyze_file():
                 margem_total_perda += margem
                 count_perda += 1
             
-            detalhes.append({
-                'produto': produto,
-                'lojista': lojista,
-                'preco': preco,
-                'mais_barato': mais_barato,
-                'status': status,
-                'ranking': ranking,
-                'margem_percentual': round(margem, 2),
-                'diferenca_valor': diferenca_raw if diferenca_raw is not None else round(preco - mais_barato, 2) if (preco > 0 and mais_barato > 0) else 0
-            })
+            if precisa_detalhes:
+                detalhes.append({
+                    'produto': produto,
+                    'lojista': lojista,
+                    'preco': preco,
+                    'mais_barato': mais_barato,
+                    'status': status,
+                    'ranking': ranking,
+                    'margem_percentual': round(margem, 2),
+                    'diferenca_valor': diferenca_raw if diferenca_raw is not None else round(preco - mais_barato, 2) if (preco > 0 and mais_barato > 0) else 0
+                })
         
         # Calcular médias
         margem_media_ganho = round(margem_total_ganho / count_ganho, 2) if count_ganho > 0 else 0
@@ -166,7 +180,7 @@ def analyze_file():
         
         # Resumo por lojista
         resumo_lojistas = {}
-        for detail in detalhes:
+        for detail in (detalhes if 'resumo_por_lojista' in secoes else []):
             loj = detail['lojista']
             if loj not in resumo_lojistas:
                 resumo_lojistas[loj] = {'produtos': 0, 'ganhando': 0, 'perdendo': 0, 'receita_total': 0}
@@ -181,10 +195,11 @@ def analyze_file():
         
         # Alertas
         alertas = []
-        if produtos_perdendo > produtos_ganhando:
-            alertas.append("⚠️ Mais produtos perdendo do que ganhando - revisar precificação")
-        if margem_media_perda < -20:
-            alertas.append(f"🚨 Margem de perda muito alta: {margem_media_perda}%")
+        if 'alertas' in secoes:
+            resumo = pd.DataFrame([{'ganhando': produtos_ganhando, 'perdendo': produtos_perdendo,
+                                    'perdendo_com_gap': count_perda, 'soma_gap_pct_perdendo': margem_total_perda}])
+            estado = avaliar_alertas(resumo, regras=regras_aplicaveis(resumo))
+            alertas = [alerta['mensagem'] for alerta in listar_alertas(estado)]
         
         resultado = {
             'success': True,
@@ -203,6 +218,9 @@ def analyze_file():
                 'alertas': alertas
             }
         }
+        for secao in SECOES_ANALISE:
+            if secao not in secoes:
+                del resultado['analise'][secao]
         
         logger.info(f"✅ Análise concluída: {produtos_ganhando} ganhando, {produtos_perdendo} perdendo")
         return jsonify(resultado)
@@ -0,0 +1,66 @@
+"""Relatório do custo de import de cada módulo na partida.
+
+Roda ``python -X importtime -c 'import <modulo>'`` num processo novo (cache de
+módulos vazio, como um worker do gunicorn recém-criado ou a CLI) e soma o
+tempo próprio de cada módulo no seu pacote de topo (pandas.core.frame conta
+em pandas, scipy puxado pelo sklearn conta em scipy). Serve para ver o que
+pesa na partida e conferir que as dependências carregadas sob demanda
+(scikit-learn, scipy, joblib) não voltaram para o import do app ou da CLI.
+
+Uso: ``python startup.py [modulo] [top]`` (padrão: app, 15; a CLI é
+``analyze_csv_standalone``).
+"""
+import os
+import subprocess
+import sys
+
+# Só devem ser importadas no primeiro uso (treino, predição, modo 'similar'...)
+DEPENDENCIAS_SOB_DEMANDA = ['sklearn', 'scipy', 'joblib']
+
+
+def relatorio_importacao(modulo='app', top=15):
+    """Tempo total do import de ``modulo`` e os pacotes que mais custam, em ms."""
+    diretorio = os.path.dirname(os.path.abspath(__file__))
+    caminhos = os.pathsep.join([diretorio, os.path.dirname(diretorio)])  # backend/ e a raiz (CLI)
+    processo = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+        cwd=diretorio, capture_output=True, text=True, env={**os.environ, 'PYTHONPATH': caminhos},
+    )
+    if processo.returncode != 0:
+        return {'error': processo.stderr.strip().splitlines()[-1] if processo.stderr.strip() else 'falha no import'}
+
+    pacotes, total_us = {}, 0
+    for linha in processo.stderr.splitlines():
+        if not linha.startswith('import time:') or '|' not in linha:
+            continue
+        proprio, cumulativo, nome = linha.split('|')
+        proprio = proprio.replace('import time:', '').strip()
+        if not proprio.isdigit():
+            continue  # cabeçalho
+        nome = nome.strip()
+        raiz = nome.split('.')[0]
+        pacotes[raiz] = pacotes.get(raiz, 0) + int(proprio)
+        if nome == modulo:
+            total_us = int(cumulativo)
+
+    ordenados = sorted(pacotes.items(), key=lambda p: -p[1])
+    return {
+        'modulo': modulo,
+        'total_ms': round(total_us / 1000, 1),
+        'pacotes': [{'pacote': nome, 'proprio_ms': round(us / 1000, 1)} for nome, us in ordenados[:top]],
+        'sob_demanda_carregadas': [d for d in DEPENDENCIAS_SOB_DEMANDA if d in pacotes],
+    }
+
+
+if __name__ == '__main__':
+    relatorio = relatorio_importacao(sys.argv[1] if len(sys.argv) > 1 else 'app',
+                                     int(sys.argv[2]) if len(sys.argv) > 2 else 15)
+    if 'error' in relatorio:
+        print(f"Erro: {relatorio['error']}")
+        sys.exit(1)
+    print(f"import {relatorio['modulo']}: {relatorio['total_ms']:.1f} ms")
+    for pacote in relatorio['pacotes']:
+        print(f"  {pacote['proprio_ms']:>9.1f} ms  {pacote['pacote']}")
+    if relatorio['sob_demanda_carregadas']:
+        print(f"Atenção: importadas na partida: {', '.join(relatorio['sob_demanda_carregadas'])}")
+        sys.exit(1)
@@ -0,0 +1,82 @@
+"""Configuração comum dos testes do backend.
+
+Os módulos do backend se importam pelo nome (``from engine import ...``), então
+backend/ entra no sys.path. O registro, o cache de modelos e os históricos vão
+para um diretório temporário antes de qualquer import, para os testes não
+tocarem no ~/.local/share do usuário.
+"""
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+_DIRETORIO_TESTES = tempfile.mkdtemp(prefix='webprice-testes-')
+os.environ['ANALYZER_DATA_DIR'] = _DIRETORIO_TESTES
+os.environ['ANALYZER_MODEL_REGISTRY'] = os.path.join(_DIRETORIO_TESTES, 'registro')
+os.environ['ANALYZER_MODEL_CACHE'] = os.path.join(_DIRETORIO_TESTES, 'modelos')
+os.environ['ANALYZER_WINPROB_HISTORY'] = os.path.join(_DIRETORIO_TESTES, 'vitoria.joblib')
+os.environ['ANALYZER_ONLINE_MODEL'] = os.path.join(_DIRETORIO_TESTES, 'online.joblib')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CABECALHO_EXPORT = ['PRODUTO', 'MARCA', 'N° DE LOJAS', 'MAIS BARATO', 'STATUS', 'CÓDIGO CLUSTER', 'CÓDIGO INTERNO',
+                    'RANKING', 'LOJISTA', 'SELLERS', 'PRECO', 'DIFERENÇA', 'PERCENTUAL']
+
+
+def ofertas_sinteticas(produtos=60, lojistas=5, semente=0):
+    """Ofertas agrupadas por produto: Produto, Marca, Cluster, Lojista e Preço (reais).
+
+    Os preços de um produto ficam a ±15% do preço base, longe do limite de
+    outlier, e cada produto tem de 2 a ``lojistas`` ofertas de lojistas distintos.
+    """
+    gerador = np.random.default_rng(semente)
+    linhas = []
+    for p in range(produtos):
+        base = float(gerador.uniform(50, 500))
+        quantidade = int(gerador.integers(2, lojistas + 1))
+        for lojista in gerador.permutation(lojistas)[:quantidade]:
+            linhas.append({
+                'Produto': f'Produto {p}', 'Marca': f'Marca {p % 4}', 'Cluster': f'CL{p % 3}',
+                'Lojista': f'Loja {lojista}', 'Preço': round(base * float(gerador.uniform(0.85, 1.15)), 2),
+            })
+    return pd.DataFrame(linhas)
+
+
+def montar_export(ofertas, mais_barato=None):
+    """Texto do export do WebPrice (linha de filtros + cabeçalho, ``;`` e vírgula decimal).
+
+    RANKING (denso, pelo preço) e STATUS saem dos preços como no WebPrice; o
+    MAIS BARATO é o menor preço do produto, a não ser que venha em ``mais_barato``.
+    """
+    precos = ofertas['Preço']
+    ranking = precos.groupby(ofertas['Produto'], sort=False).rank(method='dense').astype(int)
+    primeiro = ranking == 1
+    empatados = primeiro.groupby(ofertas['Produto'], sort=False).transform('sum') > 1
+    status = np.where(primeiro & empatados, 'EMPATANDO', np.where(primeiro, 'GANHANDO', 'PERDENDO'))
+    menor = precos.groupby(ofertas['Produto'], sort=False).transform('min') if mais_barato is None else mais_barato
+    lojas = ofertas.groupby('Produto', sort=False)['Lojista'].transform('size')
+
+    def reais(valores):
+        return [f'{v:.2f}'.replace('.', ',') for v in valores]
+
+    tabela = pd.DataFrame({
+        'PRODUTO': ofertas['Produto'], 'MARCA': ofertas['Marca'], 'N° DE LOJAS': lojas,
+        'MAIS BARATO': reais(menor), 'STATUS': status, 'CÓDIGO CLUSTER': ofertas['Cluster'],
+        'CÓDIGO INTERNO': range(len(ofertas)), 'RANKING': ranking, 'LOJISTA': ofertas['Lojista'],
+        'SELLERS': lojas, 'PRECO': reais(precos), 'DIFERENÇA': reais(precos - menor),
+        'PERCENTUAL': [f'{v:.1f}%' for v in (precos - menor) / menor * 100],
+    })[CABECALHO_EXPORT]
+    return 'Filtros: teste' + ';' * (len(CABECALHO_EXPORT) - 1) + '\n' + tabela.to_csv(sep=';', index=False)
+
+
+@pytest.fixture
+def ofertas():
+    return ofertas_sinteticas()
+
+
+@pytest.fixture
+def export(ofertas):
+    return montar_export(ofertas)
@@ -0,0 +1,43 @@
+import io
+
+import pandas as pd
+
+from aggregates import consultar_cubo, construir_cubo, somar_cubos
+from app import app
+from snapshots import gerar_snapshot_id, obter_snapshot
+
+
+def _ofertas(lojista, status, quantidade, preco=1000, concorrente=900):
+    return pd.DataFrame({'Lojista': lojista, 'Marca': 'Acme', 'Cluster': 'CL0', 'Status': [status] * quantidade,
+                         'Preço': preco, 'Preço_Concorrente': concorrente})
+
+
+def _cubo(df):
+    return construir_cubo(df, pd.DataFrame({'Margem_Extra_RS': 0}, index=df.index))
+
+
+def test_cubos_somam_e_consultam_em_reais():
+    a, b = _ofertas('Loja A', 'PERDENDO', 2), _ofertas('Loja B', 'PERDENDO', 3, preco=2000, concorrente=1000)
+    cubo = somar_cubos(_cubo(a), _cubo(b))
+    assert cubo.equals(_cubo(pd.concat([a, b], ignore_index=True)))
+    resumo = {r['Lojista']: r for r in consultar_cubo(cubo, ['Lojista'])}
+    assert resumo['Loja A']['gap_medio'] == 1.0 and resumo['Loja B']['gap_medio'] == 10.0
+    assert resumo['Loja B']['gap_percentual_medio_perdendo'] == 100.0
+    assert consultar_cubo(cubo, [], {'Lojista': ['Loja B']})[0]['ofertas'] == 3
+
+
+def test_snapshot_id_depende_das_opcoes():
+    assert gerar_snapshot_id(b'abc') == gerar_snapshot_id(b'abc', base=None)
+    assert gerar_snapshot_id(b'abc', outliers='excluir') != gerar_snapshot_id(b'abc', outliers='ignorar')
+
+
+def test_mesmo_arquivo_com_outras_opcoes_nao_substitui_o_snapshot(export):
+    cliente = app.test_client()
+    ids = []
+    for outliers in ('excluir', 'ignorar'):
+        resposta = cliente.post(f'/analyze?fields=snapshot_id&outliers={outliers}',
+                                data={'file': (io.BytesIO(export.encode('utf-8')), 'export.csv')})
+        assert resposta.status_code == 200
+        ids.append(resposta.get_json()['snapshot_id'])
+    assert ids[0] != ids[1]
+    assert all(obter_snapshot(i) is not None for i in ids)
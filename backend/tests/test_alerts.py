@@ -0,0 +1,56 @@
+import pandas as pd
+
+from aggregates import atualizar_cubo, construir_cubo
+from alerts import avaliar_alertas, listar_alertas, reavaliar_alertas, regras_aplicaveis
+
+
+def _ofertas(lojista, status, quantidade, marca='Acme', preco=1000, concorrente=900):
+    return pd.DataFrame({'Lojista': lojista, 'Marca': marca, 'Cluster': 'CL0', 'Status': [status] * quantidade,
+                         'Preço': preco, 'Preço_Concorrente': concorrente})
+
+
+def _cubo(df, margem=0):
+    sugestoes = pd.DataFrame({'Margem_Extra_RS': margem}, index=df.index)
+    return construir_cubo(df, sugestoes)
+
+
+def test_regras_por_lojista_e_total():
+    df = pd.concat([_ofertas('Loja A', 'PERDENDO', 8), _ofertas('Loja A', 'GANHANDO', 2, concorrente=1000),
+                    _ofertas('Loja B', 'GANHANDO', 5, concorrente=1000)], ignore_index=True)
+    estado = avaliar_alertas(_cubo(df))
+    assert list(estado['lojista_perdendo_share']) == [('Loja A',)]
+    assert estado['mais_perdendo_que_ganhando'] == {(): '⚠️ Mais produtos perdendo do que ganhando - revisar precificação'}
+    assert estado['lojista_perdeu_share'] == {}  # regra de delta sem cubo base
+    assert [a['regra'] for a in listar_alertas(estado)][:2] == ['mais_perdendo_que_ganhando', 'lojista_perdendo_share']
+
+
+def test_regras_de_delta_comparam_com_o_cubo_base():
+    base = _cubo(_ofertas('Loja A', 'GANHANDO', 10, concorrente=1000))
+    atual = _cubo(pd.concat([_ofertas('Loja A', 'GANHANDO', 5, concorrente=1000),
+                             _ofertas('Loja A', 'PERDENDO', 5)], ignore_index=True))
+    estado = avaliar_alertas(atual, cubo_base=base)
+    assert '-50.0 p.p.' in estado['lojista_perdeu_share'][('Loja A',)]
+
+
+def test_reavaliacao_incremental_igual_a_completa():
+    antes = pd.concat([_ofertas('Loja A', 'GANHANDO', 10, concorrente=1000),
+                       _ofertas('Loja B', 'GANHANDO', 10, marca='Beta', concorrente=1000)], ignore_index=True)
+    cubo = _cubo(antes)
+    estado = avaliar_alertas(cubo)
+    assert listar_alertas(estado) == []
+
+    depois = antes.copy()
+    depois.loc[:7, 'Status'] = 'PERDENDO'
+    depois.loc[:7, 'Preço_Concorrente'] = 900
+    sugestoes = pd.DataFrame({'Margem_Extra_RS': 0}, index=antes.index)
+    delta = atualizar_cubo(cubo, antes, sugestoes, depois, sugestoes)
+    reavaliadas = reavaliar_alertas(estado, cubo, delta)
+    assert 'lojista_perdendo_share' in reavaliadas
+    assert estado == avaliar_alertas(_cubo(depois))
+    assert cubo.equals(_cubo(depois))
+
+
+def test_regras_aplicaveis_a_um_resumo_sem_dimensoes():
+    resumo = pd.DataFrame({'ganhando': [3], 'perdendo': [5]})
+    assert [r['id'] for r in regras_aplicaveis(resumo)] == ['mais_perdendo_que_ganhando']
+
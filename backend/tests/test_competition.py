@@ -0,0 +1,42 @@
+import pandas as pd
+
+from competition import anexar_concorrencia, concorrencia_por_cluster, metricas_concorrencia
+
+
+def _ofertas():
+    return pd.DataFrame({
+        'Produto': ['A'] + ['B'] * 4 + ['C'] * 10 + ['D', 'D'],
+        'Cluster': ['CL1'] * 5 + ['CL2'] * 12,
+        'Preço': [5000] + [1000] * 4 + [2000] * 10 + [10000, 20000],
+    })
+
+
+def test_hhi_pelo_inverso_do_preco():
+    metricas = metricas_concorrencia(_ofertas())
+    assert metricas['HHI_Preco'].to_dict() == {'A': 10000, 'B': 2500, 'C': 1000, 'D': 5556}
+    assert metricas['Nivel_Concorrencia'].to_dict() == {'A': 'Concentrado', 'B': 'Concentrado', 'C': 'Pulverizado',
+                                                        'D': 'Concentrado'}
+    assert metricas.loc['D', 'Spread_Preco_Pct'] == 100.0 and metricas.loc['D', 'CV_Preco_Pct'] == 47.14
+    assert metricas.loc['A', 'CV_Preco_Pct'] == 0.0
+    assert metricas.loc['D', 'Preco_Medio'] == 150.0  # centavos viram reais
+
+
+def test_lojas_do_export_e_preco_zero():
+    df = _ofertas().assign(Num_Lojas=[3] + [None] * 16)
+    df.loc[df['Produto'] == 'B', 'Preço'] = [1000, 1000, 0, 0]
+    metricas = metricas_concorrencia(df)
+    assert metricas.loc['A', 'Lojas_Mercado'] == 3  # N° DE LOJAS do export
+    assert metricas.loc['B', ['Ofertas_Produto', 'Lojas_Mercado', 'HHI_Preco']].tolist() == [2, 2, 5000]
+
+
+def test_rollup_por_cluster_e_anexo_nas_sugestoes():
+    metricas = metricas_concorrencia(_ofertas())
+    resumo = {r['Cluster']: r for r in concorrencia_por_cluster(metricas)}
+    assert resumo['CL1']['produtos'] == 2 and resumo['CL1']['ofertas'] == 5
+    assert resumo['CL1']['produtos_concentrados'] == 2 and resumo['CL2']['produtos_concentrados'] == 1
+    assert resumo['CL2']['hhi_medio'] == 3278.0
+
+    sugestoes = pd.DataFrame({'Produto': ['D', 'A'], 'Preço_Sugerido': [9000, 4500]}, index=[7, 3])
+    anexadas = anexar_concorrencia(sugestoes, metricas)
+    assert list(anexadas.index) == [7, 3]
+    assert anexadas['HHI_Preco'].tolist() == [5556, 10000]
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+from dedup import _pares_lsh, _pares_no_bucket, assinaturas_minhash, deduplicar_ofertas
+
+
+def test_duplicatas_so_do_mesmo_lojista_e_mesmos_numeros():
+    df = pd.DataFrame({
+        'Lojista': ['A', 'A', 'A', 'B', 'A', 'A'],
+        'Produto': ['Smartphone X 128GB', 'Smartphone  X 128 GB', 'Smartphone X 256GB', 'Smartphone X 128GB',
+                    'Geladeira Frost Free Inox 450 Litros Preta', 'Geladeira Frost Free Inox 450 Litros Preto'],
+    })
+    duplicada, relatorio = deduplicar_ofertas(df)
+    assert duplicada.tolist() == [False, True, False, False, False, True]
+    assert relatorio['ofertas_duplicadas_removidas'] == 2
+    assert relatorio['ofertas_com_duplicata'] == 2
+
+
+def test_pares_no_bucket_cobre_todos_os_pares_de_cada_sequencia():
+    pares_i, pares_j = _pares_no_bucket(np.array([3, 1, 4, 0, 2, 5, 6]), np.array([5, 5, 5, 7, 9, 9, 11]))
+    pares = set(zip(np.concatenate(pares_i).tolist(), np.concatenate(pares_j).tolist()))
+    assert pares == {(3, 1), (3, 4), (1, 4), (2, 5)}
+
+
+def test_pares_lsh_sem_repeticao_entre_bandas():
+    nomes = pd.Series(['notebook gamer 16gb', 'notebook gamer 16gb', 'notebook gamer 16gb', 'cadeira'])
+    assinaturas = assinaturas_minhash(nomes)
+    i, j = _pares_lsh(assinaturas, np.zeros(len(nomes), dtype=np.uint64), bandas=8)
+    assert sorted(zip(i.tolist(), j.tolist())) == [(0, 1), (0, 2), (1, 2)]
@@ -0,0 +1,124 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from app import analyze_webprice_data_internal
+from conftest import montar_export
+from engine import (
+    aplicar_fator, detectar_outliers, para_centavos, precos_efetivos, reconstruir_ranking, refazer_ranking,
+    resumo_de_totais, status_por_ranking, sugestoes_por_ranking, sugestoes_por_status,
+)
+from snapshots import obter_snapshot
+
+
+def _ofertas(produtos, precos, **colunas):
+    return pd.DataFrame({'Produto': produtos, 'Lojista': [f'Loja {i}' for i in range(len(produtos))],
+                         'Preço': precos, **colunas})
+
+
+def test_ranking_denso_com_empate_e_sem_preco():
+    df = _ofertas(['A', 'A', 'A', 'A', 'B', 'B'], [10.0, 10.0, 12.0, 15.0, 0.0, 5.0])
+    ranking = reconstruir_ranking(df)
+    assert ranking.iloc[:4].tolist() == [1, 1, 2, 3]
+    assert np.isnan(ranking.iloc[4]) and ranking.iloc[5] == 1
+
+
+def test_status_por_ranking():
+    df = _ofertas(['A', 'A', 'A', 'B', 'B', 'C'], [10.0, 10.0, 12.0, 0.0, 5.0, 7.0])
+    df['RANKING'] = reconstruir_ranking(df)
+    assert status_por_ranking(df).tolist() == ['EMPATANDO', 'EMPATANDO', 'PERDENDO', '', 'GANHANDO', 'GANHANDO']
+
+
+def test_refazer_ranking_so_nas_linhas_pedidas():
+    df = _ofertas(['A', 'A', 'B', 'B'], [20.0, 10.0, 20.0, 10.0], RANKING=[1, 2, 1, 2],
+                  Status=['GANHANDO', 'PERDENDO', 'GANHANDO', 'PERDENDO'])
+    refazer_ranking(df, df['Produto'] == 'A')
+    assert df['RANKING'].tolist() == [2, 1, 1, 2]
+    assert df['Status'].tolist() == ['PERDENDO', 'GANHANDO', 'GANHANDO', 'PERDENDO']
+
+
+def test_export_sem_ranking_tem_o_ranking_reconstruido(export):
+    filtros, tabela = export.split('\n', 1)
+    sem_ranking = pd.read_csv(io.StringIO(tabela), sep=';', dtype=str).drop(columns=['RANKING', 'STATUS'])
+    texto = filtros + '\n' + sem_ranking.to_csv(sep=';', index=False)
+    completa = analyze_webprice_data_internal(io.StringIO(export), secoes=['ml_insights', 'status_counts'])
+    reconstruida = analyze_webprice_data_internal(io.StringIO(texto), secoes=['ml_insights', 'status_counts'])
+    assert reconstruida['ml_insights']['ranking_reconstruido']
+    assert reconstruida['status_counts'] == completa['status_counts']
+    assert reconstruida['ml_insights']['ganho_potencial_total_rs'] == completa['ml_insights']['ganho_potencial_total_rs']
+
+
+def test_para_centavos_arredonda_o_float():
+    centavos = para_centavos(pd.Series([0.29, 19.99, 0.1 + 0.2, None]))
+    assert centavos.dtype == 'int64'
+    assert centavos.tolist() == [29, 1999, 30, 0]
+
+
+def test_aplicar_fator_meio_centavo_para_cima():
+    assert aplicar_fator(pd.Series([105, 115, 1999]), 0.90).tolist() == [95, 104, 1799]
+    assert aplicar_fator(pd.Series([1990]), 0.95).tolist() == [1891]
+    assert aplicar_fator(pd.Series([10.0]), 0.95).tolist() == [9.5]
+
+
+def test_resumo_de_totais_em_centavos():
+    resumo = resumo_de_totais({'sugestoes': 4, 'oportunidades': 3, 'ganho': 10})
+    assert resumo['ganho_potencial_total_rs'] == 0.10
+    assert resumo['ganho_medio_por_produto'] == 0.03  # 2,5 centavos sobe
+    assert resumo_de_totais({'sugestoes': 0, 'oportunidades': 0, 'ganho': 0})['ganho_medio_por_produto'] == 0.0
+
+
+def test_sugestoes_por_ranking_protege_margem_e_ignora_preco_zero():
+    df = _ofertas(['A', 'A', 'B', 'B', 'C', 'C'], [10000, 12000, 10000, 10500, 0, 9000], RANKING=[1, 2, 1, 2, 1, 2])
+    sugestoes = sugestoes_por_ranking(df, fator=0.90).set_index('Produto')
+    assert list(sugestoes.index) == ['A', 'B']
+    assert sugestoes.loc['A', 'Preço_Sugerido'] == 10800
+    assert sugestoes.loc['A', 'Margem_Extra_RS'] == 800
+    assert sugestoes.loc['A', 'Tipo_Ajuste'] == 'Proteção da Margem'
+    assert sugestoes.loc['B', 'Preço_Sugerido'] == 10000
+    assert sugestoes.loc['B', 'Tipo_Ajuste'] == 'Manter Preço'
+
+
+def test_sugestoes_por_status_so_ganhando_com_preco():
+    df = _ofertas(['A', 'B', 'C', 'D'], [1000, 1000, 0, 1000], Preço_Concorrente=[1200, 1020, 1200, 1200],
+                  Status=['GANHANDO', 'GANHANDO', 'GANHANDO', 'PERDENDO'])
+    sugestoes = sugestoes_por_status(df, fator=0.95)
+    assert sugestoes['Produto'].tolist() == ['A']
+    assert sugestoes['Preço_Sugerido'].tolist() == [1140]
+
+
+def test_detectar_outliers_por_produto():
+    df = _ofertas(['A'] * 4 + ['B'] * 2, [29.90, 31.00, 30.50, 2990.0, 10.0, 1000.0],
+                  Preço_Concorrente=[29.90, 29.90, 2.99, 29.90, 10.0, 10.0])
+    oferta, concorrente = detectar_outliers(df)
+    assert oferta.tolist() == [False, False, False, True, False, False]  # B tem poucas ofertas
+    assert concorrente.tolist() == [False, False, True, False, False, False]
+
+
+def test_lider_outlier_excluido_refaz_ranking_e_status(ofertas):
+    tamanhos = ofertas.groupby('Produto')['Produto'].transform('size')
+    produto = ofertas.loc[tamanhos >= 4, 'Produto'].iloc[0]
+    linhas = ofertas[ofertas['Produto'] == produto].sort_values('Preço')
+    com_outlier = ofertas.copy()
+    com_outlier.loc[linhas.index[0], 'Preço'] = round(linhas['Preço'].iloc[0] / 100, 2)  # vírgula fora do lugar
+
+    secoes = ['status_counts', 'snapshot_id']
+    excluida = analyze_webprice_data_internal(io.StringIO(montar_export(com_outlier)), secoes=secoes,
+                                              snapshot_id='teste-outlier-lider', outliers='excluir')
+    sem_a_oferta = analyze_webprice_data_internal(io.StringIO(montar_export(ofertas.drop(linhas.index[0]))),
+                                                  secoes=secoes)
+    assert excluida['status_counts'] == sem_a_oferta['status_counts']
+
+    df = obter_snapshot('teste-outlier-lider')['df']
+    novo_lider = df[(df['Produto'] == produto) & (df['RANKING'] == 1)]
+    assert novo_lider['Lojista'].tolist() == [linhas['Lojista'].iloc[1]]
+    assert novo_lider['Status'].tolist() == ['GANHANDO']
+
+
+def test_precos_efetivos_traz_parcelas_a_valor_presente():
+    df = pd.DataFrame({'Preço': [12000, 12000, 5000], 'Parcelas': [12, 12, 1], 'Valor_Parcela': [1000, 1100, 0]})
+    efetivos = precos_efetivos(df, taxa_mensal=0.01)
+    fator_vp = (1 - 1.01 ** -12) / (0.01 * 12)
+    assert efetivos['Total_Parcelado'].tolist() == [12000, 13200, 5000]
+    assert efetivos['Preço_Efetivo'].tolist() == [round(12000 * fator_vp), 12000, 5000]
+    assert efetivos['Premio_Parcelamento_Pct'].tolist() == [0.0, 10.0, 0.0]
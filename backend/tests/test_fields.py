@@ -0,0 +1,49 @@
+import io
+
+import app as modulo_app
+from alerts import alertas_do_snapshot, avaliar_alertas
+from app import SECOES_ANALISE, SECOES_PADRAO, analyze_webprice_data_internal, app
+from engine import secoes_solicitadas
+from snapshots import obter_snapshot
+
+
+def _enviar(cliente, export, fields):
+    return cliente.post(f'/analyze?fields={fields}', data={'file': (io.BytesIO(export.encode('utf-8')), 'e.csv')})
+
+
+def test_secoes_solicitadas():
+    assert secoes_solicitadas(None, SECOES_ANALISE, SECOES_PADRAO) == {'secoes': SECOES_PADRAO}
+    assert secoes_solicitadas(' data, status_counts ,', SECOES_ANALISE, SECOES_PADRAO) == \
+        {'secoes': ['data', 'status_counts']}
+    assert 'error' in secoes_solicitadas('data,nada', SECOES_ANALISE, SECOES_PADRAO)
+
+
+def test_rota_devolve_so_as_secoes_pedidas(export):
+    cliente = app.test_client()
+    completa = _enviar(cliente, export, ','.join(SECOES_PADRAO)).get_json()
+    resposta = _enviar(cliente, export, 'status_counts,resumo_por_lojista')
+    assert resposta.status_code == 200
+    assert set(resposta.get_json()) == {'status_counts', 'resumo_por_lojista'}
+    assert resposta.get_json()['status_counts'] == completa['status_counts']
+
+    invalida = _enviar(cliente, export, 'status_counts,tudo')
+    assert invalida.status_code == 400 and 'tudo' in invalida.get_json()['error']
+
+
+def test_sem_secao_de_sugestoes_a_estrategia_nao_roda(export, monkeypatch):
+    def falhar(*args, **kwargs):
+        raise AssertionError('a estratégia não deveria rodar')
+
+    monkeypatch.setattr(modulo_app, 'sugestoes_por_ranking', falhar)
+    monkeypatch.setattr(modulo_app, 'sugestoes_por_status', falhar)
+    resultado = analyze_webprice_data_internal(io.StringIO(export), secoes=['status_counts'])
+    assert set(resultado) == {'status_counts'}
+
+
+def test_alertas_do_snapshot_avaliados_no_primeiro_uso(export):
+    analyze_webprice_data_internal(io.StringIO(export), snapshot_id='teste-alertas',
+                                   secoes=['ml_insights', 'snapshot_id'])
+    snapshot = obter_snapshot('teste-alertas')
+    assert snapshot['alertas'] is None
+    assert alertas_do_snapshot(snapshot) == avaliar_alertas(snapshot['cubo'])
+    assert snapshot['alertas'] is not None
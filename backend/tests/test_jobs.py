@@ -0,0 +1,61 @@
+import io
+import threading
+import time
+
+import ml
+from app import app
+from ml import agendar_tarefa, resultado_treino
+
+
+def _esperar(job_id, limite_s=30):
+    fim = time.monotonic() + limite_s
+    while (resultado := resultado_treino(job_id))['status'] == 'processando':
+        assert time.monotonic() < fim, 'job não terminou'
+        time.sleep(0.02)
+    return resultado
+
+
+def test_job_processando_pronto_e_erro():
+    liberar = threading.Event()
+    job_id = agendar_tarefa(lambda: liberar.wait(5) and {'valor': 1})
+    assert resultado_treino(job_id) == {'ml_job_id': job_id, 'status': 'processando'}
+    liberar.set()
+    assert _esperar(job_id) == {'ml_job_id': job_id, 'status': 'pronto', 'ml_insights': {'valor': 1}}
+
+    def falhar():
+        raise ValueError('sem dados')
+
+    erro = _esperar(agendar_tarefa(falhar))
+    assert erro['status'] == 'erro' and 'sem dados' in erro['error']
+    assert resultado_treino('nao-existe') is None
+
+
+def test_fila_sequencial_na_ordem_de_chegada():
+    ordem = []
+
+    def registrar(i):
+        time.sleep(0.01 * (5 - i))
+        ordem.append(i)
+
+    jobs = [agendar_tarefa(registrar, i, sequencial=True) for i in range(5)]
+    for job_id in jobs:
+        _esperar(job_id)
+    assert ordem == list(range(5))
+
+
+def test_jobs_antigos_saem_da_fila(monkeypatch):
+    monkeypatch.setattr(ml, 'MAX_JOBS_GUARDADOS', 2)
+    jobs = [agendar_tarefa(lambda: None) for _ in range(3)]
+    assert resultado_treino(jobs[0]) is None
+    assert all(_esperar(job_id)['status'] == 'pronto' for job_id in jobs[1:])
+
+
+def test_analise_devolve_o_job_e_o_treino_sai_em_ml(export):
+    cliente = app.test_client()
+    resposta = cliente.post('/analyze?fields=ml_job_id', data={'file': (io.BytesIO(export.encode('utf-8')), 'e.csv')})
+    job_id = resposta.get_json()['ml_job_id']
+    _esperar(job_id)
+    resultado = cliente.get(f'/ml/{job_id}').get_json()
+    assert resultado['status'] == 'pronto', resultado
+    assert resultado['ml_insights']['status'] == 'Modelo de ML treinado com sucesso!'
+    assert cliente.get('/ml/nao-existe').status_code == 404
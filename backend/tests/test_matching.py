@@ -0,0 +1,21 @@
+import pandas as pd
+
+from matching import agrupar_produtos_similares, normalizar_nomes
+
+
+def test_normalizar_nomes():
+    nomes = pd.Series(['Café Solúvel 200 g', 'TV-55" 4K', '  Smartphone X - 128 GB '])
+    assert normalizar_nomes(nomes).tolist() == ['cafe soluvel 200g', 'tv 55 4k', 'smartphone x 128gb']
+
+
+def test_nomes_equivalentes_viram_o_mais_frequente():
+    df = pd.DataFrame({
+        'Marca': ['Acme'] * 5 + ['Beta'],
+        'Produto': ['Smartphone X 128GB', 'Smartphone X - 128 GB', 'Smartphone X 128GB', 'Smartphone X 256GB',
+                    'Smartphone Xis 128GB', 'Smartphone X - 128 GB'],
+        'Lojista': list('ABCDEF'),
+    })
+    canonico, relatorio = agrupar_produtos_similares(df)
+    assert canonico.tolist() == ['Smartphone X 128GB', 'Smartphone X 128GB', 'Smartphone X 128GB',
+                                 'Smartphone X 256GB', 'Smartphone Xis 128GB', 'Smartphone X - 128 GB']
+    assert relatorio['nomes_unificados'] == 1
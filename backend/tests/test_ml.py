@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+from ml import _alocar, _codificar_rotulos, _cpus_disponiveis, _orcamento, _ordem_treino, matriz_features
+from selection_timing import medir_selecao
+
+
+def _classes(*contagens):
+    return np.repeat(np.arange(len(contagens)), contagens).astype(np.int8)
+
+
+def _conferir_divisao(y, ordem, n_treino):
+    treino, teste = ordem[:n_treino], ordem[n_treino:]
+    assert len(np.intersect1d(treino, teste)) == 0
+    assert len(np.unique(ordem)) == len(ordem)
+    return np.bincount(y[treino], minlength=y.max() + 1), np.bincount(y[teste], minlength=y.max() + 1)
+
+
+def test_codificar_rotulos_ordena_como_o_label_encoder():
+    codigos, classes = _codificar_rotulos(pd.Series(['Manter Preço', 'Proteção da Margem', 'Manter Preço']))
+    assert classes == ['Manter Preço', 'Proteção da Margem']
+    assert codigos.tolist() == [0, 1, 0]
+    codigos, _ = _codificar_rotulos(['b', 'c'], classes=['a', 'b'])
+    assert codigos.tolist() == [1, -1]
+
+
+def test_matriz_features_divide_e_zera_texto():
+    X = matriz_features([(pd.Series([100, 250]), 100), (pd.Series(['1,5', '3']), 1)], linhas=np.array([1, 0]))
+    assert X.dtype == np.float32 and X.flags['C_CONTIGUOUS']
+    assert X.tolist() == [[2.5, 3.0], [1.0, 0.0]]
+
+
+def test_alocar_fecha_o_total_com_as_maiores_sobras():
+    contagens = np.array([5, 3, 2])
+    por_classe = _alocar(contagens, 0.25, 3)
+    assert por_classe.sum() == 3
+    assert por_classe.tolist() == [1, 1, 1]
+
+
+def test_orcamento_garante_uma_linha_por_classe_sem_passar_do_total():
+    por_classe = _orcamento(np.array([999_999, 1]), 250_000)
+    assert por_classe.tolist() == [249_999, 1]
+    por_classe = _orcamento(np.array([10, 0, 1, 1]), 3)
+    assert por_classe.tolist() == [1, 0, 1, 1]
+
+
+def test_divisao_estratificada_na_proporcao_de_cada_classe():
+    y = _classes(700, 200, 100)
+    ordem, n_treino, aviso = _ordem_treino(y, test_size=0.2, random_state=42)
+    assert aviso is None and ordem.dtype == np.int32
+    treino, teste = _conferir_divisao(y, ordem, n_treino)
+    assert teste.tolist() == [140, 40, 20]
+    assert treino.tolist() == [560, 160, 80]
+    assert np.all(np.diff(ordem[:n_treino]) > 0)
+
+
+def test_max_treino_limita_o_treino_e_o_teste_acompanha():
+    y = _classes(9_000, 900, 100)
+    ordem, n_treino, _ = _ordem_treino(y, test_size=0.2, max_treino=1_000)
+    treino, teste = _conferir_divisao(y, ordem, n_treino)
+    assert n_treino == 1_000
+    assert treino.tolist() == [900, 90, 10]
+    assert teste.sum() == 250 and np.all(teste > 0)
+
+
+def test_max_treino_com_classe_rara_respeita_o_orcamento():
+    y = np.zeros(100_000, dtype=np.int8)
+    y[0] = 1
+    ordem, n_treino, aviso = _ordem_treino(y, max_treino=25_000)
+    assert aviso is not None  # uma amostra só na classe 1: treina sem teste
+    assert n_treino == len(ordem) == 25_000
+    assert 0 in ordem
+
+
+def test_medicao_da_selecao_por_threads():
+    relatorio = medir_selecao(linhas=2_000, repeticoes=1)
+    assert relatorio['cpus_afinidade'] == _cpus_disponiveis()
+    assert [m['threads'] for m in relatorio['tempos']] == list(range(1, relatorio['cpus_afinidade'] + 1))
+    assert relatorio['tempos'][0]['speedup'] == 1.0
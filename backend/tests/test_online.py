@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from ml import CLASSES_TIPO_AJUSTE, FEATURES_ML, _carregar, atualizar_modelo_online
+
+
+def _lote(n, semente):
+    """Duas classes separáveis pelo Valor_Ajuste (negativo: abaixar; positivo: proteger a margem)."""
+    gerador = np.random.default_rng(semente)
+    ajuste = gerador.choice([-1, 1], n) * gerador.uniform(5, 50, n)
+    preco = gerador.uniform(50, 500, n)
+    colunas = [(pd.Series(preco), 1), (pd.Series(preco - ajuste), 1), (pd.Series(ajuste), 1),
+               (pd.Series(ajuste / preco * 100), 1), (pd.Series(np.abs(ajuste)), 1)]
+    rotulos = pd.Series(np.where(ajuste < 0, 'Abaixar Preço para Competitividade', 'Proteção da Margem'))
+    return colunas, rotulos
+
+
+def test_aprende_acumula_e_avalia_antes_de_atualizar(tmp_path):
+    arquivo = str(tmp_path / 'online.joblib')
+    colunas, rotulos = _lote(400, 0)
+    rotulos.iloc[:10] = 'Rótulo desconhecido'
+    primeiro = atualizar_modelo_online(colunas, rotulos, snapshot_id='s1', arquivo=arquivo, lote=64)
+    assert os.path.exists(arquivo)
+    assert primeiro['linhas_novas'] == 390 and primeiro['linhas_ignoradas'] == 10
+    assert primeiro['amostras_acumuladas'] == 390
+    assert primeiro['acuracia_antes_da_atualizacao'] is not None  # lotes depois do 1º já são avaliados
+    assert set(primeiro['importancia_das_features']) == set(FEATURES_ML)
+
+    segundo = atualizar_modelo_online(*_lote(200, 1), snapshot_id='s2', arquivo=arquivo, lote=64)
+    assert segundo['amostras_acumuladas'] == 590 and segundo['snapshots_aprendidos'] == 2
+    assert segundo['acuracia_antes_da_atualizacao'] > 0.9
+    assert segundo['classes_preditas'] == ['Abaixar Preço para Competitividade', 'Proteção da Margem']
+    assert list(_carregar(arquivo)['modelo'].classes_) == CLASSES_TIPO_AJUSTE
+
+
+def test_mesmo_snapshot_nao_e_aprendido_duas_vezes(tmp_path):
+    arquivo = str(tmp_path / 'online.joblib')
+    colunas, rotulos = _lote(100, 2)
+    atualizar_modelo_online(colunas, rotulos, snapshot_id='s1', arquivo=arquivo)
+    repetido = atualizar_modelo_online(colunas, rotulos, snapshot_id='s1', arquivo=arquivo)
+    assert repetido['snapshot_ja_aprendido'] and repetido['linhas_novas'] == 0
+    assert repetido['amostras_acumuladas'] == 100
+
+
+def test_registrar_cria_versao_online(tmp_path):
+    insights = atualizar_modelo_online(*_lote(100, 3), arquivo=str(tmp_path / 'online.joblib'), registrar=True)
+    assert isinstance(insights['modelo_versao'], int)
@@ -0,0 +1,32 @@
+import pandas as pd
+
+from optimizer import otimizar_portfolio
+
+
+def _carteira():
+    return pd.DataFrame({
+        'Produto': ['A', 'A', 'B', 'B', 'C', 'C', 'C', 'D', 'D'],
+        'Lojista': ['Nós', 'X', 'Nós', 'X', 'Nós', 'X', 'Y', 'Nós', 'X'],
+        'RANKING': [1, 2, 1, 2, 1, 1, 2, 1, 2],
+        'Preço': [10000, 10100, 10000, 20000, 10000, 10000, 11000, 10000, 10001],
+    })
+
+
+def test_novo_preco_dentro_do_limite_e_abaixo_do_proximo():
+    resultado = otimizar_portfolio(_carteira(), limite_percentual=3.0)
+    alteracoes = {a['Produto']: a for a in resultado['alteracoes']}
+    assert list(alteracoes) == ['B', 'A']  # maior ganho primeiro; C empata em 1º e D não tem folga
+    assert alteracoes['B']['Preço_Otimizado'] == 103.0 and alteracoes['B']['Limitado_Por'] == 'limite de 3%'
+    assert alteracoes['A']['Preço_Otimizado'] == 100.99 and alteracoes['A']['Limitado_Por'] == 'próximo concorrente'
+    assert resultado['resumo']['produtos_avaliados'] == 3
+    assert resultado['resumo']['ganho_total_rs'] == 3.99
+
+
+def test_max_alteracoes_fica_com_os_maiores_ganhos():
+    resultado = otimizar_portfolio(_carteira(), max_alteracoes=1)
+    assert [a['Produto'] for a in resultado['alteracoes']] == ['B']
+    assert resultado['resumo']['produtos_com_ganho'] == 2
+
+
+def test_sem_ranking_devolve_erro():
+    assert 'error' in otimizar_portfolio(_carteira().drop(columns='RANKING'))
@@ -0,0 +1,63 @@
+import io
+import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import parallel
+from app import analyze_webprice_data_internal
+from conftest import montar_export, ofertas_sinteticas
+
+SECOES = ['data', 'ml_insights', 'status_counts', 'resumo_por_lojista']
+TOTAIS = ['total_produtos_analisados', 'produtos_com_oportunidade_margem', 'ganho_potencial_total_rs',
+          'ganho_medio_por_produto']
+
+
+def _analisar(export, workers=None):
+    return analyze_webprice_data_internal(io.StringIO(export), workers=workers, secoes=SECOES)
+
+
+def _sem_execucao(resultado):
+    return {**resultado, 'ml_insights': {c: resultado['ml_insights'][c] for c in TOTAIS}}
+
+
+def test_particoes_nao_quebram_produtos():
+    df = ofertas_sinteticas(produtos=40)
+    particoes = parallel.atribuir_particoes(df, 4)
+    assert (pd.Series(particoes).groupby(df['Produto'].to_numpy()).nunique() == 1).all()
+    assert set(np.unique(particoes)) <= set(range(4))
+
+
+def test_paralelo_igual_ao_serial(export):
+    serial = _analisar(export)
+    paralelo = _analisar(export, workers=2)
+    assert paralelo['ml_insights']['execucao_paralela']['particoes'] > 1
+    assert _sem_execucao(paralelo) == _sem_execucao(serial)
+
+
+def test_threads_com_workers_diferentes_dividem_o_pool(export):
+    serial = _sem_execucao(_analisar(export))
+    pool = parallel._obter_pool()
+    with ThreadPoolExecutor(max_workers=4) as threads:
+        resultados = list(threads.map(lambda w: _analisar(export, workers=w), [2, 3, 2, 4]))
+    assert all(_sem_execucao(r) == serial for r in resultados)
+    assert parallel._obter_pool() is pool
+
+
+def test_pool_quebrado_termina_em_serie_e_e_recriado(export):
+    serial = _sem_execucao(_analisar(export))
+    _analisar(export, workers=2)
+    pool = parallel._obter_pool()
+    for pid in list(pool._processes):
+        os.kill(pid, signal.SIGKILL)
+
+    recuperado = _analisar(export, workers=2)
+    assert recuperado['ml_insights']['execucao_paralela']['pool_quebrado_execucao_serial']
+    assert _sem_execucao(recuperado) == serial
+
+    seguinte = _analisar(export, workers=2)
+    assert parallel._obter_pool() is not pool
+    assert not seguinte['ml_insights']['execucao_paralela']['pool_quebrado_execucao_serial']
+    assert _sem_execucao(seguinte) == serial
@@ -0,0 +1,86 @@
+import io
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+
+from app import app
+from conftest import montar_export
+from snapshots import obter_snapshot
+from winprob import FEATURES_VITORIA, fatores_caixa_dos_lideres, lideres_do_snapshot, simular_grade
+
+
+def _export_parcelado(ofertas, fracao=0.5, semente=1):
+    """Export com NO DE PARCELAS / VALOR DA PARCELA: ``fracao`` das ofertas em 12x, perto do à vista."""
+    gerador = np.random.default_rng(semente)
+    parcelado = gerador.random(len(ofertas)) < fracao
+    total = ofertas['Preço'].to_numpy() * gerador.uniform(0.97, 1.05, len(ofertas))
+    parcelas = np.where(parcelado, 12, 1)
+    valores = np.where(parcelado, total / 12, 0)
+    filtros, tabela = montar_export(ofertas).split('\n', 1)
+    tabela = pd.read_csv(io.StringIO(tabela), sep=';', dtype=str)
+    tabela['NO DE PARCELAS'] = parcelas
+    tabela['VALOR DA PARCELA'] = [f'{v:.2f}'.replace('.', ',') for v in valores]
+    return filtros + ';;\n' + tabela.to_csv(sep=';', index=False)
+
+
+def _enviar(cliente, texto, consulta):
+    resposta = cliente.post(f'/analyze?{consulta}', data={'file': (io.BytesIO(texto.encode('utf-8')), 'e.csv')})
+    assert resposta.status_code == 200
+    return resposta.get_json()
+
+
+def test_sem_parcelamento_efetivo_igual_ao_caixa(ofertas):
+    texto = _export_parcelado(ofertas, fracao=0)
+    cliente = app.test_client()
+    caixa = _enviar(cliente, texto, 'fields=status_counts,ml_insights&preco=caixa')
+    efetivo = _enviar(cliente, texto, 'fields=status_counts,ml_insights&preco=efetivo')
+    assert efetivo['status_counts'] == caixa['status_counts']
+    assert efetivo['ml_insights']['ganho_potencial_total_rs'] == caixa['ml_insights']['ganho_potencial_total_rs']
+    assert efetivo['ml_insights']['parcelamento']['ofertas_com_status_alterado'] == 0
+
+
+def test_otimizar_devolve_o_a_vista_que_o_what_if_aplica(ofertas):
+    cliente = app.test_client()
+    snapshot_id = _enviar(cliente, _export_parcelado(ofertas), 'fields=snapshot_id,status_counts&preco=efetivo')[
+        'snapshot_id']
+    otimizado = cliente.post(f'/snapshots/{snapshot_id}/otimizar', json={'limite_percentual': 5}).get_json()
+    alteracoes = otimizado['alteracoes']
+    df = obter_snapshot(snapshot_id)['df']
+    fatores = df.set_index(['Produto', 'Lojista'])['Fator_Caixa']
+    parceladas = [a for a in alteracoes if fatores[(a['Produto'], a['Lojista'])] > 1]
+    assert parceladas and all(a['Preço_Otimizado_Caixa'] > a['Preço_Otimizado'] for a in parceladas)
+    status_antes = df['Status'].value_counts().to_dict()
+
+    resposta = cliente.post(f'/snapshots/{snapshot_id}/what-if', json={'alteracoes': [
+        {'Produto': a['Produto'], 'Lojista': a['Lojista'], 'preco': a['Preço_Otimizado_Caixa']} for a in alteracoes]})
+    assert resposta.status_code == 200
+
+    # O what-if converte o à vista de volta para o mesmo efetivo, e o líder segue em 1º
+    df = obter_snapshot(snapshot_id)['df'].set_index(['Produto', 'Lojista'])
+    for a in alteracoes:
+        assert df.loc[(a['Produto'], a['Lojista']), 'Preço'] == round(a['Preço_Otimizado'] * 100)
+        assert df.loc[(a['Produto'], a['Lojista']), 'RANKING'] == 1
+    assert df['Status'].value_counts().to_dict() == status_antes
+
+
+def test_grade_de_vitoria_recebe_e_devolve_o_a_vista(ofertas):
+    cliente = app.test_client()
+    snapshot_id = _enviar(cliente, _export_parcelado(ofertas, fracao=1), 'fields=snapshot_id&preco=efetivo')[
+        'snapshot_id']
+    df = obter_snapshot(snapshot_id)['df']
+    lideres = lideres_do_snapshot(df)
+    fatores = fatores_caixa_dos_lideres(df, lideres)
+    assert (fatores > 1).any()
+
+    gerador = np.random.default_rng(0)
+    modelo = LogisticRegression().fit(gerador.normal(size=(50, len(FEATURES_VITORIA))), np.arange(50) % 2)
+    produto, fator = lideres['Produto'].iloc[0], fatores[0]
+    a_vista = round(float(lideres['Preço'].iloc[0]) * fator * 1.02, 2)
+    grade = simular_grade(lideres, modelo, precos={produto: [a_vista]}, fatores_caixa=fatores)['grade'][0]
+    assert grade['Preço_Candidato_Caixa'] == a_vista
+    assert grade['Preço_Candidato'] == round(a_vista / fator, 2)
+    assert grade['Preço_Caixa_Atual'] == round(float(lideres['Preço'].iloc[0]) * fator, 2)
+
+    por_aumento = simular_grade(lideres, modelo, aumentos_pct=[0], fatores_caixa=fatores)['grade'][0]
+    assert por_aumento['Preço_Candidato_Caixa'] == por_aumento['Preço_Caixa_Atual']
@@ -0,0 +1,46 @@
+import io
+import time
+
+import pandas as pd
+
+from app import app
+from ml import resultado_treino
+
+
+def _enviar(cliente, rota, export):
+    return cliente.post(rota, data={'file': (io.BytesIO(export.encode('utf-8')), 'e.csv')})
+
+
+def _treinar(cliente, export):
+    job_id = _enviar(cliente, '/analyze?fields=ml_job_id', export).get_json()['ml_job_id']
+    fim = time.monotonic() + 30
+    while (resultado := resultado_treino(job_id))['status'] == 'processando':
+        assert time.monotonic() < fim
+        time.sleep(0.02)
+    return resultado['ml_insights']['modelo_versao']
+
+
+def test_predict_classifica_com_o_modelo_registrado(export):
+    cliente = app.test_client()
+    versao = _treinar(cliente, export)
+    analise = _enviar(cliente, '/analyze?fields=data', export).get_json()
+
+    resumo = _enviar(cliente, f'/predict?formato=resumo&versao={versao}', export).get_json()
+    assert resumo['versao'] == versao
+    assert resumo['linhas_classificadas'] == len(analise['data'])
+    assert sum(resumo['previsoes_por_classe'].values()) == resumo['linhas_classificadas']
+    assert resumo['concordancia_com_regra_pct'] == 100.0  # a árvore viu exatamente essas linhas
+
+    resposta = _enviar(cliente, f'/predict?versao={versao}', export)
+    assert resposta.status_code == 200 and resposta.mimetype == 'text/csv'
+    previsoes = pd.read_csv(io.StringIO(resposta.get_data(as_text=True)), sep=None, engine='python')
+    assert len(previsoes) == resumo['linhas_classificadas']
+    assert {'Tipo_Ajuste_Previsto', 'Confianca'} <= set(previsoes.columns)
+
+
+def test_predict_valida_modelo_e_versao(export):
+    cliente = app.test_client()
+    assert _enviar(cliente, '/predict?modelo=outro', export).status_code == 400
+    assert _enviar(cliente, '/predict?formato=xml', export).status_code == 400
+    resposta = _enviar(cliente, '/predict?versao=9999', export)
+    assert resposta.status_code == 404 and 'versoes' in resposta.get_json()
@@ -0,0 +1,58 @@
+import io
+
+import pytest
+
+import preview
+from conftest import montar_export, ofertas_sinteticas
+from preview import amostrar_csv, estimar
+
+RESUMO_VAZIO = {'produtos_com_oportunidade_margem': 0, 'ganho_potencial_total_rs': 0.0}
+
+
+class _Relogio:
+    """perf_counter que anda um segundo por leitura: o orçamento vira número de blocos."""
+
+    def __init__(self):
+        self.agora = 0.0
+
+    def perf_counter(self):
+        self.agora += 1
+        return self.agora
+
+
+@pytest.fixture(scope='module')
+def catalogo():
+    return ofertas_sinteticas(produtos=20_000, semente=1)
+
+
+def _amostrar(texto, blocos, monkeypatch):
+    monkeypatch.setattr(preview, 'time', _Relogio())
+    dados = texto.encode('utf-8')
+    stream = io.BytesIO(dados)
+    amostra = amostrar_csv(stream, len(dados), orcamento_s=blocos - 0.5, linhas_por_bloco=500)
+    return amostra, stream, len(dados)
+
+
+def test_cobertura_conta_so_as_linhas_lidas(catalogo, monkeypatch):
+    amostra, stream, tamanho = _amostrar(montar_export(catalogo), 10, monkeypatch)
+    assert not amostra['completo'] and amostra['linhas_lidas'] == 5_000
+    assert amostra['bytes_lidos'] == stream.tell()
+    assert amostra['cobertura'] == amostra['bytes_lidos'] / tamanho
+
+
+@pytest.mark.parametrize('embaralhar', [False, True])
+def test_produtos_distintos_agrupado_ou_embaralhado(catalogo, monkeypatch, embaralhar):
+    ofertas = catalogo.sample(frac=1, random_state=0) if embaralhar else catalogo
+    amostra, _, _ = _amostrar(montar_export(ofertas), 12, monkeypatch)
+    estimativa = estimar(amostra, RESUMO_VAZIO)
+    assert estimativa['produtos_distintos'] == pytest.approx(20_000, rel=0.2)
+    assert estimativa['linhas'] == pytest.approx(len(catalogo), rel=0.05)
+
+
+def test_leitura_completa_exata(export, ofertas):
+    dados = export.encode('utf-8')
+    amostra = amostrar_csv(io.BytesIO(dados), len(dados), orcamento_s=60)
+    estimativa = estimar(amostra, RESUMO_VAZIO)
+    assert amostra['completo'] and estimativa['exato']
+    assert estimativa['linhas'] == len(ofertas)
+    assert estimativa['produtos_distintos'] == ofertas['Produto'].nunique()
@@ -0,0 +1,55 @@
+import json
+import os
+
+import numpy as np
+from sklearn.linear_model import SGDClassifier
+
+from registry import carregar_modelo, listar_modelos, registrar_modelo, resolver_versao, versoes_modelo
+
+
+def _modelo(semente=0):
+    gerador = np.random.default_rng(semente)
+    X = gerador.normal(size=(200, 3))
+    return SGDClassifier(random_state=semente).fit(X, (X[:, 0] > 0).astype(int))
+
+
+def test_versoes_em_ordem_e_latest(tmp_path):
+    diretorio = str(tmp_path)
+    for semente in range(3):
+        metadados = registrar_modelo('online', _modelo(semente), {'metricas': {'semente': semente}},
+                                     diretorio=diretorio)
+    assert metadados['versao'] == 3 and metadados['nome'] == 'online'
+    assert versoes_modelo('online', diretorio) == [1, 2, 3]
+    assert resolver_versao('online', 'latest', diretorio) == 3
+    assert resolver_versao('online', '2', diretorio) == 2
+    assert resolver_versao('online', 9, diretorio) is None and resolver_versao('outro', None, diretorio) is None
+    with open(os.path.join(diretorio, 'online', 'v0002', 'metadados.json'), encoding='utf-8') as f:
+        assert json.load(f)['metricas'] == {'semente': 1}
+    assert [m['versao'] for m in listar_modelos(diretorio)['online']] == [1, 2, 3]
+
+
+def test_mesma_impressao_digital_volta_a_versao_existente(tmp_path):
+    diretorio = str(tmp_path)
+    primeira = registrar_modelo('arvore', _modelo(), {'impressao_digital': 'abc'}, diretorio=diretorio)
+    de_novo = registrar_modelo('arvore', _modelo(), {'impressao_digital': 'abc'}, diretorio=diretorio)
+    assert de_novo == primeira and versoes_modelo('arvore', diretorio) == [1]
+
+
+def test_versoes_antigas_saem(tmp_path):
+    diretorio = str(tmp_path)
+    for semente in range(4):
+        registrar_modelo('online', _modelo(semente), {}, diretorio=diretorio, max_versoes=2)
+    assert versoes_modelo('online', diretorio) == [3, 4]
+    assert not [p for p in os.listdir(os.path.join(diretorio, 'online')) if p.startswith('.v')]
+
+
+def test_carga_mapeada_e_guardada(tmp_path):
+    diretorio = str(tmp_path)
+    modelo = _modelo()
+    registrar_modelo('online', modelo, {}, diretorio=diretorio)
+    carregado, metadados = carregar_modelo('online', diretorio=diretorio)
+    assert metadados['versao'] == 1
+    assert isinstance(carregado.coef_, np.memmap) and not carregado.coef_.flags.writeable
+    np.testing.assert_array_equal(carregado.coef_, modelo.coef_)
+    assert carregar_modelo('online', 1, diretorio=diretorio)[0] is carregado
+    assert carregar_modelo('online', 2, diretorio=diretorio) is None
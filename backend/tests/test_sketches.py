@@ -0,0 +1,40 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from app import analyze_webprice_data_internal, analyze_webprice_stream
+from sketches import _atualizar_digest, _atualizar_hll, _contagens_hll, _quantis_digest, novo_estado
+
+
+def test_hll_dentro_do_erro_padrao():
+    estado = novo_estado(precisao_hll=12)
+    for inicio in range(0, 20_000, 5_000):
+        valores = np.array([f'produto {i}' for i in range(inicio, inicio + 5_000)] * 2, dtype=object)
+        _atualizar_hll(estado, 'teste', np.array(['g'] * len(valores), dtype=object), valores)
+    estimado = _contagens_hll(estado, 'teste')['g']
+    assert abs(estimado - 20_000) / 20_000 < 4 * 1.04 / np.sqrt(4096)
+
+
+def test_tdigest_quantis_e_tamanho_fixo():
+    estado = novo_estado(compressao=200)
+    valores = np.random.default_rng(0).permutation(np.arange(1, 100_001, dtype='float64'))
+    for bloco in np.array_split(valores, 20):
+        _atualizar_digest(estado, 'Cluster', np.array(['g'] * len(bloco), dtype=object), bloco)
+    centroides = estado['digest']['Cluster']
+    assert len(centroides) <= 100
+    quantis, erros = _quantis_digest(centroides, 1, 100_000, [0.5, 0.9, 0.99])
+    assert np.allclose(quantis, [50_000, 90_000, 99_000], rtol=0.01)
+    assert np.all(erros < 2)
+
+
+def test_top_oportunidades_exato_com_blocos_por_produto(export):
+    completa = analyze_webprice_data_internal(io.StringIO(export), secoes=['data'])
+    fluxo = analyze_webprice_stream(io.BytesIO(export.encode('utf-8')), linhas_por_bloco=25, top_k=3)
+    sugestoes = pd.DataFrame(completa['data'])
+    sugestoes = sugestoes[sugestoes['Margem_Extra_RS'] > 0]
+    for item in fluxo['sketches']['por_lojista']:
+        esperadas = sugestoes[sugestoes['Lojista'] == item['lojista']].nlargest(3, 'Margem_Extra_RS')
+        assert [t['Margem_Extra_RS'] for t in item['top_oportunidades']] == esperadas['Margem_Extra_RS'].tolist()
+        assert all(t['erro_max_rs'] == 0 for t in item['top_oportunidades'])
+    assert fluxo['sketches']['global']['produtos_distintos'] == 60
@@ -0,0 +1,14 @@
+from startup import DEPENDENCIAS_SOB_DEMANDA, relatorio_importacao
+
+
+def test_app_nao_importa_as_dependencias_sob_demanda():
+    relatorio = relatorio_importacao('app', top=50)
+    assert 'error' not in relatorio, relatorio
+    assert relatorio['sob_demanda_carregadas'] == []
+    pacotes = {p['pacote'] for p in relatorio['pacotes']}
+    assert 'pandas' in pacotes and not pacotes & set(DEPENDENCIAS_SOB_DEMANDA)
+    assert relatorio['total_ms'] > 0
+
+
+def test_modulo_inexistente_vira_erro():
+    assert 'error' in relatorio_importacao('modulo_que_nao_existe')
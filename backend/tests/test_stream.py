@@ -0,0 +1,30 @@
+import io
+
+import pytest
+
+from app import analyze_webprice_data_internal, analyze_webprice_stream
+from conftest import montar_export
+
+SECOES = ['ml_insights', 'status_counts', 'resumo_por_lojista', 'alertas']
+TOTAIS = ['total_produtos_analisados', 'produtos_com_oportunidade_margem', 'ganho_potencial_total_rs',
+          'ganho_medio_por_produto']
+
+
+@pytest.mark.parametrize('linhas_por_bloco', [7, 50, 10_000])
+def test_fluxo_bate_com_a_analise_completa(export, linhas_por_bloco):
+    completa = analyze_webprice_data_internal(io.StringIO(export), secoes=SECOES)
+    fluxo = analyze_webprice_stream(io.BytesIO(export.encode('utf-8')), linhas_por_bloco=linhas_por_bloco)
+    assert 'error' not in fluxo
+    assert {c: fluxo['ml_insights'][c] for c in TOTAIS} == {c: completa['ml_insights'][c] for c in TOTAIS}
+    assert fluxo['status_counts'] == completa['status_counts']
+    assert fluxo['resumo_por_lojista'] == completa['resumo_por_lojista']
+    assert fluxo['alertas'] == completa['alertas']
+    assert fluxo['sketches']['global']['linhas'] == sum(completa['status_counts'].values())
+
+
+def test_fluxo_recusa_export_embaralhado(ofertas):
+    embaralhado = montar_export(ofertas).splitlines(keepends=True)
+    # Leva a primeira oferta do produto 0 para o fim do arquivo
+    embaralhado = embaralhado[:2] + embaralhado[3:] + [embaralhado[2]]
+    resultado = analyze_webprice_stream(io.BytesIO(''.join(embaralhado).encode('utf-8')), linhas_por_bloco=20)
+    assert 'agrupado por PRODUTO' in resultado['error']
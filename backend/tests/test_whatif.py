@@ -0,0 +1,81 @@
+import io
+
+from app import analyze_webprice_data_internal, app
+from conftest import montar_export
+from snapshots import obter_snapshot
+from whatif import simular_precos
+
+SECOES = ['data', 'ml_insights', 'status_counts', 'resumo_por_lojista', 'alertas']
+TOTAIS = ['total_produtos_analisados', 'produtos_com_oportunidade_margem', 'ganho_potencial_total_rs',
+          'ganho_medio_por_produto']
+
+
+def _analisar(export, snapshot_id=None):
+    secoes = SECOES + (['snapshot_id'] if snapshot_id else [])
+    return analyze_webprice_data_internal(io.StringIO(export), snapshot_id=snapshot_id, secoes=secoes)
+
+
+def test_what_if_aplica_o_mesmo_delta_que_reanalisar(ofertas):
+    _analisar(montar_export(ofertas), snapshot_id='teste-what-if')
+    snapshot = obter_snapshot('teste-what-if')
+
+    # Produto 3: o líder baixa e abre margem; produto 5: o lojista mais caro vira o mais barato;
+    # produto 7: o 2º colocado empata com o líder
+    produto_3, produto_5, produto_7 = (ofertas[ofertas['Produto'] == f'Produto {p}'].sort_values('Preço')
+                                       for p in (3, 5, 7))
+    alteracoes = [
+        {'Produto': 'Produto 3', 'preco': round(float(produto_3['Preço'].iloc[0]) * 0.8, 2)},
+        {'Produto': 'Produto 5', 'Lojista': produto_5['Lojista'].iloc[-1],
+         'preco': round(float(produto_5['Preço'].iloc[0]) - 1, 2)},
+        {'Produto': 'Produto 7', 'Lojista': produto_7['Lojista'].iloc[1], 'preco': float(produto_7['Preço'].iloc[0])},
+    ]
+    with snapshot['lock']:
+        simulado = simular_precos(snapshot, alteracoes)
+    assert 'error' not in simulado
+
+    # Reexport com os preços novos: RANKING, STATUS e MAIS BARATO saem deles
+    alteradas = ofertas.copy()
+    for linha, alteracao in zip([produto_3.index[0], produto_5.index[-1], produto_7.index[1]], alteracoes):
+        alteradas.loc[linha, 'Preço'] = alteracao['preco']
+    reanalise = _analisar(montar_export(alteradas))
+
+    assert simulado['status_counts'].get('EMPATANDO') == 2
+    assert {c: simulado['ml_insights'][c] for c in TOTAIS} == {c: reanalise['ml_insights'][c] for c in TOTAIS}
+    assert simulado['status_counts'] == reanalise['status_counts']
+    assert simulado['resumo_por_lojista'] == reanalise['resumo_por_lojista']
+    assert simulado['alertas'] == reanalise['alertas']
+    esperadas = [s for s in reanalise['data'] if s['Produto'] in ('Produto 3', 'Produto 5', 'Produto 7')]
+    chaves = ['Produto', 'Lojista', 'Preço_Atual', 'Preço_Sugerido', 'Margem_Extra_RS', 'Tipo_Ajuste']
+    assert sorted([{c: s[c] for c in chaves} for s in simulado['data']], key=str) == \
+        sorted([{c: s[c] for c in chaves} for s in esperadas], key=str)
+
+
+def test_what_if_recusa_produto_desconhecido(export):
+    _analisar(export, snapshot_id='teste-what-if-desconhecido')
+    snapshot = obter_snapshot('teste-what-if-desconhecido')
+    resultado = simular_precos(snapshot, [{'Produto': 'Não existe', 'preco': 10.0}])
+    assert resultado == {'error': "Produtos não encontrados no snapshot: ['Não existe']"}
+
+
+def test_sem_lojista_so_o_lider_muda(ofertas):
+    _analisar(montar_export(ofertas), snapshot_id='teste-what-if-lider')
+    snapshot = obter_snapshot('teste-what-if-lider')
+    produto = ofertas[ofertas['Produto'] == 'Produto 2'].sort_values('Preço')
+    with snapshot['lock']:
+        simular_precos(snapshot, [{'Produto': 'Produto 2', 'preco': 10.0}])
+    df = snapshot['df']
+    precos = df.loc[df['Produto'] == 'Produto 2'].set_index('Lojista')['Preço']
+    assert precos[produto['Lojista'].iloc[0]] == 1000
+    esperados = (produto.set_index('Lojista')['Preço'].iloc[1:] * 100).round().astype('int64')
+    assert precos.drop(produto['Lojista'].iloc[0]).sort_index().tolist() == esperados.sort_index().tolist()
+    assert (df.loc[df['Produto'] == 'Produto 2', 'Preço_Concorrente'] == 1000).all()
+
+
+def test_rota_recusa_preco_invalido(export):
+    cliente = app.test_client()
+    resposta = cliente.post('/analyze?fields=snapshot_id', data={'file': (io.BytesIO(export.encode('utf-8')), 'e.csv')})
+    snapshot_id = resposta.get_json()['snapshot_id']
+    for preco in ('abc', -1, True):
+        resposta = cliente.post(f'/snapshots/{snapshot_id}/what-if',
+                                json={'alteracoes': [{'Produto': 'Produto 0', 'preco': preco}]})
+        assert resposta.status_code == 400 and 'preco deve ser um número positivo' in resposta.get_json()['error']
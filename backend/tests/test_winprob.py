@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+from winprob import (
+    atualizar_modelo_vitoria, exemplos_vitoria, lideres_do_snapshot, ofertas_do_snapshot, simular_grade,
+)
+
+
+def _snapshot(precos_lider, precos_segundo):
+    n = len(precos_lider)
+    produtos = np.repeat([f'P{i}' for i in range(n)], 2)
+    precos = np.column_stack([precos_lider, precos_segundo]).ravel()
+    ranking = np.column_stack([np.where(precos_lider < precos_segundo, 1, 2),
+                               np.where(precos_lider < precos_segundo, 2, 1)]).ravel()
+    return pd.DataFrame({'Produto': produtos, 'Lojista': ['Nós', 'Outro'] * n, 'RANKING': ranking,
+                         'Preço': np.rint(precos * 100).astype('int64')})
+
+
+def test_lideres_ignoram_empate_em_primeiro():
+    df = pd.DataFrame({'Produto': ['A', 'A', 'B', 'B'], 'Lojista': ['L1', 'L2', 'L1', 'L2'], 'RANKING': [1, 2, 1, 1],
+                       'Preço': [10000, 11000, 5000, 5000]})
+    lideres = lideres_do_snapshot(df)
+    assert lideres[['Produto', 'Lojista', 'Preço', 'Preço_Segundo']].values.tolist() == [['A', 'L1', 100.0, 110.0]]
+
+
+def test_exemplos_rotulam_quem_seguiu_em_primeiro():
+    lideres = lideres_do_snapshot(_snapshot(np.array([100.0, 20.0]), np.array([110.0, 30.0])))
+    depois = ofertas_do_snapshot(_snapshot(np.array([105.0, 21.0]), np.array([104.0, 30.0])))
+    X, y = exemplos_vitoria(lideres, depois)
+    assert y.tolist() == [0, 1]
+    assert X[:, :2].tolist() == [[5.0, 5.0], [5.0, 45.0]]  # aumento e folga em % do preço anterior
+
+
+def test_modelo_aprende_e_probabilidade_cai_com_o_aumento(tmp_path):
+    arquivo = str(tmp_path / 'vitoria.joblib')
+    gerador = np.random.default_rng(0)
+    segundo = np.full(1_000, 110.0)
+    primeiro = _snapshot(np.full(1_000, 100.0), segundo)
+    resultado = atualizar_modelo_vitoria(lideres_do_snapshot(primeiro), ofertas_do_snapshot(primeiro),
+                                         snapshot_id='s1', recebido_em=1.0, arquivo=arquivo, registrar=False)
+    assert resultado['metricas']['exemplos_novos'] == 0
+
+    # Seguem em 1º só os líderes que subiram menos de 10%
+    aumentado = 100.0 * (1 + gerador.uniform(0, 0.2, 1_000))
+    segundo_snapshot = _snapshot(np.round(aumentado, 2), segundo)
+    resultado = atualizar_modelo_vitoria(lideres_do_snapshot(segundo_snapshot), ofertas_do_snapshot(segundo_snapshot),
+                                         snapshot_id='s2', recebido_em=2.0, arquivo=arquivo, registrar=False)
+    assert resultado['status'] == 'Modelo de vitória retreinado com sucesso!'
+    curva = [p['probabilidade_media'] for p in resultado['probabilidade_media_por_aumento']]
+    assert curva == sorted(curva, reverse=True)
+
+    repetido = atualizar_modelo_vitoria(lideres_do_snapshot(primeiro), ofertas_do_snapshot(primeiro),
+                                        snapshot_id='s2', recebido_em=3.0, arquivo=arquivo, registrar=False)
+    assert repetido['exemplos_novos'] == 0 and 'já aprendido' in repetido['status']
+    atrasado = atualizar_modelo_vitoria(lideres_do_snapshot(primeiro), ofertas_do_snapshot(primeiro),
+                                        snapshot_id='s0', recebido_em=1.5, arquivo=arquivo, registrar=False)
+    assert atrasado['exemplos_novos'] == 0 and 'ignorado' in atrasado['status']
+
+
+def test_simular_grade_recusa_produto_sem_lider():
+    lideres = lideres_do_snapshot(_snapshot(np.array([100.0]), np.array([110.0])))
+    assert 'error' in simular_grade(lideres, modelo=None, precos={'Outro': [1.0]})
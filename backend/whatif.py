@@ -0,0 +1,154 @@
+"""Simulação "what-if" de preços sobre um snapshot já analisado.
+
+Em vez de reprocessar o CSV, recalcula apenas os produtos alterados
+(ranking, status e sugestão) e aplica a diferença nos agregados em cache
+(totais, status_counts, cubo e alertas), de modo que o custo depende do número de
+produtos alterados e não do tamanho do catálogo.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from aggregates import atualizar_cubo, consultar_cubo
+from alerts import alertas_do_snapshot, listar_alertas, reavaliar_alertas
+from competition import anexar_concorrencia, metricas_concorrencia
+from engine import (
+    anexar_precos_caixa, formatar_sugestoes, reconstruir_ranking, resumo_de_totais, status_por_ranking,
+    sugestoes_por_ranking, sugestoes_por_status, totais_sugestoes,
+)
+from winprob import anexar_probabilidade_vitoria, lideres_do_snapshot, probabilidade_das_alteracoes
+
+
+def _sugestoes_atuais(snapshot, produtos, indices):
+    """Sugestões vigentes dos produtos (já considerando simulações anteriores)."""
+    alteradas = snapshot['sugestoes_alteradas']
+    base = snapshot['sugestoes']
+    posicoes = base.index.get_indexer(indices)
+    vigentes = base.iloc[posicoes[posicoes >= 0]]
+    vigentes = vigentes[~vigentes['Produto'].isin(list(alteradas))]
+    return pd.concat([vigentes, *(alteradas[p] for p in produtos if p in alteradas)])
+
+
+def sugestoes_do_snapshot(snapshot):
+    """Todas as sugestões do snapshot com as simulações aplicadas (O(n))."""
+    alteradas = snapshot['sugestoes_alteradas']
+    base = snapshot['sugestoes']
+    if not alteradas:
+        return base
+    return pd.concat([base[~base['Produto'].isin(list(alteradas))], *alteradas.values()])
+
+
+def _novos_precos(valores, em_centavos):
+    if em_centavos:
+        return np.rint(valores * 100).astype('int64')
+    return valores.round(2)
+
+
+def simular_precos(snapshot, alteracoes, modelo_vitoria=None):
+    """Aplica uma lista de {'Produto', 'preco'[, 'Lojista']} ao snapshot.
+
+    Sem ``Lojista`` o novo preço vale para a oferta atualmente em 1º lugar
+    (RANKING 1, ou GANHANDO sem ranking); produto sem ela devolve {'error'}.
+    Retorna as sugestões recalculadas dos produtos e os agregados já
+    corrigidos; o snapshot fica com os novos preços para as próximas
+    simulações. Com ``modelo_vitoria`` (winprob) cada alteração no preço do
+    líder ganha a probabilidade de ele seguir em 1º, estimada antes da
+    mudança, e as sugestões recalculadas ganham a do preço sugerido.
+
+    O MAIS BARATO dos produtos alterados passa a ser o menor preço deles,
+    como num export novo.
+
+    ``preco`` é sempre o preço à vista (o PREÇO do export). Num snapshot
+    analisado com preco=efetivo ele é convertido para o efetivo da oferta
+    pelo Fator_Caixa dela, mantendo o plano de parcelamento.
+    """
+    inicio = time.perf_counter()
+    df = snapshot['df']
+    indice = snapshot['indice_produtos']
+    desconhecidos = sorted({str(a.get('Produto')) for a in alteracoes if a.get('Produto') not in indice})
+    if desconhecidos:
+        return {'error': f'Produtos não encontrados no snapshot: {desconhecidos}'}
+
+    produtos = list(dict.fromkeys(a['Produto'] for a in alteracoes))
+    indices = df.index[np.concatenate([indice[p] for p in produtos])]
+    antes = df.loc[indices]
+    depois = antes.copy()
+    em_centavos = pd.api.types.is_integer_dtype(df['Preço'])
+    usa_ranking = 'RANKING' in df.columns
+    efetivas = []
+    for alteracao in alteracoes:
+        linhas = depois['Produto'] == alteracao['Produto']
+        if alteracao.get('Lojista') is not None:
+            alvo = linhas & (depois['Lojista'] == alteracao['Lojista'])
+        else:
+            primeiro = depois['RANKING'] == 1 if usa_ranking else depois['Status'] == 'GANHANDO'
+            lideres = depois.index[linhas & primeiro]
+            if not len(lideres):
+                return {'error': f'Produto {alteracao["Produto"]} não tem oferta em 1º lugar; informe o Lojista.'}
+            alvo = depois.index.isin(lideres[:1])
+        valores = pd.Series(float(alteracao['preco']), index=depois.index[alvo])
+        if 'Fator_Caixa' in depois.columns:
+            valores = valores / depois.loc[alvo, 'Fator_Caixa']
+        depois.loc[alvo, 'Preço'] = _novos_precos(valores, em_centavos)
+        efetivas.append({**alteracao, 'preco': float(valores.iloc[0]) if len(valores) else float(alteracao['preco'])})
+
+    probabilidades = None
+    if modelo_vitoria is not None:
+        # Sobre as ofertas de antes da mudança, no mesmo preço (efetivo ou à vista) do snapshot
+        probabilidades = probabilidade_das_alteracoes(modelo_vitoria, lideres_do_snapshot(antes), efetivas)
+
+    if 'Preço_Concorrente' in depois.columns:
+        precos = depois['Preço'].where(depois['Preço'] > 0)
+        mais_barato = precos.groupby(depois['Produto'], sort=False).transform('min')
+        depois['Preço_Concorrente'] = mais_barato.fillna(0).astype(depois['Preço_Concorrente'].dtype)
+    if usa_ranking:
+        depois['RANKING'] = reconstruir_ranking(depois)
+        depois['Status'] = status_por_ranking(depois)
+        sugestoes_depois = sugestoes_por_ranking(depois, fator=0.90)
+    else:
+        sugestoes_depois = sugestoes_por_status(depois, fator=0.95)
+    if 'Fator_Caixa' in df.columns:
+        sugestoes_depois = anexar_precos_caixa(sugestoes_depois, depois['Fator_Caixa'])
+    if 'HHI_Preco' in snapshot['sugestoes'].columns:
+        sugestoes_depois = anexar_concorrencia(sugestoes_depois, metricas_concorrencia(depois))
+    if modelo_vitoria is not None:
+        sugestoes_depois = anexar_probabilidade_vitoria(sugestoes_depois, lideres_do_snapshot(depois), modelo_vitoria)
+    sugestoes_antes = _sugestoes_atuais(snapshot, produtos, indices)
+
+    # Aplica a diferença nos agregados em cache
+    colunas = [c for c in ('Preço', 'Preço_Concorrente', 'RANKING', 'Status') if c in df.columns]
+    df.loc[indices, colunas] = depois[colunas]
+    alertas = alertas_do_snapshot(snapshot)
+    delta = atualizar_cubo(snapshot['cubo'], antes, sugestoes_antes, depois, sugestoes_depois)
+    regras_reavaliadas = reavaliar_alertas(alertas, snapshot['cubo'], delta, snapshot['cubo_base'])
+
+    totais = snapshot['totais']
+    for chave, valor in totais_sugestoes(sugestoes_depois).items():
+        totais[chave] += valor
+    for chave, valor in totais_sugestoes(sugestoes_antes).items():
+        totais[chave] -= valor
+
+    status_counts = snapshot['status_counts']
+    for status, qtd in antes['Status'].value_counts().items():
+        status_counts[status] = status_counts.get(status, 0) - int(qtd)
+    for status, qtd in depois['Status'].value_counts().items():
+        status_counts[status] = status_counts.get(status, 0) + int(qtd)
+    snapshot['status_counts'] = {s: q for s, q in status_counts.items() if q}
+
+    for produto in produtos:
+        snapshot['sugestoes_alteradas'][produto] = sugestoes_depois[sugestoes_depois['Produto'] == produto]
+    snapshot['ml_insights'].update(resumo_de_totais(totais, centavos=em_centavos))
+
+    resultado = {
+        'data': formatar_sugestoes(sugestoes_depois),
+        'ml_insights': snapshot['ml_insights'],
+        'status_counts': snapshot['status_counts'],
+        'resumo_por_lojista': consultar_cubo(snapshot['cubo'], ['Lojista']),
+        'alertas': listar_alertas(snapshot['alertas']),
+        'regras_reavaliadas': regras_reavaliadas,
+    }
+    if probabilidades is not None:
+        resultado['probabilidade_vitoria'] = probabilidades
+    resultado['tempo_ms'] = round((time.perf_counter() - inicio) * 1000, 2)
+    return resultado
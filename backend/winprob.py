@@ -0,0 +1,372 @@
+"""Probabilidade de seguir em 1º lugar depois de um aumento de preço.
+
+O export não diz como a concorrência reage a um aumento; a sequência de
+uploads diz. Cada snapshot aprendido guarda a tabela de líderes: por produto,
+a oferta isolada em RANKING 1, o preço do 2º colocado, N° DE LOJAS e o spread
+de preços. Quando chega o snapshot seguinte, cada líder anterior vira um
+exemplo (quanto o preço dele mudou, quanta folga sobrou para o 2º colocado
+de antes e se ele continua em 1º) e o modelo é retreinado sobre os exemplos
+acumulados, indo para o registro como 'vitoria'.
+
+As features são relativas ao preço atual, então o mesmo bloco serve para o
+treino e para pontuar preços candidatos: a grade de preços de cada produto
+(a mesma grade percentual para todos ou uma lista por produto) vira linhas
+de um bloco só, pontuado numa chamada de predict_proba. O modelo
+(HistGradientBoostingClassifier) tem restrição monotônica: a probabilidade
+só cai com o aumento e só sobe com a folga para o 2º, então a curva de cada
+produto é coerente mesmo com pouco histórico.
+"""
+import hashlib
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from competition import metricas_concorrencia
+from engine import centavos_para_reais
+from ml import MAX_SNAPSHOTS_LEMBRADOS, impressao_digital
+from registry import DIRETORIO_DADOS, carregar_modelo, gravar_atomico, registrar_modelo, trava_arquivo
+
+NOME_MODELO_VITORIA = 'vitoria'
+
+# Aumento e folga em % do preço atual do líder; lojas e spread do produto no snapshot
+FEATURES_VITORIA = ['Aumento_Pct', 'Folga_Segundo_Pct', 'Lojas_Mercado', 'Spread_Preco_Pct']
+RESTRICOES_MONOTONICAS = [-1, 1, 0, 0]
+CLASSES_VITORIA = ['Perdeu o 1º', 'Seguiu em 1º']  # códigos 0 e 1 do alvo
+PARAMETROS_VITORIA = {'max_iter': 100, 'min_samples_leaf': 50, 'random_state': 42}
+
+# Histórico persistido (líderes do último snapshot + exemplos acumulados, os mais novos ficam)
+ARQUIVO_HISTORICO_VITORIA = os.environ.get('ANALYZER_WINPROB_HISTORY', os.path.join(DIRETORIO_DADOS, 'vitoria.joblib'))
+MAX_EXEMPLOS_VITORIA = int(os.environ.get('ANALYZER_WINPROB_MAX_ROWS', '500000'))
+MIN_EXEMPLOS_VITORIA = 100
+
+# Grade padrão dos aumentos simulados e da curva média dos insights
+AUMENTOS_PADRAO_PCT = [0, 1, 2, 3, 5, 10]
+
+
+def lideres_do_snapshot(df, concorrencia=None):
+    """Uma linha por produto com líder isolado em RANKING 1 e um 2º colocado; preços em reais.
+
+    Colunas: Produto, Lojista, Preço, Preço_Segundo, Lojas_Mercado e
+    Spread_Preco_Pct (de metricas_concorrencia, que pode vir pronta da
+    análise). Empate em 1º fica de fora, como na otimização da carteira.
+    """
+    if 'RANKING' not in df.columns or not len(df):
+        return pd.DataFrame(columns=['Produto', 'Lojista', 'Preço', 'Preço_Segundo', *FEATURES_VITORIA[2:]])
+    ranking = pd.to_numeric(df['RANKING'], errors='coerce')
+    precos = centavos_para_reais(df['Preço']).astype('float64')
+    produto = df['Produto']
+
+    segundo = precos[ranking == 2].groupby(produto[ranking == 2], sort=False).min()
+    lideres_por_produto = (ranking == 1).groupby(produto, sort=False).sum()
+    lider = (ranking == 1) & produto.map(lideres_por_produto).eq(1) & produto.isin(segundo.index) & (precos > 0)
+
+    if concorrencia is None:
+        concorrencia = metricas_concorrencia(df)
+    nomes = produto[lider].to_numpy()
+    metricas = concorrencia.reindex(nomes)
+    return pd.DataFrame({
+        'Produto': nomes,
+        'Lojista': df.loc[lider, 'Lojista'].to_numpy(),
+        'Preço': precos[lider].to_numpy(),
+        'Preço_Segundo': segundo.reindex(nomes).to_numpy(dtype='float64'),
+        'Lojas_Mercado': metricas['Lojas_Mercado'].to_numpy(dtype='float64'),
+        'Spread_Preco_Pct': metricas['Spread_Preco_Pct'].to_numpy(dtype='float64'),
+    })
+
+
+def fatores_caixa_dos_lideres(df, lideres):
+    """Fator_Caixa (à vista / efetivo) da oferta de cada líder, alinhado a ``lideres``; None sem parcelamento."""
+    if 'Fator_Caixa' not in df.columns:
+        return None
+    em_primeiro = df[pd.to_numeric(df['RANKING'], errors='coerce') == 1]
+    fatores = em_primeiro.drop_duplicates('Produto').set_index('Produto')['Fator_Caixa']
+    return fatores.reindex(lideres['Produto']).fillna(1.0).to_numpy(dtype='float64')
+
+
+def ofertas_do_snapshot(df):
+    """Cópia enxuta (Produto, Lojista, preço em reais, RANKING) para rotular os líderes do snapshot anterior."""
+    if 'RANKING' not in df.columns:
+        return pd.DataFrame(columns=['Produto', 'Lojista', 'Preço_Depois', 'RANKING_Depois'])
+    return pd.DataFrame({
+        'Produto': df['Produto'].to_numpy(),
+        'Lojista': df['Lojista'].to_numpy(),
+        'Preço_Depois': centavos_para_reais(df['Preço']).to_numpy(dtype='float64'),
+        'RANKING_Depois': pd.to_numeric(df['RANKING'], errors='coerce').to_numpy(dtype='float64'),
+    })
+
+
+def _bloco_vitoria(lideres, posicao, precos):
+    """Bloco (n, 4) das features: linha i = preço candidato ``precos[i]`` do líder ``posicao[i]``."""
+    atual = lideres['Preço'].to_numpy(dtype='float64')[posicao]
+    X = np.empty((len(posicao), len(FEATURES_VITORIA)), dtype='float64')
+    np.divide((precos - atual) * 100, atual, out=X[:, 0])
+    np.divide((lideres['Preço_Segundo'].to_numpy(dtype='float64')[posicao] - precos) * 100, atual, out=X[:, 1])
+    X[:, 2] = lideres['Lojas_Mercado'].to_numpy(dtype='float64')[posicao]
+    X[:, 3] = lideres['Spread_Preco_Pct'].to_numpy(dtype='float64')[posicao]
+    return X
+
+
+def exemplos_vitoria(anteriores, ofertas):
+    """(X, y) dos líderes de ``anteriores`` vistos de novo em ``ofertas``: y = 1 se seguem em 1º."""
+    # Mesmo lojista com mais de uma oferta no produto: vale a mais bem colocada
+    atuais = ofertas.sort_values('RANKING_Depois', kind='stable').drop_duplicates(['Produto', 'Lojista'])
+    pares = anteriores.merge(atuais, on=['Produto', 'Lojista'], how='inner')
+    pares = pares[pares['Preço_Depois'] > 0]
+    X = _bloco_vitoria(pares, np.arange(len(pares)), pares['Preço_Depois'].to_numpy(dtype='float64'))
+    return X.astype(np.float32), (pares['RANKING_Depois'] == 1).to_numpy(dtype=np.int8)
+
+
+def _pontuar(modelo, X):
+    if not len(X):
+        return np.empty(0)
+    return modelo.predict_proba(X)[:, list(modelo.classes_).index(1)]
+
+
+def probabilidade_vitoria(modelo, lideres, posicao, precos):
+    """P(seguir em 1º) de cada preço candidato ``precos[i]`` do líder ``posicao[i]``, numa chamada só."""
+    return _pontuar(modelo, _bloco_vitoria(lideres, np.asarray(posicao), np.asarray(precos, dtype='float64')))
+
+
+def grade_aumentos(lideres, aumentos_pct):
+    """(posicao, precos) da mesma grade de aumentos percentuais para todos os líderes."""
+    aumentos = np.asarray(aumentos_pct, dtype='float64')
+    posicao = np.repeat(np.arange(len(lideres)), len(aumentos))
+    precos = lideres['Preço'].to_numpy(dtype='float64')[posicao] * (1 + np.tile(aumentos, len(lideres)) / 100)
+    return posicao, np.round(precos, 2)
+
+
+def grade_precos(lideres, precos_por_produto):
+    """(posicao, precos) de uma lista de preços candidatos por produto ({Produto: [preços]})."""
+    posicoes = pd.Index(lideres['Produto']).get_indexer(list(precos_por_produto))
+    tamanhos = [len(p) for p in precos_por_produto.values()]
+    posicao = np.repeat(posicoes, tamanhos)
+    precos = np.fromiter((p for lista in precos_por_produto.values() for p in lista), dtype='float64',
+                         count=sum(tamanhos))
+    return posicao, precos
+
+
+def anexar_probabilidade_vitoria(sugestoes, lideres, modelo):
+    """Acrescenta Probabilidade_Vitoria do Preço_Sugerido em cada sugestão do líder isolado (None nas demais)."""
+    if not len(sugestoes) or 'Preço_Sugerido' not in sugestoes.columns:
+        return sugestoes
+    posicoes = pd.Index(lideres['Produto']).get_indexer(sugestoes['Produto'])
+    validas = posicoes >= 0
+    validas[validas] = lideres['Lojista'].to_numpy()[posicoes[validas]] == sugestoes['Lojista'].to_numpy()[validas]
+    sugeridos = centavos_para_reais(sugestoes['Preço_Sugerido']).to_numpy(dtype='float64')
+    probabilidade = np.full(len(sugestoes), None, dtype=object)
+    probabilidade[validas] = probabilidade_vitoria(modelo, lideres, posicoes[validas], sugeridos[validas]).round(4)
+    return sugestoes.assign(Probabilidade_Vitoria=probabilidade)
+
+
+def probabilidade_das_alteracoes(modelo, lideres, alteracoes):
+    """P(seguir em 1º) de cada alteração do what-if que mexe no preço do líder isolado do produto.
+
+    ``alteracoes`` é a lista de {'Produto', 'preco'[, 'Lojista']} do what-if
+    (preço em reais); sem Lojista a alteração vale para o líder. As demais
+    (outro lojista, produto sem líder isolado ou sem 2º) ficam de fora.
+    """
+    if not alteracoes or not len(lideres):
+        return []
+    tabela = pd.DataFrame({
+        'Produto': [a['Produto'] for a in alteracoes],
+        'Lojista': [a.get('Lojista') for a in alteracoes],
+        'Preço_Novo': [float(a['preco']) for a in alteracoes],
+    })
+    posicoes = pd.Index(lideres['Produto']).get_indexer(tabela['Produto'])
+    lojista_lider = np.where(posicoes >= 0, lideres['Lojista'].to_numpy()[posicoes], None)
+    validas = (posicoes >= 0) & (tabela['Lojista'].isna().to_numpy() | (tabela['Lojista'].to_numpy() == lojista_lider))
+    tabela = tabela[validas].assign(Lojista=lojista_lider[validas])
+    tabela.insert(2, 'Preço_Atual', lideres['Preço'].to_numpy()[posicoes[validas]])
+    tabela.insert(3, 'Preço_Segundo', lideres['Preço_Segundo'].to_numpy()[posicoes[validas]])
+    tabela['Probabilidade_Vitoria'] = probabilidade_vitoria(
+        modelo, lideres, posicoes[validas], tabela['Preço_Novo'].to_numpy()).round(4)
+    return tabela.to_dict(orient='records')
+
+
+def simular_grade(lideres, modelo, aumentos_pct=None, precos=None, probabilidade_minima=None, fatores_caixa=None):
+    """Probabilidades de uma grade de preços candidatos por produto e, opcionalmente, o maior preço seguro.
+
+    ``precos`` ({Produto: [preços em reais]}) tem prioridade sobre
+    ``aumentos_pct`` (padrão: AUMENTOS_PADRAO_PCT). Com
+    ``probabilidade_minima`` cada produto recebe o maior preço da grade que
+    ainda segura o 1º lugar com essa probabilidade.
+
+    Com ``fatores_caixa`` (snapshot com preco=efetivo, ver
+    fatores_caixa_dos_lideres) os ``precos`` chegam à vista, como no what-if,
+    e são pontuados pelo efetivo do mesmo parcelamento; a grade ganha
+    Preço_Caixa_Atual e Preço_Candidato_Caixa.
+    """
+    inicio = time.perf_counter()
+    if precos:
+        desconhecidos = sorted(str(p) for p in set(precos) - set(lideres['Produto']))
+        if desconhecidos:
+            return {'error': f'Produtos sem líder isolado e 2º colocado no snapshot: {desconhecidos}'}
+        posicao, candidatos = grade_precos(lideres, precos)
+        if fatores_caixa is not None:
+            candidatos_caixa = candidatos
+            candidatos = np.round(candidatos / fatores_caixa[posicao], 2)
+    else:
+        posicao, candidatos = grade_aumentos(lideres, AUMENTOS_PADRAO_PCT if aumentos_pct is None else aumentos_pct)
+        if fatores_caixa is not None:
+            candidatos_caixa = np.round(candidatos * fatores_caixa[posicao], 2)
+    X = _bloco_vitoria(lideres, posicao, candidatos)
+    probabilidade = _pontuar(modelo, X)
+
+    grade = pd.DataFrame({
+        'Produto': lideres['Produto'].to_numpy()[posicao],
+        'Lojista': lideres['Lojista'].to_numpy()[posicao],
+        'Preço_Atual': lideres['Preço'].to_numpy()[posicao],
+        'Preço_Segundo': lideres['Preço_Segundo'].to_numpy()[posicao],
+        'Preço_Candidato': candidatos,
+        'Aumento_Pct': X[:, 0].round(2),
+        'Folga_Segundo_Pct': X[:, 1].round(2),
+        'Probabilidade_Vitoria': probabilidade.round(4),
+    })
+    colunas_seguros = ['Produto', 'Lojista', 'Preço_Atual', 'Preço_Candidato', 'Aumento_Pct', 'Probabilidade_Vitoria']
+    if fatores_caixa is not None:
+        grade.insert(3, 'Preço_Caixa_Atual', np.round(grade['Preço_Atual'].to_numpy() * fatores_caixa[posicao], 2))
+        grade.insert(6, 'Preço_Candidato_Caixa', candidatos_caixa)
+        colunas_seguros[4:4] = ['Preço_Caixa_Atual', 'Preço_Candidato_Caixa']
+    resultado = {'grade': grade.to_dict(orient='records')}
+    if probabilidade_minima is not None:
+        seguros = grade[grade['Probabilidade_Vitoria'] >= probabilidade_minima]
+        melhores = seguros.loc[seguros.groupby('Produto', sort=False)['Preço_Candidato'].idxmax()]
+        resultado['precos_seguros'] = melhores[colunas_seguros].to_dict(orient='records')
+    resultado['resumo'] = {
+        'produtos': int(len(np.unique(posicao))),
+        'precos_avaliados': int(len(posicao)),
+        'probabilidade_minima': probabilidade_minima,
+        'tempo_ms': round((time.perf_counter() - inicio) * 1000, 2),
+    }
+    return resultado
+
+
+def esquema_vitoria():
+    """Esquema das features do modelo de vitória, guardado nos metadados do registro."""
+    return {
+        'features': FEATURES_VITORIA,
+        'dtype': 'float64',
+        'unidade_monetaria': 'reais',
+        'restricoes_monotonicas': RESTRICOES_MONOTONICAS,
+        'alvo': 'segue em RANKING 1 no snapshot seguinte',
+    }
+
+
+def carregar_modelo_vitoria(versao=None):
+    """(modelo, metadados) da versão pedida do registro ou None (sem versão ou com outras features)."""
+    carregado = carregar_modelo(NOME_MODELO_VITORIA, versao)
+    if carregado is None or carregado[1].get('esquema_features', {}).get('features') != FEATURES_VITORIA:
+        return None
+    return carregado
+
+
+def _carregar_historico(arquivo):
+    try:
+        import joblib
+        return joblib.load(arquivo)
+    except (OSError, EOFError, ValueError, KeyError):
+        return None
+
+
+def _curva_media(modelo, lideres):
+    """Probabilidade média dos líderes atuais em cada aumento de AUMENTOS_PADRAO_PCT."""
+    if modelo is None or not len(lideres):
+        return None
+    probabilidade = probabilidade_vitoria(modelo, lideres, *grade_aumentos(lideres, AUMENTOS_PADRAO_PCT))
+    medias = probabilidade.reshape(len(lideres), -1).mean(axis=0)
+    return [{'aumento_pct': a, 'probabilidade_media': round(float(m), 4)} for a, m in zip(AUMENTOS_PADRAO_PCT, medias)]
+
+
+def chave_ofertas(ofertas):
+    """sha1 (16 hex, como o snapshot_id) do conteúdo das ofertas, para quem não tem o do upload."""
+    valores = pd.util.hash_pandas_object(ofertas, index=False).to_numpy()
+    return hashlib.sha1(np.ascontiguousarray(valores)).hexdigest()[:16]
+
+
+def atualizar_modelo_vitoria(lideres, ofertas, snapshot_id=None, recebido_em=None, arquivo=ARQUIVO_HISTORICO_VITORIA,
+                             max_exemplos=MAX_EXEMPLOS_VITORIA, registrar=True):
+    """Aprende um snapshot: rotula os líderes do anterior, retreina e guarda os líderes deste.
+
+    ``lideres`` vem de lideres_do_snapshot e ``ofertas`` de
+    ofertas_do_snapshot, ambos deste snapshot. Os exemplos novos são
+    avaliados pelo modelo anterior antes do retreino (dados que ele ainda não
+    viu). Com ``registrar`` cada modelo retreinado vira uma versão 'vitoria'.
+
+    ``snapshot_id`` (o sha1 do upload; sem ele, o das ofertas) evita aprender
+    o mesmo snapshot duas vezes. ``recebido_em`` (time.time() da chegada do
+    upload) recusa um snapshot mais antigo que o último aprendido, que
+    rotularia os líderes de trás para frente.
+    """
+    inicio = time.perf_counter()
+    snapshot_id = snapshot_id or chave_ofertas(ofertas)
+    with trava_arquivo(arquivo):
+        estado = _carregar_historico(arquivo) or {
+            'lideres': None, 'snapshots': [], 'modelo': None,
+            'X': np.empty((0, len(FEATURES_VITORIA)), dtype=np.float32), 'y': np.empty(0, dtype=np.int8),
+        }
+        if snapshot_id in estado['snapshots']:
+            return {'status': 'Snapshot já aprendido pelo modelo de vitória.', 'exemplos_novos': 0,
+                    'exemplos_acumulados': int(len(estado['y']))}
+        if recebido_em is not None and recebido_em < estado.get('recebido_em', float('-inf')):
+            return {'status': 'Snapshot anterior ao último aprendido pelo modelo de vitória; ignorado.',
+                    'exemplos_novos': 0, 'exemplos_acumulados': int(len(estado['y']))}
+
+        X_novo, y_novo = (exemplos_vitoria(estado['lideres'], ofertas) if estado['lideres'] is not None
+                          else (np.empty((0, len(FEATURES_VITORIA)), dtype=np.float32), np.empty(0, dtype=np.int8)))
+        metricas = {'exemplos_novos': int(len(y_novo))}
+        if len(y_novo):
+            metricas['taxa_seguiu_em_1_novos'] = round(float(y_novo.mean()), 4)
+            if estado['modelo'] is not None:
+                previsto = _pontuar(estado['modelo'], X_novo)
+                metricas['brier_antes_da_atualizacao'] = round(float(np.mean((previsto - y_novo) ** 2)), 4)
+                metricas['acuracia_antes_da_atualizacao'] = round(float(np.mean((previsto >= 0.5) == y_novo)), 4)
+
+        estado['X'] = np.concatenate([estado['X'], X_novo])[-max_exemplos:]
+        estado['y'] = np.concatenate([estado['y'], y_novo])[-max_exemplos:]
+        estado['lideres'] = lideres
+        estado['snapshots'] = (estado['snapshots'] + [snapshot_id])[-MAX_SNAPSHOTS_LEMBRADOS:]
+        if recebido_em is not None:
+            estado['recebido_em'] = recebido_em
+        metricas['exemplos_acumulados'] = int(len(estado['y']))
+
+        X, y = estado['X'], estado['y']
+        insights = {}
+        if not len(y_novo):
+            insights['status'] = ('Líderes guardados; o modelo de vitória aprende quando o próximo snapshot '
+                                  'mostrar quem seguiu em 1º.')
+        elif len(y) < MIN_EXEMPLOS_VITORIA or len(np.unique(y)) < 2:
+            insights['status'] = (f'Histórico insuficiente para o modelo de vitória (mínimo de '
+                                  f'{MIN_EXEMPLOS_VITORIA} exemplos, com líderes que seguiram e que perderam o 1º).')
+        else:
+            from sklearn.ensemble import HistGradientBoostingClassifier
+            parametros = {**PARAMETROS_VITORIA, 'monotonic_cst': RESTRICOES_MONOTONICAS}
+            inicio_treino = time.perf_counter()
+            modelo = HistGradientBoostingClassifier(**parametros)
+            modelo.fit(X, y)
+            estado['modelo'] = modelo
+            metricas['tempo_treino_ms'] = round((time.perf_counter() - inicio_treino) * 1000, 2)
+            insights['status'] = 'Modelo de vitória retreinado com sucesso!'
+            if registrar:
+                import sklearn
+                registro = registrar_modelo(NOME_MODELO_VITORIA, modelo, {
+                    'esquema_features': esquema_vitoria(),
+                    'classes': CLASSES_VITORIA,
+                    'snapshot_id': snapshot_id,
+                    'impressao_digital': impressao_digital(X, y, CLASSES_VITORIA, parametros),
+                    'parametros': parametros,
+                    'metricas': metricas,
+                    'sklearn': sklearn.__version__,
+                })
+                insights['modelo_versao'] = registro['versao']
+        gravar_atomico(arquivo, estado)
+
+    return {
+        **insights,
+        'features_usadas': FEATURES_VITORIA,
+        'snapshots_aprendidos': len(estado['snapshots']),
+        'metricas': metricas,
+        'probabilidade_media_por_aumento': _curva_media(estado['modelo'], lideres),
+        'tempo_atualizacao_ms': round((time.perf_counter() - inicio) * 1000, 2),
+    }